@@ -2,8 +2,36 @@
 import streamlit as st
 import pandas as pd
 from db import get_conn, init_db
+import masters
+import profiling
+import writer
 
 init_db()
+profiling.begin_run(__file__)
+
+
+def save_party(party_name, address, mobile, gst_no, marka,
+               default_rate_per_kg, default_rate_per_parcel):
+    # runs on the writer thread (writer.py)
+    with get_conn() as conn:
+        # an upsert, not INSERT OR REPLACE: REPLACE deletes the old row
+        # without firing the search index's delete trigger
+        conn.execute("""
+            INSERT INTO party_master
+            (party_name, address, mobile, gst_no, marka,
+             default_rate_per_kg, default_rate_per_parcel)
+            VALUES (?,?,?,?,?,?,?)
+            ON CONFLICT(party_name) DO UPDATE SET
+                address = excluded.address,
+                mobile = excluded.mobile,
+                gst_no = excluded.gst_no,
+                marka = excluded.marka,
+                default_rate_per_kg = excluded.default_rate_per_kg,
+                default_rate_per_parcel = excluded.default_rate_per_parcel
+        """, (party_name, address, mobile, gst_no, marka,
+              default_rate_per_kg, default_rate_per_parcel))
+
+
 st.title("👥 Party Master (Party Register)")
 
 st.info("यहाँ से Party add/update करें। नीचे simple form है।")
@@ -22,27 +50,16 @@ with st.form("party_form"):
         if not party_name.strip():
             st.error("Party Name ज़रूरी है।")
         else:
-            conn = get_conn()
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT OR REPLACE INTO party_master
-                (id, party_name, address, mobile, gst_no, marka,
-                 default_rate_per_kg, default_rate_per_parcel)
-                VALUES (
-                    COALESCE((SELECT id FROM party_master WHERE party_name = ?), NULL),
-                    ?,?,?,?,?,?,?
-                )
-            """, (party_name, party_name, address, mobile, gst_no, marka,
-                  default_rate_per_kg, default_rate_per_parcel))
-            conn.commit()
-            conn.close()
+            writer.call(save_party, party_name, address, mobile, gst_no, marka,
+                        default_rate_per_kg, default_rate_per_parcel)
+            masters.invalidate("party")
             st.success("Party saved successfully ✅")
 
 st.markdown("---")
 st.subheader("📋 Party List")
 
-conn = get_conn()
-df = pd.read_sql_query("SELECT party_name, mobile, gst_no, marka, default_rate_per_kg, default_rate_per_parcel FROM party_master ORDER BY party_name", conn)
-conn.close()
+df = pd.DataFrame(masters.parties().parties, columns=masters.Party._fields)[[
+    "party_name", "mobile", "gst_no", "marka", "default_rate_per_kg", "default_rate_per_parcel"
+]]
 
 st.dataframe(df, use_container_width=True)
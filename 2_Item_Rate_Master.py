@@ -1,9 +1,32 @@
 # pages/2_Item_Rate_Master.py
 import streamlit as st
 import pandas as pd
-from db import get_conn, get_party_list, init_db
+from db import get_conn, init_db
+import masters
+import profiling
+import writer
 
 init_db()
+profiling.begin_run(__file__)
+
+
+# both run on the writer thread (writer.py)
+def save_item(item_name, desc):
+    with get_conn() as conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO item_master (item_name, description)
+            VALUES (?, ?)
+        """, (item_name, desc))
+
+
+def save_rate(party_id, from_city, to_city, rate_type, rate):
+    with get_conn() as conn:
+        conn.execute("""
+            INSERT INTO rate_master (party_id, from_city, to_city, rate_type, rate)
+            VALUES (?, ?, ?, ?, ?)
+        """, (party_id, from_city, to_city, rate_type, rate))
+
+
 st.title("📦 Item & Rate Master")
 
 tab1, tab2 = st.tabs(["Item Master", "Rate Master"])
@@ -18,27 +41,18 @@ with tab1:
             if not item_name.strip():
                 st.error("Item Name required.")
             else:
-                conn = get_conn()
-                cur = conn.cursor()
-                cur.execute("""
-                    INSERT OR IGNORE INTO item_master (item_name, description)
-                    VALUES (?, ?)
-                """, (item_name, desc))
-                conn.commit()
-                conn.close()
+                writer.call(save_item, item_name, desc)
+                masters.invalidate("item")
                 st.success("Item saved ✅")
 
-    conn = get_conn()
-    df_items = pd.read_sql_query("SELECT item_name, description FROM item_master ORDER BY item_name", conn)
-    conn.close()
+    df_items = pd.DataFrame(masters.items(), columns=["item_name", "description"])
     st.dataframe(df_items, use_container_width=True)
 
 with tab2:
     st.subheader("Rate Master (Party + Route Wise)")
 
-    parties = get_party_list()
-    party_map = {p[1]: p[0] for p in parties}
-    party_name = st.selectbox("Party (optional, blank = general)", [""] + list(party_map.keys()))
+    parties = masters.parties()
+    party_name = st.selectbox("Party (optional, blank = general)", [""] + parties.names)
     from_city = st.text_input("From City (e.g., DELHI)")
     to_city = st.text_input("To City (e.g., MUMBAI)")
     rate_type = st.selectbox("Rate Type", ["KG", "PARCEL"])
@@ -48,29 +62,18 @@ with tab2:
         if not from_city.strip() or not to_city.strip():
             st.error("From और To दोनों ज़रूरी हैं।")
         else:
-            conn = get_conn()
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO rate_master (party_id, from_city, to_city, rate_type, rate)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                party_map.get(party_name) if party_name else None,
+            writer.call(
+                save_rate,
+                parties.id_of(party_name) if party_name else None,
                 from_city.upper().strip(),
                 to_city.upper().strip(),
                 rate_type,
                 rate_val
-            ))
-            conn.commit()
-            conn.close()
+            )
+            masters.invalidate("rate")
             st.success("Rate saved ✅")
 
-    conn = get_conn()
-    df_rates = pd.read_sql_query("""
-        SELECT
-          COALESCE((SELECT party_name FROM party_master p WHERE p.id = r.party_id), 'ALL') AS party,
-          from_city, to_city, rate_type, rate
-        FROM rate_master r
-        ORDER BY party, from_city, to_city
-    """, conn)
-    conn.close()
+    df_rates = pd.DataFrame(masters.rates(), columns=masters.Rate._fields)[[
+        "party", "from_city", "to_city", "rate_type", "rate"
+    ]]
     st.dataframe(df_rates, use_container_width=True)
@@ -1,90 +1,36 @@
 import streamlit as st
-import sqlite3
 from datetime import datetime
 import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-
-# ============================================================
-# DATABASE CONNECTION
-# ============================================================
-def get_conn():
-    return sqlite3.connect("tms.db", check_same_thread=False)
-
-conn = get_conn()
-cur = conn.cursor()
-
-# Create Token Table if not exists
-cur.execute("""
-CREATE TABLE IF NOT EXISTS tokens(
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    datetime TEXT,
-    party_id INTEGER,
-    party_name TEXT,
-    marka TEXT,
-    from_city TEXT,
-    to_city TEXT,
-    weight REAL,
-    rate REAL,
-    amount REAL,
-    packages INTEGER,
-    driver_mobile TEXT,
-    status TEXT DEFAULT 'PENDING'
-)
-""")
-conn.commit()
+import os
+from db import get_conn, init_db, transaction, allocate_numbers
+import masters
+import documents
+from rates import rate_index, amount_for, RATE_TYPES
+from importer import import_tokens, REQUIRED, OPTIONAL, INSERT_TOKEN_SQL
+import profiling
+import writer
+
+# schema is created / migrated once per process
+init_db()
+profiling.begin_run(__file__)
 
 # ============================================================
 # FETCH PARTY LIST
 # ============================================================
 def get_parties():
     try:
-        cur.execute("SELECT id, party_name, marka FROM party_master ORDER BY party_name")
-        return cur.fetchall()
+        return masters.parties()
     except:
         st.error("❌ party_master table missing or incorrect structure.")
         return []
 
-# ============================================================
-# PDF GENERATOR
-# ============================================================
-def generate_token_pdf(token):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(180, 800, "TOKEN / BILTY")
-
-    c.setFont("Helvetica", 12)
-    y = 770
-
-    lines = [
-        f"Token No: {token['id']}",
-        f"Date/Time: {token['datetime']}",
-        f"Party: {token['party_name']}",
-        f"Marka: {token['marka']}",
-        f"From: {token['from_city']}",
-        f"To: {token['to_city']}",
-        f"Weight (KG): {token['weight']}",
-        f"Rate: {token['rate']}",
-        f"Amount: {token['amount']}",
-        f"Packages: {token['packages']}",
-        f"Driver Mobile: {token['driver_mobile']}"
-    ]
-
-    for line in lines:
-        c.drawString(50, y, line)
-        y -= 25
-
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(200, y - 20, "Thank You")
-
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-
-    filename = f"TOKEN_{token['id']}.pdf"
-    return buffer, filename
+
+def save_token(values):
+    """Runs on the writer thread: numbers and inserts one token -> (token_no, id)."""
+    with get_conn() as conn, transaction(conn):
+        token_no = allocate_numbers(conn, "token")
+        cur = conn.execute(INSERT_TOKEN_SQL, (token_no, *values))
+        return token_no, cur.lastrowid
 
 # ============================================================
 # PAGE UI
@@ -94,12 +40,87 @@ st.info("यहाँ से आप आसानी से Token (Bilty) बन
 
 # Fetch party list
 parties = get_parties()
-party_names = [p[1] for p in parties] if parties else []
+party_names = parties.names if parties else []
 
 if not parties:
     st.error("❌ No parties found in Party Master. Please add parties first.")
     st.stop()
 
+# ============================================================
+# BULK IMPORT (branch booking sheets)
+# ============================================================
+with st.expander("📤 Bulk Import: branch की booking sheet (CSV / Excel) upload करें"):
+    st.caption(f"ज़रूरी columns: {', '.join(REQUIRED)} · optional: {', '.join(OPTIONAL)}. "
+               "Rate खाली हो तो Rate Master से लगेगा।")
+    sheet = st.file_uploader("Booking sheet", type=["csv", "xlsx"])
+    if sheet is not None and st.button("📥 Import Tokens"):
+        errors = io.StringIO()
+        status = st.empty()
+        try:
+            report = import_tokens(sheet, filename=sheet.name, errors=errors,
+                                   progress=lambda n: status.caption(f"{n} rows पढ़ी गईं..."))
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+        status.empty()
+        st.success(
+            f"✅ {report['imported']} tokens imported "
+            f"(No. {report['first_token_no']} - {report['last_token_no']}) in "
+            f"{report['seconds']}s ({report['rows_per_second']} rows/s)"
+        )
+        if report["rejected"]:
+            st.warning(f"⚠️ {report['rejected']} rows rejected")
+            st.download_button("📥 Download Error Rows", errors.getvalue(),
+                               file_name=f"ERRORS_{sheet.name.rsplit('.', 1)[0]}.csv",
+                               mime="text/csv")
+
+# ============================================================
+# BATCH PRINT (shift end)
+# ============================================================
+with st.expander("🖨️ Batch Print: कई bilties एक PDF में"):
+    by = st.radio("Print by", ["Token No. range", "Challan No."], horizontal=True)
+    if by == "Challan No.":
+        batch = {"challan_no": st.number_input("Challan No.", min_value=1, step=1)}
+        name = f"BILTIES_CHALLAN_{batch['challan_no']}.pdf"
+    else:
+        b1, b2 = st.columns(2)
+        first_no = b1.number_input("From Token No.", min_value=1, step=1)
+        last_no = b2.number_input("To Token No.", min_value=1, step=1, value=first_no + 99)
+        batch = {"first_no": first_no, "last_no": last_no}
+        name = f"BILTIES_{first_no}_{last_no}.pdf"
+    if st.button("🖨️ Make Batch PDF"):
+        os.makedirs(documents.DOC_DIR, exist_ok=True)
+        path = os.path.join(documents.DOC_DIR, name)
+        with st.spinner("Bilties बन रही हैं..."):
+            pages = documents.bilty_batch(path, documents.batch_tokens(**batch))
+        if not pages:
+            st.warning("इस range / challan में कोई token नहीं मिला।")
+        else:
+            st.success(f"✅ {pages} bilties")
+            st.download_button("📥 Download Batch PDF", documents.read(path),
+                               file_name=name, mime="application/pdf")
+
+# ============================================================
+# PARTY + ROUTE (outside the form so the rate fills in instantly)
+# ============================================================
+rates = rate_index()
+cities = sorted({"DELHI", "MUMBAI"} | rates.cities)
+
+col1, col2 = st.columns(2)
+with col1:
+    party_name = st.selectbox("Party Name", party_names)
+    rate_type = st.selectbox("Rate Type", RATE_TYPES)
+with col2:
+    from_city = st.selectbox("From City", cities)
+    to_city = st.selectbox("To City", cities)
+
+party = parties.by_name[party_name]
+auto_rate, rate_source = rates.resolve(party.id, from_city, to_city, rate_type)
+if rate_source:
+    st.caption(f"Rate Master से rate: ₹ {auto_rate} / {rate_type} ({rate_source})")
+else:
+    st.caption("इस route का कोई rate नहीं मिला - rate हाथ से डालें।")
+
 # ============================================================
 # FORM STARTS
 # ============================================================
@@ -108,24 +129,19 @@ with st.form("token_form"):
     col1, col2 = st.columns(2)
 
     with col1:
-        party_name = st.selectbox("Party Name", party_names)
         weight = st.number_input("Weight (KG)", 0.0)
-        rate = st.number_input("Rate per KG", 0.0)
+        rate = st.number_input(f"Rate per {rate_type}", min_value=0.0,
+                               value=float(auto_rate or 0.0),
+                               key=f"rate_{party.id}_{from_city}_{to_city}_{rate_type}")
         packages = st.number_input("Packages", 1, step=1)
 
     with col2:
-        from_city = st.selectbox("From City", ["DELHI", "MUMBAI"])
-        to_city = st.selectbox("To City", ["DELHI", "MUMBAI"])
         driver_mobile = st.text_input("Driver Mobile (Optional)")
 
     # Autofill Marka
-    marka = ""
-    for p in parties:
-        if p[1] == party_name:
-            marka = p[2] if p[2] else ""
-            break
+    marka = party.marka or ""
 
-    st.text_input("Marka / Sign", value=marka, key="marka_input")
+    st.text_input("Marka / Sign", value=marka, key=f"marka_input_{party.id}")
 
     # Button inside form
     submitted = st.form_submit_button("➕ Generate Token")
@@ -135,26 +151,22 @@ with st.form("token_form"):
 # ============================================================
 if submitted:
 
-    amount = weight * rate
-    timestamp = datetime.now().strftime("%d-%m-%Y %I:%M %p")
-
-    # INSERT TOKEN INTO DB
-    cur.execute("""
-        INSERT INTO tokens(datetime, party_id, party_name, marka, from_city, to_city,
-                           weight, rate, amount, packages, driver_mobile)
-        VALUES (?,?,?,?,?,?,?,?,?,?,?)
-    """, (
-        timestamp,
-        next(p[0] for p in parties if p[1] == party_name),
+    amount = amount_for(rate_type, rate, weight, packages)
+    now = datetime.now()
+    timestamp = now.strftime("%d-%m-%Y %I:%M %p")
+
+    # INSERT TOKEN INTO DB (token no. is allocated in the same transaction,
+    # on the shared writer thread)
+    token_no, token_id = writer.call(save_token, (
+        timestamp, now.strftime("%Y-%m-%d %H:%M"),
+        party.id,
         party_name, marka, from_city, to_city,
-        weight, rate, amount, packages, driver_mobile
+        weight, rate, rate_type, amount, packages, driver_mobile
     ))
-    conn.commit()
-
-    token_id = cur.lastrowid
 
     token_data = {
         "id": token_id,
+        "token_no": token_no,
         "datetime": timestamp,
         "party_name": party_name,
         "marka": marka,
@@ -162,21 +174,22 @@ if submitted:
         "to_city": to_city,
         "weight": weight,
         "rate": rate,
+        "rate_type": rate_type,
         "amount": amount,
         "packages": packages,
         "driver_mobile": driver_mobile
     }
 
-    st.success(f"✅ Token Created Successfully! Token No: {token_id}")
+    st.success(f"✅ Token Created Successfully! Token No: {token_no}")
 
-    # Generate PDF
-    pdf_buffer, filename = generate_token_pdf(token_data)
+    # Rendered in the document worker pool (and cached for reprints)
+    pdf_bytes = documents.render("token", token_no, token_data)
 
     # Download button (OUTSIDE FORM)
     st.download_button(
         label="📥 Download Token PDF",
-        data=pdf_buffer,
-        file_name=filename,
+        data=pdf_bytes,
+        file_name=f"TOKEN_{token_no}.pdf",
         mime="application/pdf",
         width="stretch"
     )
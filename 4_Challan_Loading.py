@@ -3,65 +3,120 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from db import get_conn, get_next_challan_no, init_db
-from utils.pdf_utils import challan_pdf
+from db import (get_next_challan_no, init_db, iso_range, parse_date, create_challan,
+                TokensNotPending, pending_tokens_page, PENDING_COLUMNS)
+import masters
+import documents
+import profiling
+import writer
 
 # Initialise DB (tables already exist as per your schema)
 init_db()
+profiling.begin_run(__file__)
 
 st.title("🚛 Challan / Loading")
 st.info("Truck में माल load करते समय यहाँ से Challan बनाओ। Pending tokens select करके एक challan बनता है।")
 
-# --------------------- FETCH PENDING TOKENS --------------------- #
-
-conn = get_conn()
-
-df_pending = pd.read_sql_query("""
-    SELECT 
-        t.id AS token_no,
-        t.datetime,
-        p.party_name,
-        t.weight,
-        t.amount,
-        t.from_city,
-        t.to_city
-    FROM tokens t
-    LEFT JOIN party_master p ON p.id = t.party_id
-    WHERE t.status = 'PENDING'
-    ORDER BY t.datetime
-""", conn)
-
-conn.close()
-
-if df_pending.empty:
-    st.warning("अभी कोई pending token नहीं है (सब load हो गए हैं या अभी token बनाए नहीं हैं)।")
-    st.stop()
-
-# --------------------- TOKEN SELECTION TABLE --------------------- #
+# --------------------- FILTERS --------------------- #
 
 st.subheader("Select Tokens for Challan (Loading)")
-st.caption("नीचे list में से वही tokens चुनो जो एक ही truck में जा रहे हैं।")
+st.caption("Route / party / date से list छोटी करो, फिर वही tokens चुनो जो एक ही truck में जा रहे हैं।")
+
+parties = masters.parties()
+
+f1, f2, f3 = st.columns(3)
+with f1:
+    f_from = st.text_input("From City", key="pick_from").strip().upper()
+    f_party = st.selectbox("Party", ["All"] + parties.names, key="pick_party")
+with f2:
+    f_to = st.text_input("To City", key="pick_to").strip().upper()
+    f_marka = st.text_input("Marka", key="pick_marka").strip()
+with f3:
+    f_start = st.date_input("From Date", value=None, key="pick_start")
+    f_end = st.date_input("To Date", value=None, key="pick_end")
+
+filters = {
+    "from_city": f_from,
+    "to_city": f_to,
+    "party_id": parties.id_of(f_party),
+    "marka": f_marka,
+    "start": f_start.isoformat() if f_start else None,
+    "end": iso_range(f_end, f_end)[1] if f_end else None,
+}
+
+# selection survives page changes and filter changes: {token id: row}
+selected = st.session_state.setdefault("challan_selected", {})
+pick = st.session_state.get("challan_pick")
+if not pick or pick["filters"] != filters:
+    # "gen" names a fresh editor whenever the rows under it change
+    gen = pick["gen"] + 1 if pick else 0
+    pick = st.session_state["challan_pick"] = {"filters": filters, "cursors": [None], "gen": gen}
+
+# --------------------- ONE PAGE OF PENDING TOKENS --------------------- #
+
+page_no = len(pick["cursors"]) - 1
+rows, next_cursor = pending_tokens_page(filters, pick["cursors"][-1])
+
+if not rows and not selected:
+    st.warning("अभी कोई pending token नहीं है (या filter से कुछ नहीं मिला)।")
+    st.stop()
 
-# Add a selection column
-df_pending["select"] = False
+# token ids stay out of sight; the clerk sees the bilty numbers
+shown = PENDING_COLUMNS[1:]
+page_df = pd.DataFrame(rows, columns=PENDING_COLUMNS)[shown]
+page_df.insert(0, "select", [r["id"] in selected for r in rows])
 
-# Use new Streamlit API: width='stretch' (no use_container_width warning)
-selected = st.data_editor(
-    df_pending,
+edited = st.data_editor(
+    page_df,
     width="stretch",
     num_rows="fixed",
     hide_index=True,
+    disabled=shown,
+    key=f"pick_{pick['gen']}",
 )
 
-# User-selected token_nos
-selected_token_nos = selected[selected["select"]]["token_no"].tolist()
-
-if not selected_token_nos:
+# fold this page's ticks into the selection
+for row, ticked in zip(rows, edited["select"].tolist()):
+    if ticked:
+        selected[row["id"]] = row
+    else:
+        selected.pop(row["id"], None)
+
+nav1, nav2, nav3, nav4 = st.columns([1, 1, 1, 3])
+with nav1:
+    if st.button("⬅️ Prev", disabled=page_no == 0):
+        pick["cursors"].pop()
+        pick["gen"] += 1
+        st.rerun()
+with nav2:
+    if st.button("Next ➡️", disabled=next_cursor is None):
+        pick["cursors"].append(next_cursor)
+        pick["gen"] += 1
+        st.rerun()
+with nav3:
+    if st.button("✖️ Clear", disabled=not selected):
+        selected.clear()
+        pick["gen"] += 1
+        st.rerun()
+with nav4:
+    st.caption(f"Page {page_no + 1} · {len(rows)} tokens on this page")
+
+# running totals from the selection itself - no query
+m1, m2, m3, m4 = st.columns(4)
+m1.metric("Selected Tokens", len(selected))
+m2.metric("Weight (KG)", f"{sum(r['weight'] for r in selected.values()):,.1f}")
+m3.metric("Packages", f"{sum(r['packages'] for r in selected.values()):,}")
+m4.metric("Amount", f"₹ {sum(r['amount'] for r in selected.values()):,.2f}")
+
+# User-selected token ids
+selected_ids = sorted(selected)
+
+if not selected_ids:
     st.info("कम से कम 1 token select करो।")
     st.stop()
 
 # Pre-fill from/to using first selected row
-first_row = selected[selected["select"]].iloc[0]
+first_row = selected[selected_ids[0]]
 from_city_auto = first_row["from_city"]
 to_city_auto = first_row["to_city"]
 
@@ -71,8 +126,8 @@ st.markdown("---")
 
 st.subheader("Challan Details")
 
-challan_no = get_next_challan_no()
-st.text_input("Challan No (Auto)", value=str(challan_no), disabled=True)
+# preview only - the real number is allocated when the challan is saved
+st.text_input("Challan No (Auto)", value=str(get_next_challan_no()), disabled=True)
 
 today_str = datetime.now().strftime("%d/%m/%Y")
 date_str = st.text_input("Challan Date", value=today_str)
@@ -98,96 +153,35 @@ other_exp = st.number_input("Other Expenses", min_value=0.0, step=100.0, value=0
 # --------------------- CREATE CHALLAN & PDF --------------------- #
 
 if st.button("✅ Create Challan & Download PDF", type="primary"):
-    conn = get_conn()
-    cur = conn.cursor()
-
-    # Totals from selected tokens
-    q_marks = ",".join("?" * len(selected_token_nos))
-
-    cur.execute(
-        f"SELECT SUM(amount), SUM(weight) FROM tokens WHERE id IN ({q_marks})",
-        selected_token_nos
-    )
-    tot_amt, tot_wt = cur.fetchone()
-    tot_amt = tot_amt or 0.0
-    tot_wt = tot_wt or 0.0
-
-    total_hamali = loading_hamali + unloading_hamali
-    balance = tot_amt - hire - total_hamali - other_exp
-
-    # Insert challan master
-    cur.execute("""
-        INSERT INTO challan (
-            challan_no, date, from_city, to_city,
-            truck_no, driver_name, driver_mobile,
-            hire, loading_hamali, unloading_hamali,
-            other_exp, balance
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        challan_no, date_str, from_city, to_city,
-        truck_no, driver_name, driver_mobile,
-        hire, loading_hamali, unloading_hamali,
-        other_exp, balance
-    ))
-    challan_id = cur.lastrowid
-
-    # Link each token -> challan + mark token as LOADED
-    for tid in selected_token_nos:
-        cur.execute(
-            "INSERT INTO challan_tokens (challan_id, token_id) VALUES (?, ?)",
-            (challan_id, tid)
-        )
-        cur.execute(
-            "UPDATE tokens SET status='LOADED' WHERE id=?",
-            (tid,)
-        )
-
-    # Get data for PDF rows (token_no, weight, amount, party_name)
-    cur.execute(f"""
-        SELECT 
-            t.id AS token_no,
-            t.weight,
-            t.amount,
-            p.party_name
-        FROM tokens t
-        LEFT JOIN party_master p ON p.id = t.party_id
-        WHERE t.id IN ({q_marks})
-    """, selected_token_nos)
-
-    rows_db = cur.fetchall()
-    conn.commit()
-    conn.close()
-
-    # Prepare rows in the format challan_pdf expects
-    rows = []
-    for r in rows_db:
-        rows.append(
-            {
-                "token_no": r[0],
-                "weight": r[1] or 0,
-                "amount": r[2] or 0,
-                "party_name": r[3] or "",
-            }
-        )
-
-    challan_data = {
-        "challan_no": challan_no,
-        "date": date_str,
-        "from_city": from_city,
-        "to_city": to_city,
-        "truck_no": truck_no,
-        "driver_name": driver_name,
-        "driver_mobile": driver_mobile,
-        "hire": hire,
-        "loading_hamali": loading_hamali,
-        "unloading_hamali": unloading_hamali,
-        "other_exp": other_exp,
-        "balance": balance,
-    }
-
-    # Generate PDF with your existing layout function
-    pdf_buf = challan_pdf(challan_data, rows)
+    if parse_date(date_str) is None:
+        st.error("Challan Date DD/MM/YYYY format में डालें।")
+        st.stop()
+    try:
+        challan_data, rows = writer.call(create_challan, selected_ids, {
+            "date": date_str,
+            "from_city": from_city,
+            "to_city": to_city,
+            "truck_no": truck_no,
+            "driver_name": driver_name,
+            "driver_mobile": driver_mobile,
+            "hire": hire,
+            "loading_hamali": loading_hamali,
+            "unloading_hamali": unloading_hamali,
+            "other_exp": other_exp,
+        })
+    except TokensNotPending as e:
+        # they are no longer pending, so no page would show them to untick
+        taken = [selected.pop(i)["token_no"] if i in selected else i for i in e.token_ids]
+        pick["gen"] += 1
+        st.error(f"❌ ये tokens किसी और ने पहले ही load कर दिए, selection से हटा दिए: {taken}. "
+                 "बाकी tokens के साथ दोबारा Create करो।")
+        st.stop()
+    challan_no = challan_data["challan_no"]
+    selected.clear()
+    pick["gen"] += 1
+
+    # Generate PDF with your existing layout function (document worker pool)
+    pdf_buf = documents.render("challan", challan_no, challan_data, rows)
 
     st.success(f"✅ Challan {challan_no} तैयार हो गया!")
 
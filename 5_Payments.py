@@ -2,19 +2,33 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from db import get_conn, get_party_list, compute_party_balance, init_db
+from db import get_conn, compute_party_balance, init_db, parse_date, RECENT_PAYMENTS_SQL
+import masters
+import profiling
+import writer
 
 init_db()
+profiling.begin_run(__file__)
+
+
+def save_payment(party_id, date_str, date_iso, amount, mode, remark):
+    # runs on the writer thread (writer.py)
+    with get_conn() as conn:
+        conn.execute("""
+            INSERT INTO payments (party_id, date, date_iso, amount, mode, remark)
+            VALUES (?,?,?,?,?,?)
+        """, (party_id, date_str, date_iso, amount, mode, remark))
+
+
 st.title("💰 Payment Entry (Cash / Bank)")
 
-parties = get_party_list()
+parties = masters.parties()
 if not parties:
     st.warning("पहले Party Master में Party बनाओ।")
     st.stop()
 
-party_map = {p[1]: p[0] for p in parties}
-party_name = st.selectbox("Party चुनें", list(party_map.keys()))
-party_id = party_map[party_name]
+party_name = st.selectbox("Party चुनें", parties.names)
+party_id = parties.id_of(party_name)
 
 current_bal = compute_party_balance(party_id)
 st.info(f"Approx Current Balance (Approx): ₹ {current_bal:.2f}")
@@ -27,25 +41,16 @@ with st.form("payment_form"):
     submitted = st.form_submit_button("💾 Save Payment")
 
     if submitted:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO payments (party_id, date, amount, mode, remark)
-            VALUES (?,?,?,?,?)
-        """, (party_id, date_str, amount, mode, remark))
-        conn.commit()
-        conn.close()
-        st.success("Payment saved ✅")
+        date_iso = parse_date(date_str)
+        if date_iso is None:
+            st.error("Date DD/MM/YYYY format में डालें।")
+        else:
+            writer.call(save_payment, party_id, date_str, date_iso, amount, mode, remark)
+            st.success("Payment saved ✅")
 
 st.markdown("---")
 st.subheader("Recent Payments")
 
-conn = get_conn()
-df = pd.read_sql_query("""
-    SELECT date, amount, mode, remark
-    FROM payments
-    WHERE party_id=?
-    ORDER BY id DESC LIMIT 50
-""", conn, params=(party_id,))
-conn.close()
+with get_conn() as conn:
+    df = pd.read_sql_query(RECENT_PAYMENTS_SQL, conn, params=(party_id,))
 st.dataframe(df, use_container_width=True)
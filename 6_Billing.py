@@ -3,11 +3,16 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
-from db import get_conn, init_db
-from utils.pdf_utils import bill_pdf
-import io
+from db import get_read_conn, init_db, iso_range, BILL_TOKENS_SQL
+import documents
+from reporting import bill_frame, bill_totals, records, BILL_COLUMNS
+from billing import run_billing, render_saved_bills, BILL_DIR
+import masters
+import exports
+import profiling
 
 init_db()
+profiling.begin_run(__file__)
 
 st.title("🧾 Billing (Party-wise)")
 st.info("किसी party के लिए date range चुनकर Bill बना सकते हैं।")
@@ -15,19 +20,14 @@ st.info("किसी party के लिए date range चुनकर Bill ब
 # -------------------------
 #  LOAD PARTIES
 # -------------------------
-conn = get_conn()
-cur = conn.cursor()
-cur.execute("SELECT id, party_name FROM party_master ORDER BY party_name")
-parties = cur.fetchall()
-conn.close()
+parties = masters.parties()
 
 if not parties:
     st.error("❌ No parties found. Add parties first.")
     st.stop()
 
-party_map = {p[1]: p[0] for p in parties}
-party_name = st.selectbox("Select Party", list(party_map.keys()))
-party_id = party_map[party_name]
+party_name = st.selectbox("Select Party", parties.names)
+party_id = parties.id_of(party_name)
 
 # -------------------------
 #   DATE RANGE + OLD BAL
@@ -39,6 +39,7 @@ with col2:
     end_dt = st.date_input("To Date", date.today())
 
 old_balance = st.number_input("Old Balance (₹)", value=0.0, step=100.0)
+export_fmt = st.radio("Export format", list(exports.FORMATS), horizontal=True)
 
 if start_dt > end_dt:
     st.error("❌ From Date cannot be greater than To Date.")
@@ -46,41 +47,52 @@ if start_dt > end_dt:
 
 
 # -------------------------
-#     SHOW BILL BUTTON
+#   MONTH-END RUN (ALL PARTIES)
 # -------------------------
-if st.button("🔍 Show Bill", type="primary"):
-
-    conn = get_conn()
-    df = pd.read_sql_query("""
-        SELECT 
-            t.id AS token_no,
-            t.datetime,
-            t.weight,
-            t.packages,
-            t.amount,
-            t.from_city,
-            t.to_city
-        FROM tokens t
-        WHERE t.party_id = ?
-          AND t.status IN ('PENDING', 'LOADED')
-        ORDER BY t.datetime
-    """, conn, params=(party_id,))
-    conn.close()
+with st.expander("🗂️ Month-end: सभी parties का Bill एक साथ बनाओ"):
+    st.caption(f"इस date range के सारे unbilled tokens bill होंगे; PDFs '{BILL_DIR}/' folder में बनेंगी।")
+    gst_percent = st.number_input("GST %", min_value=0.0, step=1.0, value=0.0)
+    if st.button("🧾 Bill All Parties"):
+        with st.spinner("Bills बन रहे हैं..."):
+            report = run_billing(start_dt, end_dt, gst_percent=gst_percent)
+        if not report["bills"]:
+            st.warning("इस date range में कोई unbilled token नहीं है।")
+        else:
+            st.success(
+                f"✅ {report['bills']} bills / {report['tokens']} tokens in "
+                f"{report['total_seconds']}s ({report['bills_per_second']} bills/s)"
+            )
+            st.dataframe(pd.DataFrame(report["parties"]), width="stretch")
+        if report["failed"]:
+            st.error("❌ इन bills की PDF नहीं बनी (bills save हो गए हैं): "
+                     + ", ".join(map(str, report["failed"])))
+
+    redo = st.text_input("PDF दोबारा बनाओ - Bill No. (comma से अलग)", key="bill_redo")
+    if st.button("🔁 Render PDFs Again") and redo.strip():
+        try:
+            bill_nos = [int(n) for n in redo.replace(",", " ").split()]
+        except ValueError:
+            st.error("❌ Bill No. सिर्फ़ numbers होने चाहिए।")
+        else:
+            report = render_saved_bills(bill_nos)
+            if not report["bills"]:
+                st.warning("ये bills नहीं मिले।")
+            elif report["failed"]:
+                st.error("❌ PDF फिर से नहीं बनी: " + ", ".join(map(str, report["failed"])))
+            else:
+                st.success(f"✅ {report['bills']} PDFs '{BILL_DIR}/' में बन गईं।")
+            st.dataframe(pd.DataFrame(report["parties"]), width="stretch")
 
-    if df.empty:
-        st.warning("No records for this party.")
-        st.stop()
 
-    # -------------------------
-    #  PARSE DATE
-    # -------------------------
-    df["dt"] = pd.to_datetime(df["datetime"], format="%d-%m-%Y %I:%M %p", errors="coerce")
-    df = df[df["dt"].notna()].copy()
-    df["d"] = df["dt"].dt.date
+# -------------------------
+#     SHOW BILL BUTTON
+# -------------------------
+if st.button("🔍 Show Bill", type="primary"):
 
-    # filter range
-    mask = (df["d"] >= start_dt) & (df["d"] <= end_dt)
-    df = df[mask]
+    with get_read_conn() as conn:
+        # date range is filtered and ordered by SQLite on datetime_iso
+        df = pd.read_sql_query(BILL_TOKENS_SQL, conn,
+                               params=(party_id, *iso_range(start_dt, end_dt)))
 
     if df.empty:
         st.warning("No records in this date range.")
@@ -89,51 +101,35 @@ if st.button("🔍 Show Bill", type="primary"):
     # -------------------------
     #  SHOW TABLE ON SCREEN
     # -------------------------
-    df_show = df[[
-        "token_no", "datetime", "from_city", "to_city",
-        "weight", "packages", "amount"
-    ]]
+    df_show = bill_frame(df)
 
     st.dataframe(df_show, width="stretch")
 
-    total_weight = df["weight"].sum()
-    total_pack = df["packages"].sum()
-    total_amt = df["amount"].sum()
+    totals = bill_totals(df_show)
 
     st.subheader("📌 Totals")
-    st.write(f"**Total Weight:** {total_weight}")
-    st.write(f"**Total Packages:** {total_pack}")
-    st.write(f"**Total Amount:** ₹{total_amt}")
+    st.write(f"**Total Weight:** {totals['total_weight']}")
+    st.write(f"**Total Packages:** {totals['total_pkgs']}")
+    st.write(f"**Total Amount:** ₹{totals['total_amount']}")
 
     # -------------------------
     #  PREPARE PDF DATA
     # -------------------------
-    rows = []
-    for _, r in df.iterrows():
-        rows.append({
-            "token_no": r["token_no"],
-            "datetime": r["datetime"],
-            "from_city": r["from_city"],
-            "to_city": r["to_city"],
-            "weight": r["weight"],
-            "packages": r["packages"],
-            "amount": r["amount"],
-        })
+    rows = records(df_show)
 
     header = {
         "party_name": party_name,
         "from_date": start_dt.strftime("%d-%m-%Y"),
         "to_date": end_dt.strftime("%d-%m-%Y"),
-        "total_weight": total_weight,
-        "total_pkgs": total_pack,
-        "total_amount": total_amt,
+        **totals,
         "old_balance": old_balance,
     }
 
     # -------------------------
     #   PDF GENERATION
     # -------------------------
-    pdf_buf = bill_pdf(header, rows)
+    # served from the document cache while the tokens are unchanged
+    pdf_buf = documents.render("bill", f"{party_id}_{start_dt}_{end_dt}", header, rows)
 
     st.download_button(
         "⬇️ Download Bill PDF",
@@ -144,16 +140,15 @@ if st.button("🔍 Show Bill", type="primary"):
     )
 
     # -------------------------
-    #   EXCEL EXPORT
+    #   EXCEL / CSV EXPORT
     # -------------------------
-    excel_buf = io.BytesIO()
-    df_show.to_excel(excel_buf, index=False, engine="openpyxl")
-    excel_buf.seek(0)
+    path, _ = exports.export(BILL_COLUMNS, exports.frame_rows(df_show, BILL_COLUMNS),
+                             export_fmt, prefix="bill_")
 
     st.download_button(
-        "⬇️ Download Excel",
-        data=excel_buf,
-        file_name=f"BILL_{party_name.replace(' ', '_')}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "⬇️ Download Excel / CSV",
+        data=exports.take(path),
+        file_name=exports.file_name(f"BILL_{party_name.replace(' ', '_')}", export_fmt),
+        mime=exports.mime(export_fmt),
         use_container_width=True
     )
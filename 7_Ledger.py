@@ -3,29 +3,25 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
-from db import get_conn, init_db
-from utils.pdf_utils import ledger_pdf
-import io
+from db import init_db, ledger_page, ledger_summary, iter_ledger, LEDGER_COLUMNS
+import masters
+import documents
+import exports
+import profiling
 
 init_db()
+profiling.begin_run(__file__)
 
 st.title("📚 Party Ledger")
 
-conn = get_conn()
-cur = conn.cursor()
-cur.execute("SELECT id, party_name FROM party_master ORDER BY party_name")
-parties = cur.fetchall()
-conn.close()
+parties = masters.parties()
 
 if not parties:
     st.error("❌ Add Party first.")
     st.stop()
 
-party_map = {p[1]: p[0] for p in parties}
-party_name = st.selectbox("Select Party", list(party_map.keys()))
-party_id = party_map[party_name]
-
-opening_balance = st.number_input("Opening Balance (₹)", value=0.0, step=100.0)
+party_name = st.selectbox("Select Party", parties.names)
+party_id = parties.id_of(party_name)
 
 col1, col2 = st.columns(2)
 with col1:
@@ -38,109 +34,100 @@ if start_dt > end_dt:
     st.stop()
 
 if st.button("📄 Show Ledger", type="primary"):
-    conn = get_conn()
-
-    tokens = pd.read_sql_query("""
-        SELECT 
-            t.datetime,
-            t.id AS token_no,
-            t.amount
-        FROM tokens t
-        WHERE t.party_id = ?
-        ORDER BY t.datetime
-    """, conn, params=(party_id,))
-
-    payments = pd.read_sql_query("""
-        SELECT date, amount, mode, remark
-        FROM payments
-        WHERE party_id = ?
-        ORDER BY date
-    """, conn, params=(party_id,))
-
-    conn.close()
-
-    rows = []
-
-    # Token parsing
-    if not tokens.empty:
-        tokens["dt"] = pd.to_datetime(tokens["datetime"], format="%d-%m-%Y %I:%M %p", errors="coerce")
-        tokens = tokens[tokens["dt"].notna()]
-        tokens["d"] = tokens["dt"].dt.date
-        tokens = tokens[(tokens["d"] >= start_dt) & (tokens["d"] <= end_dt)]
-        for _, r in tokens.iterrows():
-            rows.append({
-                "date": r["d"].strftime("%d-%m-%Y"),
-                "type": "TOKEN",
-                "details": f"Token #{r['token_no']}",
-                "debit": r["amount"],
-                "credit": 0,
-            })
-
-    # Payment parsing
-    if not payments.empty:
-        payments["dt"] = pd.to_datetime(payments["date"], errors="coerce", dayfirst=True)
-        payments = payments[payments["dt"].notna()]
-        payments["d"] = payments["dt"].dt.date
-        payments = payments[(payments["d"] >= start_dt) & (payments["d"] <= end_dt)]
-        for _, r in payments.iterrows():
-            desc = f"Payment ({r['mode']})"
-            if r["remark"]:
-                desc += f" - {r['remark']}"
-            rows.append({
-                "date": r["d"].strftime("%d-%m-%Y"),
-                "type": "PAYMENT",
-                "details": desc,
-                "debit": 0,
-                "credit": r["amount"],
-            })
-
-    if not rows:
-        st.warning("No transactions.")
-        st.stop()
-
-    ledger_df = pd.DataFrame(rows)
-    ledger_df["date_sort"] = pd.to_datetime(ledger_df["date"], dayfirst=True)
-    ledger_df.sort_values("date_sort", inplace=True)
-
-    balance = opening_balance
-    balances = []
-    for _, r in ledger_df.iterrows():
-        balance += r["debit"] - r["credit"]
-        balances.append(balance)
-
-    ledger_df["balance"] = balances
-    ledger_df.drop(columns=["date_sort"], inplace=True)
-
-    st.dataframe(ledger_df, width="stretch")
+    # opening balance comes from everything before From Date
+    st.session_state["ledger"] = {
+        "key": (party_id, start_dt, end_dt),
+        "summary": ledger_summary(party_id, start_dt, end_dt),
+        "cursors": [None],          # cursor of every page seen so far
+    }
+
+led = st.session_state.get("ledger")
+if not led or led["key"] != (party_id, start_dt, end_dt):
+    st.stop()
+
+summary = led["summary"]
+if summary["entries"] == 0:
+    st.warning("No transactions.")
+    st.stop()
+
+m1, m2, m3, m4 = st.columns(4)
+m1.metric("Opening Balance", f"₹ {summary['opening']:.2f}")
+m2.metric("Debit", f"₹ {summary['debit']:.2f}")
+m3.metric("Credit", f"₹ {summary['credit']:.2f}")
+m4.metric("Closing Balance", f"₹ {summary['closing']:.2f}")
+
+# -------------------------
+#   ONE PAGE AT A TIME
+# -------------------------
+page_no = len(led["cursors"]) - 1
+rows, next_cursor = ledger_page(party_id, start_dt, end_dt, led["cursors"][-1])
+
+st.dataframe(pd.DataFrame(rows, columns=LEDGER_COLUMNS), width="stretch")
+
+nav1, nav2, nav3 = st.columns([1, 1, 4])
+with nav1:
+    if st.button("⬅️ Prev", disabled=page_no == 0):
+        led["cursors"].pop()
+        st.rerun()
+with nav2:
+    if st.button("Next ➡️", disabled=next_cursor is None):
+        led["cursors"].append(next_cursor)
+        st.rerun()
+with nav3:
+    st.caption(f"Page {page_no + 1} · {summary['entries']} entries")
+
+# -------------------------
+#   DOWNLOADS (FULL RANGE)
+# -------------------------
+export_fmt = st.radio("Export format", list(exports.FORMATS), horizontal=True)
+
+if st.button("📥 Prepare PDF / Excel"):
+    # Excel / CSV, streamed page by page from the ledger query into a temp file
+    path, _ = exports.export(LEDGER_COLUMNS,
+                             exports.dict_rows(iter_ledger(party_id, start_dt, end_dt),
+                                               LEDGER_COLUMNS),
+                             export_fmt, prefix="ledger_")
 
     # PDF
     header = {
         "party_name": party_name,
         "from_date": start_dt.strftime("%d-%m-%Y"),
         "to_date": end_dt.strftime("%d-%m-%Y"),
-        "opening_balance": opening_balance,
-        "closing_balance": float(balance)
+        "opening_balance": summary["opening"],
+        "closing_balance": float(summary["closing"])
     }
 
-    pdf_buf = ledger_pdf(header, ledger_df.to_dict(orient="records"))
+    # rendered in the document worker pool; the page stays usable meanwhile.
+    # The PDF table (and its cache hash) needs the rows as one list.
+    led["pdf"] = documents.request("ledger", f"{party_id}_{start_dt}_{end_dt}", header,
+                                   [r for page in iter_ledger(party_id, start_dt, end_dt)
+                                    for r in page])
 
     st.download_button(
-        "⬇️ Download Ledger PDF",
-        data=pdf_buf,
-        file_name=f"Ledger_{party_name.replace(' ','_')}.pdf",
-        mime="application/pdf",
+        "⬇️ Download Excel / CSV",
+        data=exports.take(path),
+        file_name=exports.file_name(f"Ledger_{party_name.replace(' ','_')}", export_fmt),
+        mime=exports.mime(export_fmt),
         use_container_width=True
     )
 
-    # Excel
-    excel_buf = io.BytesIO()
-    ledger_df.to_excel(excel_buf, index=False, engine="openpyxl")
-    excel_buf.seek(0)
-
-    st.download_button(
-        "⬇️ Download Excel",
-        data=excel_buf,
-        file_name=f"Ledger_{party_name.replace(' ','_')}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        use_container_width=True
-    )
+pdf_job = led.get("pdf")
+if pdf_job is not None and pdf_job.done():
+    try:
+        pdf_bytes = documents.read(pdf_job.result())
+    except FileNotFoundError:       # pruned from the cache meanwhile
+        led.pop("pdf")
+        pdf_job = None
+        st.info("Ledger PDF पुराना हो गया - दोबारा Prepare करें।")
+if pdf_job is not None:
+    if pdf_job.done():
+        st.download_button(
+            "⬇️ Download Ledger PDF",
+            data=pdf_bytes,
+            file_name=f"Ledger_{party_name.replace(' ','_')}.pdf",
+            mime="application/pdf",
+            use_container_width=True
+        )
+    else:
+        st.info("⏳ Ledger PDF बन रहा है - थोड़ी देर में Refresh करें।")
+        st.button("🔄 Refresh")
@@ -3,46 +3,44 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
-from db import get_conn, init_db
-import io
+from db import (get_read_conn, init_db, iso_range, archived_years, attach_archives, daily_booking_sql,
+                OUTSTANDING_SQL)
+from reporting import format_dates
+import exports
+import profiling
 
 init_db()
+profiling.begin_run(__file__)
 
 st.title("📊 Reports")
 
-conn = get_conn()
+# prepared exports by tab: {"key": inputs it was made for, "path": temp file}
+prepared = st.session_state.setdefault("report_exports", {})
+
+
+def download_button(name, key, make, label, file_name, fmt):
+    """
+    Writes the export only when "Prepare download" is pressed and keeps its
+    path until the inputs in `key` change, so reruns do not re-run the query.
+    """
+    held = prepared.get(name)
+    if held is not None and held["key"] != key:
+        exports.discard(prepared.pop(name)["path"])
+        held = None
+    if st.button("📥 Prepare download", key=f"{name}_prepare"):
+        if held is not None:
+            exports.discard(held["path"])
+        path, _ = make()
+        held = prepared[name] = {"key": key, "path": path}
+    if held is None:
+        return
+    try:
+        data = exports.read(held["path"])
+    except FileNotFoundError:       # temp dir cleaned meanwhile; prepare again
+        prepared.pop(name)
+        return
+    st.download_button(label, data=data, file_name=file_name, mime=exports.mime(fmt))
 
-tokens = pd.read_sql_query("""
-    SELECT 
-        t.id AS token_no,
-        t.datetime,
-        t.party_name,
-        t.weight,
-        t.packages,
-        t.amount
-    FROM tokens t
-""", conn)
-
-payments = pd.read_sql_query("""
-    SELECT party_id, date, amount
-    FROM payments
-""", conn)
-
-parties = pd.read_sql_query("""
-    SELECT id, party_name
-    FROM party_master
-""", conn)
-
-conn.close()
-
-if not tokens.empty:
-    tokens["dt"] = pd.to_datetime(tokens["datetime"], format="%d-%m-%Y %I:%M %p", errors="coerce")
-    tokens = tokens[tokens["dt"].notna()]
-    tokens["d"] = tokens["dt"].dt.date
-
-if not payments.empty:
-    payments["dt"] = pd.to_datetime(payments["date"], errors="coerce", dayfirst=True)
-    payments = payments[payments["dt"].notna()]
 
 tab1, tab2 = st.tabs(["📅 Daily Booking", "💰 Outstanding"])
 
@@ -59,54 +57,61 @@ with tab1:
     if start_dt > end_dt:
         st.error("Invalid date range.")
     else:
-        if tokens.empty:
-            st.warning("No booking data.")
+        # only the requested days of the daily_booking_summary rollup are read,
+        # plus the archived rollups of closed years the range reaches into
+        params = iso_range(start_dt, end_dt)
+        years = archived_years(*params)
+        with get_read_conn() as conn:
+            booking_sql = daily_booking_sql(attach_archives(conn, years))
+            grp = pd.read_sql_query(booking_sql, conn, params=params)
+
+        if grp.empty:
+            st.warning("No records in range.")
         else:
-            df = tokens[(tokens["d"] >= start_dt) & (tokens["d"] <= end_dt)]
-            if df.empty:
-                st.warning("No records in range.")
-            else:
-                grp = df.groupby("d").agg(
-                    tokens=("token_no", "count"),
-                    weight=("weight", "sum"),
-                    amount=("amount", "sum")
-                ).reset_index()
-
-                grp["d"] = grp["d"].apply(lambda x: x.strftime("%d-%m-%Y"))
-
-                st.dataframe(
-                    grp.rename(columns={
-                        "d": "Date",
-                        "tokens": "Tokens",
-                        "weight": "Total Weight",
-                        "amount": "Total Amount"
-                    }),
-                    width="stretch"
-                )
+            grp["d"] = format_dates(grp["d"])
+
+            st.dataframe(
+                grp.rename(columns={
+                    "d": "Date",
+                    "tokens": "Tokens",
+                    "weight": "Total Weight",
+                    "packages": "Total Packages",
+                    "amount": "Total Amount"
+                }),
+                width="stretch"
+            )
+
+            fmt = st.radio("Export format", list(exports.FORMATS), horizontal=True,
+                           key="booking_fmt")
+            download_button(
+                "booking", (start_dt, end_dt, fmt),
+                lambda: exports.export_query(booking_sql, params,
+                                             ["Date", "Tokens", "Total Weight", "Total Packages",
+                                              "Total Amount"], fmt, prefix="booking_",
+                                             archives=years),
+                "⬇️ Download Daily Booking",
+                exports.file_name(f"Daily_Booking_{start_dt}_{end_dt}", fmt), fmt,
+            )
 
 # ============ TAB 2 ============
 with tab2:
     st.subheader("💰 Outstanding by Party")
 
-    if tokens.empty and payments.empty:
+    # one row per party from the trigger-maintained party_balance table
+    with get_read_conn() as conn:
+        out_df = pd.read_sql_query(OUTSTANDING_SQL, conn, index_col="party_name")
+
+    if out_df.empty:
         st.warning("Not enough data.")
     else:
-        tok_sum = (
-            tokens.groupby("party_name")["amount"].sum()
-            if not tokens.empty else pd.Series()
-        )
+        st.dataframe(out_df, width="stretch")
 
-        pay_sum = (
-            payments.merge(parties, left_on="party_id", right_on="id")
-            .groupby("party_name")["amount"].sum()
-            if not payments.empty else pd.Series()
+        fmt = st.radio("Export format", list(exports.FORMATS), horizontal=True,
+                       key="outstanding_fmt")
+        download_button(
+            "outstanding", (fmt,),
+            lambda: exports.export_query(OUTSTANDING_SQL, (),
+                                         [out_df.index.name, *out_df.columns], fmt,
+                                         prefix="outstanding_"),
+            "⬇️ Download Outstanding", exports.file_name("Outstanding", fmt), fmt,
         )
-
-        out_df = pd.DataFrame({
-            "Total Billing": tok_sum,
-            "Payments": pay_sum
-        }).fillna(0)
-
-        out_df["Outstanding"] = out_df["Total Billing"] - out_df["Payments"]
-
-        st.dataframe(out_df, width="stretch")
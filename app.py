@@ -1,6 +1,10 @@
 # app.py
 import streamlit as st
-from db import init_db, compute_party_balance, get_party_list
+import pandas as pd
+from db import init_db
+import masters
+import profiling
+import search
 
 st.set_page_config(
     page_title="Transport Management Software",
@@ -11,6 +15,14 @@ st.set_page_config(
 # Init DB at startup
 init_db()
 
+# Hidden diagnostics page: app.py?diagnostics=1
+if st.query_params.get("diagnostics"):
+    import diagnostics
+    diagnostics.show()
+    st.stop()
+
+profiling.begin_run(__file__)
+
 # Simple CSS
 st.markdown("""
 <style>
@@ -39,6 +51,36 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# -------------------------
+#   GLOBAL SEARCH
+# -------------------------
+SEARCH_TABS = {"party": "👥 Parties", "token": "📄 Tokens", "challan": "🚛 Challans"}
+
+query = st.text_input("🔎 Search", placeholder="Party, marka, truck no., driver, mobile, GST ...",
+                      help="हर शब्द की शुरुआत से match होता है: 'rj14 ga', 'राम', '98290'")
+if query.strip():
+    pages = st.session_state.setdefault("search_pages", {})
+    if pages.get("query") != query:
+        pages.clear()
+        pages["query"] = query
+    for tab, kind in zip(st.tabs(list(SEARCH_TABS.values())), SEARCH_TABS):
+        with tab:
+            page = pages.get(kind, 0)
+            hits = search.search(query, kind, page=page)
+            if hits["rows"]:
+                st.dataframe(pd.DataFrame(hits["rows"]).drop(columns="id"),
+                             width="stretch", hide_index=True)
+            else:
+                st.caption("कुछ नहीं मिला।")
+            c1, c2, c3 = st.columns([1, 1, 4])
+            if c1.button("◀ Prev", key=f"search_prev_{kind}", disabled=page == 0):
+                pages[kind] = page - 1
+                st.rerun()
+            if c2.button("Next ▶", key=f"search_next_{kind}", disabled=not hits["more"]):
+                pages[kind] = page + 1
+                st.rerun()
+            c3.caption(f"Page {page + 1} · {hits['ms']} ms")
+
 st.markdown("### 👋 Welcome")
 
 st.write("""
@@ -54,7 +96,7 @@ st.write("""
 - **Reports** → Daily report, outstanding, आदि  
 """)
 
-parties = get_party_list()
+parties = masters.parties()
 if parties:
     col1, col2, col3 = st.columns(3)
     with col1:
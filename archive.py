@@ -0,0 +1,213 @@
+# archive.py
+# Financial-year close: moves a closed year's tokens, payments, challans,
+# challan_tokens, bills and its daily_booking_summary rows out of the live
+# database into  archive/<db name>_<fy>.db.
+#
+#   python manage.py close-year 2024-25 [--dry-run] [--allow-unbilled] [--vacuum]
+#
+# Years are closed oldest first.  Each party's lifetime totals up to the
+# end of the year go into opening_balances (as_of = 1 April of the next
+# year), so party_balance, bills and ledgers keep their balances; the
+# ledger and the daily booking report attach an archive only when the
+# requested dates reach into its year (db.attach_archives).
+#
+# The rows are first copied into a temp file which is then renamed into
+# place; only after that are they deleted from the live database, in one
+# transaction that re-checks the counts.  A close interrupted half way
+# leaves the live data untouched and can simply be run again.
+import json
+import os
+import re
+import time
+from datetime import date, datetime
+
+import db
+
+# (table, rows of the year) in copy / delete order
+ARCHIVED_TABLES = [
+    ("challan_tokens", "challan_id IN (SELECT id FROM main.challan "
+                       "WHERE date_iso >= :start AND date_iso < :end)"),
+    ("challan", "date_iso >= :start AND date_iso < :end"),
+    ("tokens", "datetime_iso >= :start AND datetime_iso < :end"),
+    ("payments", "date_iso >= :start AND date_iso < :end"),
+    ("bills", "created_iso >= :start AND created_iso < :end"),
+    ("daily_booking_summary", "day >= :start AND day < :end"),
+]
+
+# what the ledger / report / bilty lookups need inside an archive
+ARCHIVE_INDEXES = [
+    ("tokens", ("party_id", "datetime_iso")),
+    ("tokens", ("token_no",)),
+    ("payments", ("party_id", "date_iso")),
+    ("challan", ("challan_no",)),
+    ("challan_tokens", ("challan_id",)),
+    ("daily_booking_summary", ("day",)),
+]
+
+# tables that must hold nothing older than the year being closed
+DATED_TABLES = {"tokens": "datetime_iso", "payments": "date_iso",
+                "challan": "date_iso", "bills": "created_iso"}
+
+# lifetime totals per party up to :end - everything before the year is
+# already carried by the latest opening_balances rows
+CLOSING_TOTALS_SQL = """
+    SELECT party_id, SUM(tok), SUM(paid)
+    FROM (
+        SELECT party_id, token_total AS tok, paid_total AS paid FROM opening_balances
+        WHERE as_of = (SELECT MAX(as_of) FROM opening_balances)
+        UNION ALL
+        SELECT party_id, COALESCE(amount, 0), 0 FROM tokens WHERE datetime_iso < :end
+        UNION ALL
+        SELECT party_id, 0, COALESCE(amount, 0) FROM payments WHERE date_iso < :end
+    )
+    WHERE party_id IS NOT NULL
+    GROUP BY party_id
+"""
+
+# compared between the copy and the delete: the year must not have changed
+CHECKSUMS = {"tokens": "COUNT(*), TOTAL(amount)", "payments": "COUNT(*), TOTAL(amount)"}
+
+
+class ArchiveError(ValueError):
+    """The year cannot be closed (not over yet, earlier year open, work pending...)."""
+
+
+def year_range(fy):
+    """'2024-25' -> ('2024-04-01', '2025-04-01')."""
+    m = re.fullmatch(r"(\d{4})-(\d{2})", fy or "")
+    if not m or (int(m.group(1)) + 1) % 100 != int(m.group(2)):
+        raise ArchiveError(f"financial year must look like 2024-25, not {fy!r}")
+    start = int(m.group(1))
+    return f"{start}-04-01", f"{start + 1}-04-01"
+
+
+def oldest_open_year(conn):
+    """The financial year of the oldest row still in the live tables, or None."""
+    firsts = [conn.execute(f"SELECT MIN({col}) FROM {table}").fetchone()[0]
+              for table, col in DATED_TABLES.items()]
+    firsts = [d for d in firsts if d]
+    if not firsts:
+        return None
+    return db.financial_year(date.fromisoformat(min(firsts)[:10]))
+
+
+def _checksums(conn, params):
+    return {table: conn.execute(f"SELECT {CHECKSUMS.get(table, 'COUNT(*)')} "
+                                f"FROM main.{table} WHERE {where}", params).fetchone()
+            for table, where in ARCHIVED_TABLES}
+
+
+def _check_closable(conn, fy, allow_unbilled, on):
+    if fy >= db.financial_year(on):
+        raise ArchiveError(f"{fy} is not over yet")
+    if conn.execute("SELECT 1 FROM archives WHERE fy = ?", (fy,)).fetchone():
+        raise ArchiveError(f"{fy} is already closed")
+    oldest = oldest_open_year(conn)
+    if oldest is not None and oldest < fy:
+        raise ArchiveError(f"close {oldest} first (years are closed oldest first)")
+    start, end = year_range(fy)
+    params = {"start": start, "end": end}
+    pending = conn.execute("SELECT COUNT(*) FROM tokens WHERE status = 'PENDING' "
+                           "AND datetime_iso >= :start AND datetime_iso < :end",
+                           params).fetchone()[0]
+    if pending:
+        raise ArchiveError(f"{pending} tokens of {fy} are still PENDING - load them first")
+    unbilled = conn.execute("SELECT COUNT(*) FROM tokens WHERE bill_id IS NULL "
+                            "AND datetime_iso >= :start AND datetime_iso < :end",
+                            params).fetchone()[0]
+    if unbilled and not allow_unbilled:
+        raise ArchiveError(f"{unbilled} tokens of {fy} are not billed "
+                           f"(bill them, or close with allow_unbilled)")
+
+
+def _copy_year(conn, fy, params):
+    """Writes the year's rows into a fresh archive file.  Returns (rows, checksums) per table."""
+    path = db.archive_path(fy)
+    tmp = path + ".tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    counts = {}
+    conn.execute("ATTACH DATABASE ? AS arc", (tmp,))
+    try:
+        with db.transaction(conn):
+            for table, where in ARCHIVED_TABLES:
+                conn.execute(f"CREATE TABLE arc.{table} AS SELECT * FROM main.{table} WHERE 0")
+                counts[table] = conn.execute(
+                    f"INSERT INTO arc.{table} SELECT * FROM main.{table} WHERE {where}",
+                    params).rowcount
+            for table, cols in ARCHIVE_INDEXES:
+                conn.execute(f"CREATE INDEX arc.idx_{table}_{'_'.join(cols)} "
+                             f"ON {table} ({', '.join(cols)})")
+            checksums = _checksums(conn, params)
+    finally:
+        conn.execute("DETACH DATABASE arc")
+    os.replace(tmp, path)
+    return counts, checksums
+
+
+def close_year(fy=None, allow_unbilled=False, dry_run=False, vacuum=False, on=None):
+    """
+    Closes financial year `fy` ('2024-25'; default: the oldest year that
+    still has live rows).  Raises ArchiveError when it cannot be closed.
+
+    Returns a report dict: the year, the archive path, rows moved per
+    table, parties carried forward and seconds taken.
+    """
+    t0 = time.perf_counter()
+    db.init_db()
+    with db.get_conn() as conn:
+        fy = fy or oldest_open_year(conn)
+        if fy is None:
+            raise ArchiveError("no rows to archive")
+        start, end = year_range(fy)
+        params = {"start": start, "end": end}
+        _check_closable(conn, fy, allow_unbilled, on)
+
+        report = {"fy": fy, "path": db.archive_path(fy), "dry_run": dry_run}
+        if dry_run:
+            report["rows"] = {table: conn.execute(
+                f"SELECT COUNT(*) FROM main.{table} WHERE {where}", params).fetchone()[0]
+                for table, where in ARCHIVED_TABLES}
+            report["seconds"] = round(time.perf_counter() - t0, 3)
+            return report
+
+        counts, checksums = _copy_year(conn, fy, params)
+
+        with db.transaction(conn):
+            if _checksums(conn, params) != checksums:
+                raise ArchiveError(f"{fy} changed while it was being archived - run again")
+            for series in ("token", "challan"):
+                db.pin_sequence(conn, series)
+            closing = conn.execute(CLOSING_TOTALS_SQL, params).fetchall()
+            for table, where in ARCHIVED_TABLES:
+                conn.execute(f"DELETE FROM main.{table} WHERE {where}", params)
+            conn.executemany("""
+                INSERT INTO opening_balances (party_id, as_of, fy, token_total, paid_total, amount)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(pid, end, fy, tok, paid, round(tok - paid, 2)) for pid, tok, paid in closing])
+            conn.execute("""
+                INSERT INTO archives (fy, path, start_iso, end_iso, closed_at, counts)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (fy, os.path.join(db.ARCHIVE_DIR, os.path.basename(report["path"])), start, end,
+                  datetime.now().isoformat(timespec="seconds"), json.dumps(counts)))
+            # the deletes went through the balance triggers; totals now come
+            # from the live rows plus the new opening_balances
+            db.rebuild_party_balance(conn.cursor())
+        if vacuum:
+            conn.execute("VACUUM")
+
+    report["rows"] = counts
+    report["parties_carried"] = len(closing)
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+
+def archives():
+    """The closed years: [{fy, path, start_iso, end_iso, closed_at, counts}]."""
+    db.init_db()
+    with db.get_conn() as conn:
+        rows = conn.execute("SELECT fy, path, start_iso, end_iso, closed_at, counts "
+                            "FROM archives ORDER BY fy").fetchall()
+    return [{"fy": fy, "path": path, "start_iso": s, "end_iso": e, "closed_at": closed,
+             "counts": json.loads(counts)} for fy, path, s, e, closed, counts in rows]
@@ -0,0 +1,342 @@
+# backup.py
+# Online backups of the live database while the app keeps writing.
+#
+#   python manage.py backup [--keep 14] [--verify]
+#   python manage.py backups
+#   python manage.py verify-backup tms_20251031_2300.db.gz
+#   python manage.py restore tms_20251031_2300.db.gz [--force]
+#
+# A backup opens its own connection, starts a read transaction on it and
+# copies the database with Connection.backup() PAGES_PER_STEP pages at a
+# time, pausing between steps.  The read transaction pins one WAL snapshot
+# for the whole copy, so writers are never blocked and the copy never has
+# to restart when they commit; everything the manifest records (sequences,
+# row counts) is read from that same snapshot.
+#
+# The copy is gzipped into  <db folder>/backups/<db name>_<stamp>.db.gz
+# next to a <db name>_<stamp>.json manifest; a backup exists once its
+# manifest does.  Only the newest `keep` backups are kept.  The per-year
+# archive files (archive.py) never change after a close and are not part
+# of these backups.
+#
+# Restoring replaces the database file: stop the app first.  The database
+# it replaces is kept as <db>.pre-restore-<stamp> (with its -wal).
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import db
+
+BACKUP_DIR = "backups"
+KEEP = 14                       # newest backups kept by rotation
+PAGES_PER_STEP = 2048           # pages copied per backup step (8 MB at 4 KB pages)
+STEP_PAUSE = 0.002              # seconds between steps
+COMPRESS_LEVEL = 1              # ~2.5x faster than 6 on our data, for ~13% more bytes
+CHUNK = 1024 * 1024
+
+# tables whose row counts and last ids go into the manifest
+COUNTED_TABLES = ("party_master", "item_master", "rate_master", "tokens", "challan",
+                  "challan_tokens", "bills", "payments", "opening_balances", "archives")
+
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tms-backup")
+_current = None                 # Future of the background backup, if any
+_progress = {"phase": "idle"}
+
+
+class BackupError(ValueError):
+    """A backup is missing, damaged, or would overwrite a database."""
+
+
+def backup_dir():
+    folder = os.path.dirname(os.path.abspath(db.DB_PATH))
+    return os.path.join(folder, BACKUP_DIR)
+
+
+def _db_name():
+    return os.path.splitext(os.path.basename(db.DB_PATH))[0]
+
+
+def _set_progress(**fields):
+    with _lock:
+        _progress.update(fields)
+
+
+def status():
+    """What the background backup is doing: phase, pages done / total, last result."""
+    with _lock:
+        return dict(_progress)
+
+
+# -------------------------
+#   SNAPSHOT
+# -------------------------
+def snapshot_facts(conn):
+    """Schema version, number sequences and per-table rows / last id, as `conn` sees them."""
+    facts = {"schema_version": db.schema_version(conn), "sequences": [], "tables": {}}
+    if db.table_exists(conn, "sequences"):
+        facts["sequences"] = [list(r) for r in conn.execute(
+            "SELECT series, fy, last_value FROM sequences ORDER BY series, fy")]
+    for table in COUNTED_TABLES:
+        if db.table_exists(conn, table):
+            rows, last = conn.execute(f"SELECT COUNT(*), MAX(rowid) FROM {table}").fetchone()
+            facts["tables"][table] = {"rows": rows, "last_id": last}
+    return facts
+
+
+def _copy(path, pages, pause):
+    """Backs the live database up into `path`.  Returns (facts, steps info, page size)."""
+    src = sqlite3.connect(db.DB_PATH, timeout=db.BUSY_TIMEOUT_MS / 1000)
+    dst = sqlite3.connect(path)
+    steps = {"pages": 0, "steps": 0, "restarts": 0, "remaining": None}
+
+    def step(status, remaining, total):
+        # a copy that starts over (should not happen under the read
+        # transaction) shows up as `remaining` going up
+        if steps["remaining"] is not None and remaining > steps["remaining"]:
+            steps["restarts"] += 1
+        steps.update(pages=total, remaining=remaining, steps=steps["steps"] + 1)
+        _set_progress(pages_done=total - remaining, pages_total=total)
+        if remaining and pause:
+            time.sleep(pause)
+
+    try:
+        src.execute("BEGIN")
+        facts = snapshot_facts(src)         # the first read fixes the snapshot
+        src.backup(dst, pages=pages, progress=step)
+        src.rollback()
+        # a self-contained file: no -wal needed to open it
+        dst.execute("PRAGMA journal_mode=DELETE")
+        page_size = dst.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    del steps["remaining"]
+    return facts, steps, page_size
+
+
+def _compress(path, gz_path, level=COMPRESS_LEVEL):
+    """gzips `path` into `gz_path`; returns the sha256 of the uncompressed file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f, gzip.open(gz_path, "wb", compresslevel=level) as out:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def _decompress(gz_path, path):
+    digest = hashlib.sha256()
+    with gzip.open(gz_path, "rb") as f, open(path, "wb") as out:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def integrity_check(path):
+    """PRAGMA integrity_check of a database file: [] when it is sound, else the problems."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        lines = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if lines == ["ok"] else lines
+
+
+# -------------------------
+#   BACKUP
+# -------------------------
+def backup(keep=KEEP, pages=PAGES_PER_STEP, pause=STEP_PAUSE, verify=False, dest=None,
+           level=COMPRESS_LEVEL):
+    """
+    Takes one online backup.  Returns its manifest dict: file, created,
+    pages, sizes, sha256, snapshot facts, seconds per phase and, with
+    verify=True, the integrity check of the copy.
+    """
+    t0 = time.perf_counter()
+    db.init_db()
+    folder = dest or backup_dir()
+    os.makedirs(folder, exist_ok=True)
+    created = datetime.now()
+    name = f"{_db_name()}_{created:%Y%m%d_%H%M%S}"
+    raw = os.path.join(folder, name + ".db.tmp")
+    gz = os.path.join(folder, name + ".db.gz")
+    manifest = {"file": name + ".db.gz", "created": created.isoformat(timespec="seconds"),
+                "source": os.path.abspath(db.DB_PATH), "seconds": {}}
+    try:
+        _set_progress(phase="copying", started=manifest["created"], pages_done=0, pages_total=0,
+                      error=None)
+        facts, steps, page_size = _copy(raw, pages, pause)
+        manifest.update(steps, page_size=page_size, db_bytes=os.path.getsize(raw), **facts)
+        manifest["seconds"]["copy"] = round(time.perf_counter() - t0, 3)
+
+        if verify:
+            _set_progress(phase="verifying")
+            t1 = time.perf_counter()
+            problems = integrity_check(raw)
+            if problems:
+                raise BackupError(f"the copy failed integrity_check: {problems[:5]}")
+            manifest["integrity"] = "ok"
+            manifest["seconds"]["verify"] = round(time.perf_counter() - t1, 3)
+
+        _set_progress(phase="compressing")
+        t1 = time.perf_counter()
+        manifest["sha256"] = _compress(raw, gz + ".tmp", level)
+        os.replace(gz + ".tmp", gz)
+        manifest["gz_bytes"] = os.path.getsize(gz)
+        manifest["seconds"]["compress"] = round(time.perf_counter() - t1, 3)
+    finally:
+        for leftover in (raw, gz + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    manifest["seconds"]["total"] = round(time.perf_counter() - t0, 3)
+    with open(os.path.join(folder, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    manifest["removed"] = rotate(keep, folder)
+    _set_progress(phase="idle", last=manifest["file"], last_seconds=manifest["seconds"]["total"])
+    return manifest
+
+
+def rotate(keep=KEEP, folder=None):
+    """Deletes all but the newest `keep` backups.  Returns the files removed."""
+    removed = []
+    for m in backups(folder)[keep:]:
+        for path in (m["path"], m["manifest_path"]):
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(os.path.basename(path))
+    return removed
+
+
+def start(**kwargs):
+    """
+    backup(**kwargs) on the background thread; returns its Future.  While
+    one is running, returns that one instead of starting another.
+    """
+    global _current
+    with _lock:
+        if _current is not None and not _current.done():
+            return _current
+        _current = _executor.submit(_background, kwargs)
+        return _current
+
+
+def _background(kwargs):
+    try:
+        return backup(**kwargs)
+    except Exception as e:
+        _set_progress(phase="failed", error=str(e))
+        raise
+
+
+def backups(folder=None):
+    """Complete backups, newest first: their manifests plus path / manifest_path."""
+    folder = folder or backup_dir()
+    if not os.path.isdir(folder):
+        return []
+    out = []
+    for entry in sorted(os.listdir(folder), reverse=True):
+        if not entry.endswith(".json"):
+            continue
+        manifest_path = os.path.join(folder, entry)
+        with open(manifest_path, encoding="utf-8") as f:
+            m = json.load(f)
+        m["manifest_path"] = manifest_path
+        m["path"] = os.path.join(folder, m["file"])
+        out.append(m)
+    return out
+
+
+def find(name):
+    """A backup by file name, manifest name or path -> its manifest dict."""
+    base = os.path.basename(name)
+    for suffix in (".json", ".db.gz"):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    folder = os.path.dirname(os.path.abspath(name)) if os.path.dirname(name) else None
+    for m in backups(folder):
+        if m["file"] == base + ".db.gz":
+            return m
+    raise BackupError(f"no backup named {name!r} in {folder or backup_dir()}")
+
+
+# -------------------------
+#   VERIFY / RESTORE
+# -------------------------
+def _unpack(m, path):
+    """Decompresses backup `m` into `path` and checks it; returns a report dict."""
+    if not os.path.exists(m["path"]):
+        raise BackupError(f"{m['file']} is missing")
+    t0 = time.perf_counter()
+    sha = _decompress(m["path"], path)
+    report = {"file": m["file"], "sha256_ok": sha == m.get("sha256"),
+              "integrity": integrity_check(path) or "ok"}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        facts = snapshot_facts(conn)
+    finally:
+        conn.close()
+    report["counts_ok"] = (facts["tables"] == m["tables"]
+                           and facts["sequences"] == m["sequences"])
+    report["ok"] = report["sha256_ok"] and report["integrity"] == "ok" and report["counts_ok"]
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+
+def verify(name):
+    """
+    Unpacks a backup into a temp file and checks it: checksum, PRAGMA
+    integrity_check, and rows / sequences against the manifest.
+    """
+    m = find(name)
+    tmp = m["path"][:-len(".gz")] + ".verify"
+    try:
+        return _unpack(m, tmp)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def restore(name, target=None, force=False):
+    """
+    Replaces `target` (default: the live database) with a verified backup.
+    Stop the app first.  An existing target is kept as
+    <target>.pre-restore-<stamp>; without force=True it is an error.
+    """
+    m = find(name)
+    target = os.path.abspath(target or db.DB_PATH)
+    if os.path.exists(target) and not force:
+        raise BackupError(f"{target} exists - pass force to replace it "
+                          "(it is kept as a .pre-restore file)")
+    tmp = target + ".restore-tmp"
+    try:
+        report = _unpack(m, tmp)
+        if not report["ok"]:
+            raise BackupError(f"{m['file']} failed verification: {report}")
+        db.close_pool()
+        if os.path.exists(target):
+            kept = f"{target}.pre-restore-{datetime.now():%Y%m%d_%H%M%S}"
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(target + suffix):
+                    os.replace(target + suffix, kept + suffix)
+            report["previous"] = kept
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    report["target"] = target
+    return report
@@ -0,0 +1,2 @@
+# Benchmarks for the TMS hot paths.  Run from the repo root, e.g.
+#   python -m benchmarks.bench_reporting
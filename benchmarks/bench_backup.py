@@ -0,0 +1,112 @@
+# benchmarks/bench_backup.py
+# Timing of backup.py on a big database while a clerk keeps booking tokens:
+# copy / compress / verify / restore seconds and throughput, and the token
+# insert latency before and during the backup.
+#   python -m benchmarks.bench_backup --db big.db          (an existing database, left as is)
+#   python -m benchmarks.bench_backup --per-day 2000 --years 3   (generated)
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import backup
+import db
+from benchmarks.generate import generate
+from importer import INSERT_TOKEN_SQL
+
+IDLE_SECONDS = 5
+
+
+def book_tokens(stop, latencies):
+    """One clerk: a token every couple of milliseconds until `stop` is set."""
+    while not stop.is_set():
+        now = datetime.now()
+        t0 = time.perf_counter()
+        with db.get_conn() as conn, db.transaction(conn):
+            token_no = db.allocate_numbers(conn, "token")
+            conn.execute(INSERT_TOKEN_SQL, (
+                token_no, now.strftime(db.TOKEN_DT_FORMAT), now.strftime("%Y-%m-%d %H:%M"),
+                1, "PARTY 0000", "M0", "JAIPUR", "DELHI", 100.0, 5.0, "KG", 500.0, 4, "",
+            ))
+        latencies.append(time.perf_counter() - t0)
+        time.sleep(0.002)
+
+
+def with_clerk(fn):
+    """Runs fn() while book_tokens() runs; returns (fn's result, insert latencies)."""
+    stop, latencies = threading.Event(), []
+    clerk = threading.Thread(target=book_tokens, args=(stop, latencies))
+    clerk.start()
+    try:
+        result = fn()
+    finally:
+        stop.set()
+        clerk.join()
+    return result, latencies
+
+
+def pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000 if ordered else 0.0
+
+
+def latency_line(label, values):
+    return (f"{label:<16} {len(values):>6} inserts  p50 {pct(values, 0.5):6.2f} ms  "
+            f"p95 {pct(values, 0.95):6.2f} ms  max {pct(values, 1.0):7.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="existing database to back up (default: generate one)")
+    parser.add_argument("--parties", type=int, default=500)
+    parser.add_argument("--per-day", type=int, default=1000)
+    parser.add_argument("--years", type=float, default=2.0)
+    parser.add_argument("--pages", type=int, default=backup.PAGES_PER_STEP)
+    parser.add_argument("--level", type=int, default=backup.COMPRESS_LEVEL)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db:
+            db.DB_PATH = args.db
+        else:
+            db.DB_PATH = os.path.join(tmp, "tms.db")
+            t0 = time.perf_counter()
+            generate(args.parties, args.per_day, args.years, end=date.today())
+            print(f"generated in {time.perf_counter() - t0:.1f}s")
+        db.init_db()
+        size_mb = os.path.getsize(db.DB_PATH) / 2**20
+        print(f"database {db.DB_PATH}: {size_mb:,.0f} MB")
+
+        _, idle = with_clerk(lambda: time.sleep(IDLE_SECONDS))
+        out = os.path.join(tmp, "backups")
+        m, during = with_clerk(lambda: backup.backup(
+            keep=2, pages=args.pages, verify=True, dest=out, level=args.level))
+        sec = m["seconds"]
+
+        check = backup.verify(os.path.join(out, m["file"]))
+        target = os.path.join(tmp, "restored.db")
+        t0 = time.perf_counter()
+        backup.restore(os.path.join(out, m["file"]), target=target)
+        restore_s = time.perf_counter() - t0
+        shutil.rmtree(out)
+        db.close_pool()
+
+    print(f"copy      {sec['copy']:8.2f}s  {size_mb / sec['copy']:7.0f} MB/s  "
+          f"({m['steps']} steps of {args.pages} pages, {m['restarts']} restarts)")
+    print(f"verify    {sec['verify']:8.2f}s  integrity_check of the copy")
+    print(f"compress  {sec['compress']:8.2f}s  {size_mb / sec['compress']:7.0f} MB/s  "
+          f"level {args.level}: {m['db_bytes'] / 2**20:,.0f} MB -> {m['gz_bytes'] / 2**20:,.0f} MB "
+          f"({m['gz_bytes'] / m['db_bytes']:.0%})")
+    print(f"total     {sec['total']:8.2f}s")
+    print(f"check     {check['seconds']:8.2f}s  unpack + integrity_check + counts: "
+          f"{'ok' if check['ok'] else check}")
+    print(f"restore   {restore_s:8.2f}s")
+    print(latency_line("inserts idle", idle))
+    print(latency_line("during backup", during))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_bilty_batch.py
+# Printing a shift's bilties: one token_pdf() per token (the old way, one
+# download each) vs. documents.bilty_batch() into one merged PDF.
+#   python -m benchmarks.bench_bilty_batch [--tokens 2000]
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import db
+import documents
+
+
+def seed(n):
+    with db.get_conn() as conn:
+        conn.execute("INSERT INTO party_master (party_name, marka) VALUES ('PARTY 1', 'P1')")
+        conn.executemany(
+            "INSERT INTO tokens (token_no, datetime, datetime_iso, party_id, marka, from_city, "
+            "to_city, weight, rate, rate_type, amount, packages, driver_mobile, status) "
+            "VALUES (?, '05-04-2025 10:00 AM', '2025-04-05 10:00', 1, 'P1', 'DELHI', 'JAIPUR', "
+            "?, 4.5, 'KG', ?, 2, '9800000000', 'PENDING')",
+            [(i, 10.0 + i % 50, (10.0 + i % 50) * 4.5) for i in range(1, n + 1)],
+        )
+
+
+def measure(fn, tmp):
+    # timed on its own; tracemalloc slows reportlab down a lot
+    t0 = time.perf_counter()
+    result = fn(os.path.join(tmp, f"timed_{fn.__name__}"))
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    fn(os.path.join(tmp, f"traced_{fn.__name__}"))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args(argv)
+    n = args.tokens
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "tms.db")
+        db.init_db()
+        seed(n)
+
+        def one_by_one(out):
+            os.makedirs(out)
+            for token in documents.batch_tokens(1, n):
+                with open(os.path.join(out, f"TOKEN_{token['token_no']}.pdf"), "wb") as f:
+                    f.write(documents.token_pdf(token).getvalue())
+            return sum(os.path.getsize(os.path.join(out, f)) for f in os.listdir(out))
+
+        def batched(path):
+            pages = documents.bilty_batch(path, documents.batch_tokens(1, n))
+            assert pages == n
+            return os.path.getsize(path)
+
+        size_single, t_single, peak_single = measure(one_by_one, tmp)
+        size_batch, t_batch, peak_batch = measure(batched, tmp)
+        db.close_pool()
+
+    print(f"per-token  {t_single:6.2f}s  {n / t_single:7.0f} bilties/s  "
+          f"{size_single / 1e6:6.2f} MB in {n} files  peak {peak_single / 1e6:6.1f} MB")
+    print(f"batched    {t_batch:6.2f}s  {n / t_batch:7.0f} bilties/s  "
+          f"{size_batch / 1e6:6.2f} MB in 1 file    peak {peak_batch / 1e6:6.1f} MB")
+    print(f"speedup x{t_single / t_batch:.1f}")
+
+
+if __name__ == "__main__":
+    main()
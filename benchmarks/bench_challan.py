@@ -0,0 +1,122 @@
+# benchmarks/bench_challan.py
+# Loads full trucks with db.create_challan() vs. the old per-token
+# INSERT/UPDATE loop (unguarded, as the page had it) and vs. the same loop
+# with create_challan's guarantees (PENDING check, challan_id), then races
+# two clerks for the same tokens.  The three kinds of truck take turns, so
+# cache warm-up does not favour one.
+#   python -m benchmarks.bench_challan [--trucks 20 --per-truck 400]
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import db
+
+HEADER = {"date": "05/04/2025", "from_city": "DELHI", "to_city": "JAIPUR",
+          "truck_no": "RJ14 GA 1234", "hire": 15000}
+
+
+def seed(n):
+    with db.get_conn() as conn:
+        conn.execute("INSERT INTO party_master (party_name) VALUES ('PARTY 1')")
+        conn.executemany(
+            "INSERT INTO tokens (datetime, datetime_iso, party_id, weight, amount, packages, status) "
+            "VALUES ('05-04-2025 10:00 AM', '2025-04-05 10:00', 1, ?, ?, 1, 'PENDING')",
+            [(10.0 + i % 7, 100.0 + i % 11) for i in range(n)],
+        )
+
+
+def per_token_loop(token_ids, guarded=False):
+    # what 4_Challan_Loading.py used to do; guarded=True adds the checks
+    # create_challan makes
+    marks = ",".join("?" * len(token_ids))
+    with db.get_conn() as conn, db.transaction(conn):
+        cur = conn.cursor()
+        cur.execute(f"SELECT SUM(amount), SUM(weight) FROM tokens WHERE id IN ({marks})",
+                    token_ids).fetchone()
+        challan_no = db.allocate_numbers(conn, "challan")
+        cur.execute("INSERT INTO challan (challan_no, date) VALUES (?, ?)",
+                    (challan_no, HEADER["date"]))
+        challan_id = cur.lastrowid
+        for tid in token_ids:
+            cur.execute("INSERT INTO challan_tokens (challan_id, token_id) VALUES (?, ?)",
+                        (challan_id, tid))
+            if guarded:
+                cur.execute("UPDATE tokens SET status='LOADED', challan_id=? "
+                            "WHERE id=? AND status='PENDING'", (challan_id, tid))
+                if cur.rowcount != 1:
+                    raise db.TokensNotPending([tid])
+            else:
+                cur.execute("UPDATE tokens SET status='LOADED' WHERE id=?", (tid,))
+        cur.execute(f"SELECT t.id, t.weight, t.amount, p.party_name FROM tokens t "
+                    f"LEFT JOIN party_master p ON p.id = t.party_id WHERE t.id IN ({marks})",
+                    token_ids).fetchall()
+
+
+def create(token_ids):
+    challan, rows = db.create_challan(token_ids, HEADER)
+    assert len(rows) == len(token_ids)
+
+
+def race(token_ids):
+    outcome = []
+
+    def clerk():
+        try:
+            db.create_challan(token_ids, HEADER)
+            outcome.append("created")
+        except db.TokensNotPending:
+            outcome.append("refused")
+
+    threads = [threading.Thread(target=clerk) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(outcome)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trucks", type=int, default=20)
+    parser.add_argument("--per-truck", type=int, default=400)
+    args = parser.parse_args(argv)
+    n = args.per_truck
+
+    ways = {
+        "per-token loop": per_token_loop,
+        "guarded loop": lambda ids: per_token_loop(ids, guarded=True),
+        "create_challan": create,
+    }
+    total = len(ways) * args.trucks + 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "tms.db")
+        db.init_db()
+        seed(n * total)
+        trucks = [list(range(1 + i * n, 1 + (i + 1) * n)) for i in range(total)]
+
+        seconds = dict.fromkeys(ways, 0.0)
+        for i, ids in enumerate(trucks[:-1]):
+            name = list(ways)[i % len(ways)]
+            t0 = time.perf_counter()
+            ways[name](ids)
+            seconds[name] += time.perf_counter() - t0
+
+        outcome = race(trucks[-1])
+        with db.get_conn() as conn:
+            links = conn.execute("SELECT COUNT(*) FROM challan_tokens").fetchone()[0]
+        db.close_pool()
+
+    base = seconds["create_challan"]
+    for name, s in seconds.items():
+        print(f"{name:<16} {s / args.trucks * 1000:7.1f} ms / truck of {n}  "
+              f"(x{s / base:.2f} of create_challan)")
+    print(f"two clerks, same tokens: {outcome}")
+    assert outcome == ["created", "refused"]
+    assert links == n * total
+
+
+if __name__ == "__main__":
+    main()
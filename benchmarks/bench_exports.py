@@ -0,0 +1,94 @@
+# benchmarks/bench_exports.py
+# Memory ceiling of exports.export_query(): a million-row export from a
+# SQL cursor to XLSX (write-only) and to CSV.gz, against
+# DataFrame.to_excel() on a tenth of the rows.  Each case runs in its own
+# process and reports how far its peak RSS rose above its start.
+#   python -m benchmarks.bench_exports [--rows 1000000 --ceiling-mb 64]
+import argparse
+import io
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import db
+import exports
+
+COLUMNS = ["date", "type", "details", "debit", "credit", "balance"]
+
+ROWS_SQL = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows)
+    SELECT date('2025-04-01', '+' || (i % 365) || ' days'),
+           CASE i % 4 WHEN 0 THEN 'PAYMENT' ELSE 'TOKEN' END,
+           'Token #' || i,
+           CASE i % 4 WHEN 0 THEN 0 ELSE (i % 997) * 1.5 END,
+           CASE i % 4 WHEN 0 THEN (i % 991) * 4.0 ELSE 0 END,
+           i * 0.25
+    FROM n
+"""
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KiB on Linux
+
+
+def stream_case(db_path, fmt, rows):
+    db.DB_PATH = db_path
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    path, count = exports.export_query(ROWS_SQL, {"rows": rows}, COLUMNS, fmt)
+    seconds = time.perf_counter() - t0
+    size = os.path.getsize(path)
+    os.remove(path)
+    assert count == rows
+    return seconds, _rss_mb() - base, size
+
+
+def pandas_case(db_path, rows):
+    db.DB_PATH = db_path
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    with db.get_conn() as conn:
+        df = pd.read_sql_query(ROWS_SQL, conn, params={"rows": rows})
+    df.columns = COLUMNS
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False, engine="openpyxl")
+    return time.perf_counter() - t0, _rss_mb() - base, buf.tell()
+
+
+def in_child(fn, *args):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--ceiling-mb", type=float, default=64.0,
+                        help="fail if a streaming export grows RSS by more than this")
+    args = parser.parse_args(argv)
+    small = args.rows // 10
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # the exports read on the read-only pool, which opens an existing file only
+        db.DB_PATH = db_path = os.path.join(tmp, "tms.db")
+        db.init_db()
+        db.close_pool()
+        results = [(f"stream {fmt}", args.rows, *in_child(stream_case, db_path, fmt, args.rows))
+                   for fmt in exports.FORMATS]
+        results.append(("pandas to_excel", small, *in_child(pandas_case, db_path, small)))
+
+    for label, rows, seconds, grew, size in results:
+        print(f"{label:<16} {rows:>9} rows  {seconds:7.1f}s  RSS +{grew:7.1f} MB  "
+              f"file {size / 1e6:6.1f} MB")
+    worst = max(grew for label, _, _, grew, _ in results if label.startswith("stream"))
+    print(f"streaming peak +{worst:.1f} MB (ceiling {args.ceiling_mb} MB)")
+    if worst > args.ceiling_mb:
+        raise SystemExit("FAILED - streaming export went over the memory ceiling")
+
+
+if __name__ == "__main__":
+    main()
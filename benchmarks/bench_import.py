@@ -0,0 +1,86 @@
+# benchmarks/bench_import.py
+# Imports a generated booking sheet through importer.import_tokens() on a
+# scratch database and reports rows/second (CSV and XLSX).
+#   python -m benchmarks.bench_import [--rows 100000 --bad 0.01]
+import argparse
+import csv
+import os
+import random
+import tempfile
+
+import db
+import importer
+
+CITIES = ["DELHI", "MUMBAI", "JAIPUR", "SURAT", "INDORE", "PUNE", "AGRA", "KOTA"]
+
+
+def seed(n_parties):
+    with db.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO party_master (party_name, marka, default_rate_per_kg, "
+            "default_rate_per_parcel) VALUES (?, ?, 4.5, 60)",
+            [(f"PARTY {i}", f"M{i}") for i in range(n_parties)],
+        )
+
+
+def sheet_rows(n, n_parties, bad, rng):
+    yield ["Date", "Party Name", "From", "To", "Weight", "Pkgs", "Rate Type", "Rate"]
+    for i in range(n):
+        row = [f"{rng.randint(1, 28):02d}-04-2025 10:30 AM", f"party {rng.randrange(n_parties)}",
+               rng.choice(CITIES), rng.choice(CITIES), round(rng.uniform(5, 900), 1),
+               rng.randint(1, 40), rng.choice(("KG", "PARCEL")),
+               "" if rng.random() < 0.7 else round(rng.uniform(2, 80), 2)]
+        if rng.random() < bad:
+            row[rng.choice((1, 4))] = "???"
+        yield row
+
+
+def run(path, label):
+    with db.get_conn() as conn:
+        before = conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+    report = importer.import_tokens(path, errors=path + ".errors.csv")
+    with db.get_conn() as conn:
+        after = conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+    assert after - before == report["imported"]
+    print(f"{label:<5} {report['rows']:>8} rows  imported {report['imported']:>8}  "
+          f"rejected {report['rejected']:>6}  {report['seconds']:7.2f}s  "
+          f"{report['rows_per_second']:>10,.0f} rows/s  "
+          f"tokens {report['first_token_no']}-{report['last_token_no']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--parties", type=int, default=300)
+    parser.add_argument("--bad", type=float, default=0.01, help="share of broken rows")
+    args = parser.parse_args(argv)
+    rng = random.Random(3)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "tms.db")
+        db.init_db()
+        seed(args.parties)
+
+        csv_path = os.path.join(tmp, "sheet.csv")
+        with open(csv_path, "w", newline="") as f:
+            csv.writer(f).writerows(sheet_rows(args.rows, args.parties, args.bad, rng))
+        run(csv_path, "CSV")
+
+        from openpyxl import Workbook
+
+        xlsx_path = os.path.join(tmp, "sheet.xlsx")
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        for row in sheet_rows(args.rows // 5, args.parties, args.bad, rng):
+            ws.append(row)
+        wb.save(xlsx_path)
+        run(xlsx_path, "XLSX")
+
+        with db.get_conn() as conn:
+            diffs = db.check_party_balances()
+        db.close_pool()
+    assert not diffs, diffs[:5]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_profiling.py
+# Cost of profiling.py: the same page-like work with profiling off (plain
+# sqlite3 connections, no-op timers) and on (every statement and timer
+# recorded).
+#   python -m benchmarks.bench_profiling [--parties 100 --per-day 200 --years 0.5]
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+import db
+import profiling
+from benchmarks.generate import generate
+from reporting import format_dates
+
+
+def page_work(party_id, end):
+    """Roughly what one rerun of the Challan, Reports and Ledger pages does."""
+    db.pending_tokens_page({})
+    with db.get_conn() as conn:
+        df = pd.read_sql_query(db.DAILY_BOOKING_SQL, conn,
+                               params=db.iso_range(end - timedelta(days=30), end))
+        conn.execute(db.OUTSTANDING_SQL).fetchall()
+    format_dates(df["d"])
+    start = end - timedelta(days=30)
+    db.ledger_summary(party_id, start, end)
+    db.ledger_page(party_id, start, end)
+
+
+def run(loops, party_id, end):
+    for _ in range(3):
+        page_work(party_id, end)
+    t0 = time.perf_counter()
+    for _ in range(loops):
+        page_work(party_id, end)
+    return (time.perf_counter() - t0) / loops
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parties", type=int, default=100)
+    parser.add_argument("--per-day", type=int, default=200)
+    parser.add_argument("--years", type=float, default=0.5)
+    parser.add_argument("--loops", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "tms.db")
+        end = date.today()
+        generate(args.parties, args.per_day, args.years, end=end)
+
+        profiling.set_enabled(False)
+        off = run(args.loops, 1, end)
+        profiling.set_enabled(True)
+        profiling.begin_run("bench")
+        on = run(args.loops, 1, end)
+        queries = profiling.run_rows()[0]["queries"]
+        profiling.set_enabled(False)
+        db.close_pool()
+
+    print(f"profiling off: {off * 1000:8.3f} ms per rerun")
+    print(f"profiling on:  {on * 1000:8.3f} ms per rerun  "
+          f"(+{(on / off - 1) * 100:.1f}%, {queries} statements recorded)")
+
+
+if __name__ == "__main__":
+    main()
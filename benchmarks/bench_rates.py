@@ -0,0 +1,98 @@
+# benchmarks/bench_rates.py
+# Pricing many tokens with rates.RateIndex vs. one SQL lookup per row.
+#   python -m benchmarks.bench_rates [--rows 200000 --parties 500 --routes 200]
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import db
+import masters
+import rates
+
+NAIVE_SQL = """
+    SELECT COALESCE(
+        (SELECT rate FROM rate_master WHERE party_id = :p AND from_city = :f
+            AND to_city = :t AND rate_type = :rt ORDER BY id DESC LIMIT 1),
+        (SELECT rate FROM rate_master WHERE party_id IS NULL AND from_city = :f
+            AND to_city = :t AND rate_type = :rt ORDER BY id DESC LIMIT 1),
+        (SELECT CASE :rt WHEN 'KG' THEN NULLIF(default_rate_per_kg, 0)
+                         ELSE NULLIF(default_rate_per_parcel, 0) END
+           FROM party_master WHERE id = :p)
+    )
+"""
+
+
+def seed(n_parties, n_routes, rng):
+    cities = [f"CITY{i:03d}" for i in range(40)]
+    routes = [(rng.choice(cities), rng.choice(cities)) for _ in range(n_routes)]
+    with db.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO party_master (party_name, default_rate_per_kg, default_rate_per_parcel) "
+            "VALUES (?, ?, ?)",
+            [(f"PARTY {i}", rng.choice((0, 3.5)), rng.choice((0, 40))) for i in range(n_parties)],
+        )
+        rows = []
+        for f, t in routes:
+            rows.append((None, f, t, "KG", rng.uniform(2, 9)))
+            for pid in rng.sample(range(1, n_parties + 1), 5):
+                rows.append((pid, f, t, rng.choice(("KG", "PARCEL")), rng.uniform(2, 60)))
+        conn.executemany(
+            "INSERT INTO rate_master (party_id, from_city, to_city, rate_type, rate) "
+            "VALUES (?, ?, ?, ?, ?)", rows)
+    return cities, routes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--parties", type=int, default=500)
+    parser.add_argument("--routes", type=int, default=200)
+    parser.add_argument("--naive-rows", type=int, default=5_000,
+                        help="rows priced with per-row SQL (extrapolated)")
+    args = parser.parse_args(argv)
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "tms.db")
+        db.init_db()
+        cities, routes = seed(args.parties, args.routes, rng)
+        with db.get_conn() as conn:
+            conn.execute("CREATE INDEX idx_bench_rate ON rate_master "
+                         "(party_id, from_city, to_city, rate_type)")
+
+        jobs = []
+        for _ in range(args.rows):
+            f, t = rng.choice(routes) if rng.random() < 0.8 else (rng.choice(cities),) * 2
+            jobs.append((rng.randint(1, args.parties), f, t, rng.choice(rates.RATE_TYPES)))
+        cols = list(zip(*jobs))
+
+        t0 = time.perf_counter()
+        masters.invalidate()
+        index = rates.rate_index()
+        t_build = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        fast = index.rate_many(*cols)
+        t_fast = time.perf_counter() - t0
+
+        sample = jobs[:args.naive_rows]
+        t0 = time.perf_counter()
+        with db.get_conn() as conn:
+            naive = [conn.execute(NAIVE_SQL, {"p": p, "f": f, "t": t, "rt": rt}).fetchone()[0]
+                     for p, f, t, rt in sample]
+        t_naive = (time.perf_counter() - t0) * len(jobs) / len(sample)
+        db.close_pool()
+
+    mismatches = sum(1 for a, b in zip(fast, naive)
+                     if (a is None) != (b is None) or (a is not None and abs(a - b) > 1e-9))
+    print(f"index build           {t_build * 1000:8.1f} ms")
+    print(f"RateIndex.rate_many   {t_fast:8.3f} s  {len(jobs) / t_fast:>12,.0f} rows/s")
+    print(f"per-row SQL (extrap.) {t_naive:8.3f} s  {len(jobs) / t_naive:>12,.0f} rows/s")
+    print(f"speedup x{t_naive / t_fast:.0f}, mismatches on sample: {mismatches}")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    main()
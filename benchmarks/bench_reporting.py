@@ -0,0 +1,62 @@
+# benchmarks/bench_reporting.py
+# iterrows() row building (the old Billing code) vs. the column-wise
+# helpers in reporting.py, on one large party.  (The ledger's rows and
+# running balance now come from SQL; see bench_profiling and suite.)
+#   python -m benchmarks.bench_reporting [--rows 100000]
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import reporting
+
+
+def make_bill_df(n, seed=1):
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp("2024-04-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D")
+    return pd.DataFrame({
+        "token_no": np.arange(1, n + 1),
+        "datetime": days.strftime("%d-%m-%Y 10:30 AM"),
+        "datetime_iso": days.strftime("%Y-%m-%d 10:30"),
+        "from_city": "DELHI",
+        "to_city": "MUMBAI",
+        "weight": rng.uniform(1, 500, n).round(1),
+        "packages": rng.integers(1, 20, n),
+        "amount": rng.uniform(50, 5000, n).round(2),
+    })
+
+
+def old_bill_rows(df):
+    rows = []
+    for _, r in df.iterrows():
+        rows.append({c: r[c] for c in reporting.BILL_COLUMNS})
+    return rows, df["weight"].sum(), df["packages"].sum(), df["amount"].sum()
+
+
+def new_bill_rows(df):
+    frame = reporting.bill_frame(df)
+    return reporting.records(frame), reporting.bill_totals(frame)
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - t0, out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    df = make_bill_df(args.rows)
+    t_old, (rows_old, *_) = timed(old_bill_rows, df)
+    t_new, (rows_new, _) = timed(new_bill_rows, df)
+    assert len(rows_old) == len(rows_new)
+    print(f"bill rows   {args.rows:>8} rows  iterrows {t_old:7.3f}s  "
+          f"columnar {t_new:7.3f}s  x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
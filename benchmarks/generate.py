@@ -0,0 +1,221 @@
+# benchmarks/generate.py
+# Synthetic TMS data at a chosen volume, written straight into a database:
+# parties, route / party rates, tokens over Y years, challans for the
+# loaded tokens, month-end bills and payments.
+#   python -m benchmarks.generate --db bench.db --parties 200 --per-day 300 --years 1
+#
+# A few parties and routes carry most of the traffic (Zipf-like weights),
+# weights are log-normal, the last days stay PENDING, older tokens are
+# LOADED on challans of up to a truck load, and every closed month is
+# billed per party except the last one, and bills are mostly paid.
+# Token / challan / bill number series seed themselves from the rows on
+# first use.
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+import db
+import masters
+from importer import INSERT_TOKEN_SQL
+from rates import amount_for, rate_index
+
+CITIES = [
+    "DELHI", "MUMBAI", "JAIPUR", "SURAT", "INDORE", "PUNE", "AGRA", "KOTA", "AHMEDABAD",
+    "LUDHIANA", "KANPUR", "NAGPUR", "BHOPAL", "UDAIPUR", "JODHPUR", "VADODARA",
+]
+PAYMENT_MODES = ("CASH", "UPI", "NEFT", "CHEQUE")
+TRUCK_LOAD = 250                # tokens per challan at most
+PENDING_DAYS = 3                # the newest days are not loaded yet
+CHUNK = 5000
+
+
+def zipf_weights(n, s=1.1):
+    return list(accumulate(1 / (i + 1) ** s for i in range(n)))
+
+
+def unbilled_from(end):
+    """First day of the month before `end`'s: tokens from here on are not billed."""
+    first = end.replace(day=1) - timedelta(days=1)
+    return first.replace(day=1)
+
+
+def _executemany_chunks(conn, sql, rows):
+    for i in range(0, len(rows), CHUNK):
+        with db.transaction(conn):
+            conn.executemany(sql, rows[i:i + CHUNK])
+
+
+def generate(parties=200, per_day=300, years=1.0, routes=60, end=None, seed=1):
+    """
+    Fills the current db.DB_PATH (expected empty).  Returns row counts.
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    start = end - timedelta(days=int(365 * years))
+    db.init_db()
+    counts = {}
+
+    with db.get_conn() as conn:
+        # -- parties and rates
+        conn.executemany(
+            "INSERT INTO party_master (party_name, mobile, marka, default_rate_per_kg, "
+            "default_rate_per_parcel) VALUES (?, ?, ?, ?, ?)",
+            [(f"PARTY {i:04d}", f"98{rng.randrange(10**8):08d}", f"M{i}",
+              round(rng.uniform(3, 8), 2), rng.choice((40, 50, 60)))
+             for i in range(parties)],
+        )
+        route_list = []
+        while len(route_list) < routes:
+            f, t = rng.sample(CITIES, 2)
+            if (f, t) not in route_list:
+                route_list.append((f, t))
+        rate_rows = [(None, f, t, "KG", round(rng.uniform(2.5, 9), 2)) for f, t in route_list]
+        for pid in rng.sample(range(1, parties + 1), parties // 5):
+            for f, t in rng.sample(route_list, 3):
+                rate_rows.append((pid, f, t, rng.choice(("KG", "PARCEL")),
+                                  round(rng.uniform(2, 60), 2)))
+        conn.executemany(
+            "INSERT INTO rate_master (party_id, from_city, to_city, rate_type, rate) "
+            "VALUES (?, ?, ?, ?, ?)", rate_rows)
+        counts["parties"], counts["rates"] = parties, len(rate_rows)
+    masters.invalidate()
+    index = rate_index()
+
+    # -- tokens, day by day
+    party_cum = zipf_weights(parties)
+    route_cum = zipf_weights(routes)
+    party_ids = list(range(1, parties + 1))
+    token_no = 0
+    tokens = []
+    day = start
+    while day <= end:
+        n = max(1, int(rng.gauss(per_day, per_day / 6)))
+        for _ in range(n):
+            pid = rng.choices(party_ids, cum_weights=party_cum)[0]
+            f, t = rng.choices(route_list, cum_weights=route_cum)[0]
+            rate_type = "PARCEL" if rng.random() < 0.2 else "KG"
+            rate = index.resolve(pid, f, t, rate_type)[0] or 5.0
+            weight = round(rng.lognormvariate(4, 1), 1)
+            packages = max(1, int(weight / rng.uniform(15, 40)))
+            when = datetime(day.year, day.month, day.day, rng.randint(8, 20), rng.randrange(60))
+            token_no += 1
+            tokens.append((
+                token_no, when.strftime(db.TOKEN_DT_FORMAT), when.strftime("%Y-%m-%d %H:%M"),
+                pid, f"PARTY {pid - 1:04d}", f"M{pid - 1}", f, t, weight, rate, rate_type,
+                round(amount_for(rate_type, rate, weight, packages), 2), packages,
+                f"98{rng.randrange(10**8):08d}",
+            ))
+        day += timedelta(days=1)
+
+    with db.get_conn() as conn:
+        _executemany_chunks(conn, INSERT_TOKEN_SQL, tokens)
+        counts["tokens"] = len(tokens)
+
+        # -- challans: per day and route, trucks of up to TRUCK_LOAD
+        cutoff = (end - timedelta(days=PENDING_DAYS)).isoformat()
+        groups = conn.execute("""
+            SELECT substr(datetime_iso, 1, 10), from_city, to_city, group_concat(id)
+            FROM tokens WHERE datetime_iso < ?
+            GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+        """, (cutoff,)).fetchall()
+        challans, links, challan_no = [], [], 0
+        for d, f, t, ids in groups:
+            ids = [int(x) for x in ids.split(",")]
+            for i in range(0, len(ids), TRUCK_LOAD):
+                challan_no += 1
+                y, m, dd = d.split("-")
+                challans.append((challan_no, challan_no, f"{dd}/{m}/{y}", d, f, t,
+                                 f"RJ{rng.randint(1, 40):02d} GA {rng.randrange(10000):04d}",
+                                 rng.choice((8000, 12000, 15000)), 500, 500, 0, 0))
+                links.extend((challan_no, tid) for tid in ids[i:i + TRUCK_LOAD])
+        _executemany_chunks(conn, """
+            INSERT INTO challan (id, challan_no, date, date_iso, from_city, to_city, truck_no,
+                                 hire, loading_hamali, unloading_hamali, other_exp, balance)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, challans)
+        _executemany_chunks(conn, "INSERT INTO challan_tokens (challan_id, token_id) "
+                                  "VALUES (?, ?)", links)
+        with db.transaction(conn):
+            conn.execute("""
+                UPDATE tokens SET status = 'LOADED',
+                       challan_id = (SELECT challan_id FROM challan_tokens WHERE token_id = tokens.id)
+                WHERE datetime_iso < ?
+            """, (cutoff,))
+        counts["challans"] = len(challans)
+
+        # -- month-end bills for every closed month but the last, which is
+        #    left for the billing run (and for the suite to time)
+        bill_before = unbilled_from(end).isoformat()
+        with db.transaction(conn):
+            conn.execute("""
+                INSERT INTO bills (party_id, from_date, to_date, subtotal, gst_percent,
+                                   gst_amount, total, created_at, created_iso)
+                SELECT party_id, substr(datetime_iso, 1, 7) || '-01',
+                       date(substr(datetime_iso, 1, 7) || '-01', '+1 month', '-1 day'),
+                       ROUND(SUM(amount), 2), 0, 0, ROUND(SUM(amount), 2), '',
+                       date(substr(datetime_iso, 1, 7) || '-01', '+1 month')
+                FROM tokens WHERE datetime_iso < ?
+                GROUP BY party_id, substr(datetime_iso, 1, 7)
+                ORDER BY 9, 1
+            """, (bill_before,))
+            bills = conn.execute("SELECT id, party_id, created_iso, total FROM bills "
+                                 "ORDER BY id").fetchall()
+            # bill numbers restart every financial year
+            numbers, numbered = {}, []
+            for bid, _, billed_on, _ in bills:
+                fy = db.financial_year(date.fromisoformat(billed_on))
+                numbers[fy] = numbers.get(fy, 0) + 1
+                shown = f"{billed_on[8:]}-{billed_on[5:7]}-{billed_on[:4]} 10:00 AM"
+                numbered.append((numbers[fy], shown, bid))
+            conn.executemany("UPDATE bills SET bill_no = ?, created_at = ? WHERE id = ?",
+                             numbered)
+            conn.execute("""
+                UPDATE tokens SET status = 'BILLED', bill_id = (
+                    SELECT b.id FROM bills b WHERE b.party_id = tokens.party_id
+                      AND b.from_date = substr(tokens.datetime_iso, 1, 7) || '-01')
+                WHERE datetime_iso < ?
+            """, (bill_before,))
+        counts["bills"] = len(bills)
+
+        payments = []
+        for _, pid, billed_on, total in bills:
+            paid_on = date.fromisoformat(billed_on) + timedelta(days=rng.randint(3, 40))
+            if paid_on > end or rng.random() < 0.1:
+                continue
+            share = rng.choice((1.0, 1.0, 1.0, 0.5, 0.8))
+            for part in (share,) if share == 1.0 else (share, 1 - share):
+                payments.append((pid, paid_on.strftime("%d/%m/%Y"), paid_on.isoformat(),
+                                 round(total * part, 2), rng.choice(PAYMENT_MODES), ""))
+        _executemany_chunks(conn, """
+            INSERT INTO payments (party_id, date, date_iso, amount, mode, remark)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, payments)
+        counts["payments"] = len(payments)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="database file to fill (must not exist)")
+    parser.add_argument("--parties", type=int, default=200)
+    parser.add_argument("--per-day", type=int, default=300, help="tokens per day (mean)")
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--routes", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists - generate into a new file")
+
+    db.DB_PATH = args.db
+    t0 = time.perf_counter()
+    counts = generate(args.parties, args.per_day, args.years, args.routes, seed=args.seed)
+    db.close_pool()
+    print(", ".join(f"{v} {k}" for k, v in counts.items())
+          + f" in {time.perf_counter() - t0:.1f}s -> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
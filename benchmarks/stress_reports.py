@@ -0,0 +1,224 @@
+# benchmarks/stress_reports.py
+# A clerk keeps booking tokens through writer.py while heavy reports run on
+# the read-only pool: full token exports, every party's ledger, the
+# outstanding and booking reports.  Compares the insert latency idle and
+# during the reports, checks a runaway report query is stopped by its
+# deadline and that a report connection cannot write.
+#   python -m benchmarks.stress_reports --db big.db       (an existing database, left as is)
+#   python -m benchmarks.stress_reports --per-day 1000 --years 2   (generated)
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import db
+import exports
+import writer
+from benchmarks.generate import generate
+from importer import INSERT_TOKEN_SQL
+
+IDLE_SECONDS = 5
+RUNAWAY_SQL = "SELECT COUNT(*) FROM tokens a, tokens b"
+
+REPORT_TOKENS_SQL = """
+    SELECT COALESCE(token_no, id), datetime, party_name, marka, from_city, to_city,
+           weight, rate, amount, packages, status
+    FROM tokens ORDER BY datetime_iso
+"""
+REPORT_BY_ROUTE_SQL = """
+    SELECT from_city, to_city, COUNT(*), SUM(weight), SUM(amount)
+    FROM tokens GROUP BY from_city, to_city ORDER BY 5 DESC
+"""
+
+
+def book_token():
+    now = datetime.now()
+    with db.get_conn() as conn, db.transaction(conn):
+        token_no = db.allocate_numbers(conn, "token")
+        conn.execute(INSERT_TOKEN_SQL, (
+            token_no, now.strftime(db.TOKEN_DT_FORMAT), now.strftime("%Y-%m-%d %H:%M"),
+            1, "PARTY 0000", "M0", "JAIPUR", "DELHI", 100.0, 5.0, "KG", 500.0, 4, "",
+        ))
+
+
+def book_tokens(stop, latencies):
+    """The booking counter: a token every couple of milliseconds until `stop` is set."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        writer.call(book_token)
+        latencies.append(time.perf_counter() - t0)
+        time.sleep(0.002)
+
+
+def with_clerk(fn):
+    """Runs fn() while book_tokens() runs; returns (fn's result, insert latencies)."""
+    stop, latencies = threading.Event(), []
+    clerk = threading.Thread(target=book_tokens, args=(stop, latencies))
+    clerk.start()
+    try:
+        result = fn()
+    finally:
+        stop.set()
+        clerk.join()
+    return result, latencies
+
+
+def export_tokens():
+    path, count = exports.export_query(REPORT_TOKENS_SQL, (), [f"c{i}" for i in range(11)],
+                                       "csv.gz", prefix="stress_")
+    os.remove(path)
+    return count
+
+
+def all_ledgers(parties):
+    start, end = date(2000, 1, 1), date.today()
+    rows = 0
+    for party_id in parties:
+        db.ledger_summary(party_id, start, end)
+        rows += sum(len(page) for page in db.iter_ledger(party_id, start, end))
+    return rows
+
+
+def summaries():
+    with db.get_read_conn() as conn:
+        rows = conn.execute(db.OUTSTANDING_SQL).fetchall()
+        rows += conn.execute(REPORT_BY_ROUTE_SQL).fetchall()
+    return len(rows)
+
+
+def run_reports(readers, parties):
+    """Every report once on each of `readers` threads.  Returns (rows read, seconds)."""
+    out, errors = [], []
+
+    def reader(n):
+        try:
+            share = parties[n::readers]
+            out.append(export_tokens() + all_ledgers(share) + summaries())
+        except Exception as e:      # reported by main()
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return sum(out), time.perf_counter() - t0
+
+
+def runaway(timeout):
+    """A cross join of tokens on the read pool: (stopped by the deadline?, seconds)."""
+    t0 = time.perf_counter()
+    try:
+        with db.get_read_conn(timeout) as conn:
+            conn.execute(RUNAWAY_SQL).fetchone()
+    except db.QueryTimeout:
+        return True, time.perf_counter() - t0
+    return False, time.perf_counter() - t0
+
+
+def read_only():
+    """True when a report connection refuses to write."""
+    try:
+        with db.get_read_conn() as conn:
+            conn.execute("UPDATE sequences SET last_value = last_value")
+    except sqlite3.OperationalError:
+        return True
+    return False
+
+
+def pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000 if ordered else 0.0
+
+
+def measure(readers, parties, timeout, idle_seconds=IDLE_SECONDS):
+    """Insert latencies idle and under the reports, the runaway query and a write
+    attempt on the read pool, against the current db.DB_PATH."""
+    _, idle = with_clerk(lambda: time.sleep(idle_seconds))
+    (rows, report_s), during = with_clerk(lambda: run_reports(readers, parties))
+    (stopped, runaway_s), _ = with_clerk(lambda: runaway(timeout))
+    return {
+        "idle": idle,
+        "during": during,
+        "rows": rows,
+        "report_s": report_s,
+        "stopped": stopped,
+        "runaway_s": runaway_s,
+        "refused": read_only(),
+    }
+
+
+def check(r, slack_ms):
+    """What went wrong in a measure() result; empty when nothing did."""
+    failures = []
+    if pct(r["during"], 0.95) > pct(r["idle"], 0.95) + slack_ms:
+        failures.append(f"p95 insert latency rose by more than {slack_ms} ms")
+    if not r["stopped"]:
+        failures.append("the runaway query was not stopped")
+    if not r["refused"]:
+        failures.append("a report connection could write")
+    return failures
+
+
+def latency_line(label, values):
+    return (f"{label:<16} {len(values):>6} inserts  p50 {pct(values, 0.5):6.2f} ms  "
+            f"p95 {pct(values, 0.95):6.2f} ms  max {pct(values, 1.0):7.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="existing database to report on (default: generate one)")
+    parser.add_argument("--parties", type=int, default=200)
+    parser.add_argument("--per-day", type=int, default=500)
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--readers", type=int, default=3, help="report threads")
+    parser.add_argument("--ledgers", type=int, default=40, help="parties whose ledgers are read")
+    parser.add_argument("--timeout", type=float, default=1.0,
+                        help="deadline of the runaway query, seconds")
+    parser.add_argument("--slack-ms", type=float, default=25.0,
+                        help="allowed rise of the p95 insert latency during the reports")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db:
+            db.DB_PATH = args.db
+        else:
+            db.DB_PATH = os.path.join(tmp, "tms.db")
+            t0 = time.perf_counter()
+            generate(args.parties, args.per_day, args.years, end=date.today())
+            print(f"generated in {time.perf_counter() - t0:.1f}s")
+        db.init_db()
+        with db.get_read_conn() as conn:
+            tokens = conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+            parties = [r[0] for r in conn.execute(
+                "SELECT party_id FROM party_balance ORDER BY token_total DESC LIMIT ?",
+                (args.ledgers,))]
+        print(f"database {db.DB_PATH}: {tokens:,} tokens, ledgers of {len(parties)} parties")
+
+        r = measure(args.readers, parties, args.timeout)
+        stats = db.pool_stats()
+        writer.shutdown()
+        db.close_pool()
+
+    print(f"reports   {r['report_s']:8.2f}s  {r['rows']:,} rows on {args.readers} "
+          f"read-only connections")
+    print(f"runaway   {r['runaway_s']:8.2f}s  {'stopped' if r['stopped'] else 'NOT stopped'} "
+          f"(deadline {args.timeout}s)")
+    print(f"pool      {stats}")
+    print(latency_line("inserts idle", r["idle"]))
+    print(latency_line("during reports", r["during"]))
+
+    failures = check(r, args.slack_ms)
+    if failures:
+        raise SystemExit("FAILED - " + "; ".join(failures))
+    print("OK - inserts kept their latency, runaway report stopped, report connections read-only")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/stress_sequences.py
+# Hammers db.allocate_numbers() from many threads on a scratch database and
+# checks that the handed-out numbers have no duplicates and no gaps.
+#   python -m benchmarks.stress_sequences [--threads 16 --per-thread 300]
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import db
+
+
+def worker(series, per_thread, out, errors):
+    rng = random.Random()
+    got = []
+    try:
+        while len(got) < per_thread:
+            count = min(rng.choice((1, 1, 1, 5, 20)), per_thread - len(got))
+            with db.get_conn() as conn, db.transaction(conn):
+                first = db.allocate_numbers(conn, series, count)
+                # an insert-sized pause inside the write transaction
+                time.sleep(rng.random() / 2000)
+            got.extend(range(first, first + count))
+    except Exception as e:          # reported by main()
+        errors.append(e)
+    out.append(got)
+
+
+def run(series, threads, per_thread):
+    """`threads` workers allocating `per_thread` numbers each on a scratch database."""
+    saved = db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "tms.db")
+        try:
+            db.init_db()
+
+            results, errors = [], []
+            workers = [threading.Thread(target=worker, args=(series, per_thread, results, errors))
+                       for _ in range(threads)]
+            t0 = time.perf_counter()
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+            elapsed = time.perf_counter() - t0
+        finally:
+            db.close_pool()
+            db.DB_PATH = saved
+
+    return {
+        "elapsed": elapsed,
+        "errors": errors,
+        "numbers": sorted(n for got in results for n in got),
+        "expected": threads * per_thread,
+    }
+
+
+def check(r):
+    """What went wrong in a run() result; empty when nothing did."""
+    failures = []
+    if r["errors"]:
+        failures.append(f"{len(r['errors'])} allocations failed, first: {r['errors'][0]!r}")
+    if len(r["numbers"]) != len(set(r["numbers"])):
+        failures.append("duplicate numbers handed out")
+    if sorted(set(r["numbers"])) != list(range(1, r["expected"] + 1)):
+        failures.append("gaps in the sequence")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--per-thread", type=int, default=300)
+    parser.add_argument("--series", default="token", choices=sorted(db.SEQUENCE_SOURCES))
+    args = parser.parse_args(argv)
+
+    r = run(args.series, args.threads, args.per_thread)
+    numbers, elapsed = r["numbers"], r["elapsed"]
+    dupes = len(numbers) - len(set(numbers))
+    print(f"{len(numbers)} numbers from {args.threads} threads in {elapsed:.2f}s "
+          f"({len(numbers) / elapsed:.0f}/s), errors={len(r['errors'])}, duplicates={dupes}")
+    failures = check(r)
+    if failures:
+        raise SystemExit("FAILED - " + "; ".join(failures))
+    print("OK - no duplicates, no gaps")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# benchmarks/stress_writer.py
+# 20 clerks at peak: each thread books tokens, loads its own tokens onto a
+# challan now and then and enters payments, all against one scratch
+# database.  Runs through writer.py (default) or with every clerk writing
+# directly through get_conn(), and checks that no submit was lost and the
+# token numbers have no gaps or duplicates.
+#   python -m benchmarks.stress_writer [--clerks 20 --per-clerk 200 --mode writer,direct]
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import db
+import writer
+from importer import INSERT_TOKEN_SQL
+
+CHALLAN_EVERY = 25              # tokens a clerk books before loading a truck
+PAYMENT_SHARE = 0.2
+
+
+def book_token(party_id, weight):
+    now = datetime.now()
+    with db.get_conn() as conn, db.transaction(conn):
+        token_no = db.allocate_numbers(conn, "token")
+        cur = conn.execute(INSERT_TOKEN_SQL, (
+            token_no, now.strftime(db.TOKEN_DT_FORMAT), now.strftime("%Y-%m-%d %H:%M"),
+            party_id, f"PARTY {party_id}", "M", "JAIPUR", "DELHI",
+            weight, 5.0, "KG", weight * 5.0, 1, "",
+        ))
+        return token_no, cur.lastrowid
+
+
+def enter_payment(party_id, amount):
+    today = date.today()
+    with db.get_conn() as conn:
+        return conn.execute(
+            "INSERT INTO payments (party_id, date, date_iso, amount, mode, remark) "
+            "VALUES (?,?,?,?,'CASH','')",
+            (party_id, today.strftime("%d/%m/%Y"), today.isoformat(), amount)).lastrowid
+
+
+def load_truck(token_ids):
+    challan, _ = db.create_challan(token_ids, {
+        "date": date.today().strftime("%d/%m/%Y"), "from_city": "JAIPUR", "to_city": "DELHI",
+        "truck_no": "RJ14 GA 0001", "hire": 8000})
+    return challan["challan_no"]
+
+
+def clerk(n, per_clerk, parties, do, out):
+    rng = random.Random(n)
+    mine, latencies, errors, done = [], [], [], {"tokens": [], "payments": 0, "challans": 0}
+    while len(done["tokens"]) < per_clerk:
+        if len(mine) >= CHALLAN_EVERY:
+            fn, args = load_truck, (mine,)
+        elif rng.random() < PAYMENT_SHARE:
+            fn, args = enter_payment, (rng.randint(1, parties), float(rng.randint(1, 50) * 100))
+        else:
+            fn, args = book_token, (rng.randint(1, parties), float(rng.randint(5, 500)))
+        t0 = time.perf_counter()
+        try:
+            result = do(fn, *args)
+        except Exception as e:      # counted and reported by main()
+            errors.append(e)
+            continue
+        finally:
+            latencies.append(time.perf_counter() - t0)
+        if fn is book_token:
+            done["tokens"].append(result[0])
+            mine.append(result[1])
+        elif fn is load_truck:
+            done["challans"] += 1
+            mine = []
+        else:
+            done["payments"] += 1
+        # a clerk types for a moment between saves
+        time.sleep(rng.random() / 500)
+    out.append((latencies, errors, done))
+
+
+def direct(fn, *args):
+    return fn(*args)
+
+
+def run(mode, clerks, per_clerk, parties):
+    saved = db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "tms.db")
+        try:
+            db.init_db()
+            with db.get_conn() as conn:
+                conn.executemany("INSERT INTO party_master (id, party_name) VALUES (?, ?)",
+                                 [(i, f"PARTY {i}") for i in range(1, parties + 1)])
+            writer.reset_stats()
+
+            do = writer.call if mode == "writer" else direct
+            out = []
+            threads = [threading.Thread(target=clerk, args=(n, per_clerk, parties, do, out))
+                       for n in range(clerks)]
+            t0 = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+            writer.shutdown()
+
+            with db.get_conn() as conn:
+                stored = {
+                    "tokens": conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0],
+                    "payments": conn.execute("SELECT COUNT(*) FROM payments").fetchone()[0],
+                    "challans": conn.execute("SELECT COUNT(*) FROM challan").fetchone()[0],
+                }
+        finally:
+            db.close_pool()
+            db.DB_PATH = saved
+
+    latencies = sorted(s for lat, _, _ in out for s in lat)
+    errors = [e for _, errs, _ in out for e in errs]
+    numbers = sorted(n for _, _, done in out for n in done["tokens"])
+    acked = {k: sum(done[k] if k != "tokens" else len(done[k]) for _, _, done in out)
+             for k in stored}
+    return {
+        "mode": mode,
+        "elapsed": elapsed,
+        "writes": len(latencies),
+        "latencies": latencies,
+        "errors": errors,
+        "locked": sum(1 for e in errors if isinstance(e, sqlite3.OperationalError)
+                      and "locked" in str(e)),
+        "numbers": numbers,
+        "acked": acked,
+        "stored": stored,
+        "writer": writer.stats() if mode == "writer" else None,
+    }
+
+
+def check(r):
+    """What went wrong in a run() result; empty when nothing did."""
+    failures, mode = [], r["mode"]
+    dupes = len(r["numbers"]) - len(set(r["numbers"]))
+    if r["acked"] != r["stored"]:
+        failures.append(f"{mode}: acknowledged writes and stored rows differ")
+    if dupes or r["numbers"] != list(range(1, len(r["numbers"]) + 1)):
+        failures.append(f"{mode}: token numbers have gaps or duplicates ({dupes} duplicates)")
+    if r["errors"]:
+        failures.append(f"{mode}: {len(r['errors'])} writes failed, first: {r['errors'][0]!r}")
+    return failures
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clerks", type=int, default=20)
+    parser.add_argument("--per-clerk", type=int, default=200, help="tokens each clerk books")
+    parser.add_argument("--parties", type=int, default=50)
+    parser.add_argument("--mode", default="writer", help="writer, direct or writer,direct")
+    parser.add_argument("--busy-ms", type=int, default=db.BUSY_TIMEOUT_MS,
+                        help="SQLite busy timeout for the direct clerks' connections")
+    args = parser.parse_args(argv)
+    db.BUSY_TIMEOUT_MS = args.busy_ms
+
+    failures = []
+    for mode in [m.strip() for m in args.mode.split(",") if m.strip()]:
+        r = run(mode, args.clerks, args.per_clerk, args.parties)
+        lat = r["latencies"]
+        print(f"{mode}: {r['writes']} writes from {args.clerks} clerks in {r['elapsed']:.2f}s "
+              f"({r['writes'] / r['elapsed']:.0f}/s)  latency p50 {pct(lat, 0.5):.1f} ms, "
+              f"p95 {pct(lat, 0.95):.1f} ms, max {pct(lat, 1.0):.1f} ms")
+        print(f"  errors={len(r['errors'])} (database is locked: {r['locked']})  "
+              f"acknowledged={r['acked']}  stored={r['stored']}")
+        if r["writer"]:
+            print(f"  writer: {r['writer']}")
+
+        failures += check(r)
+
+    if failures:
+        raise SystemExit("FAILED - " + "; ".join(failures))
+    print("OK - every write stored, token numbers without gaps or duplicates")
+
+
+if __name__ == "__main__":
+    main()
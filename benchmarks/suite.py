@@ -0,0 +1,310 @@
+# benchmarks/suite.py
+# Times the operations the pages perform on generated data sets of several
+# sizes (see benchmarks/generate.py) and writes a JSON + markdown report,
+# so two releases can be compared on the same machine.
+#   python -m benchmarks.suite --scales small,medium --out bench_report
+#   python -m benchmarks.suite --scales medium --baseline bench_report.json
+#
+# Each operation is run `repeat` times after one warm-up call; the report
+# keeps the median, p95 and best time plus the rows it touched.
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import db
+import documents
+import search
+from benchmarks.generate import generate, unbilled_from
+from importer import INSERT_TOKEN_SQL
+from reporting import bill_frame, bill_totals, records
+
+SCALES = {
+    "small": {"parties": 50, "per_day": 100, "years": 0.5},
+    "medium": {"parties": 200, "per_day": 300, "years": 1.0},
+    "large": {"parties": 500, "per_day": 1000, "years": 2.0},
+}
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHALLAN_TOKENS = 20             # tokens loaded per timed challan
+BATCH_BILTIES = 200
+
+
+def timed(fn, repeat):
+    """[seconds per call] for `repeat` calls after a warm-up; fn returns a row count."""
+    rows = fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = fn()
+        times.append(time.perf_counter() - t0)
+    return times, rows
+
+
+def summarize(times, rows):
+    ordered = sorted(times)
+    return {
+        "runs": len(times),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "rows": rows,
+    }
+
+
+# -------------------------
+#   OPERATIONS
+# -------------------------
+# Each builder gets the facts of the data set and returns a no-argument
+# callable that performs the operation once and returns the rows touched.
+
+def op_token_insert(ctx):
+    # 3_Token_Bilty: one token, numbered in its own transaction
+    def run():
+        now = datetime.now()
+        with db.get_conn() as conn, db.transaction(conn):
+            token_no = db.allocate_numbers(conn, "token")
+            conn.execute(INSERT_TOKEN_SQL, (
+                token_no, now.strftime(db.TOKEN_DT_FORMAT), now.strftime("%Y-%m-%d %H:%M"),
+                ctx["party_id"], ctx["party_name"], "M", ctx["from_city"], ctx["to_city"],
+                120.0, 5.0, "KG", 600.0, 4, "9800000000",
+            ))
+        return 1
+    return run
+
+
+def op_pending_page(ctx):
+    # 4_Challan: first page of the picker, unfiltered
+    return lambda: len(db.pending_tokens_page({})[0])
+
+
+def op_pending_route(ctx):
+    return lambda: len(db.pending_tokens_page(
+        {"from_city": ctx["from_city"], "to_city": ctx["to_city"]})[0])
+
+
+def op_challan_create(ctx):
+    # every call loads the next CHALLAN_TOKENS pending tokens
+    with db.get_conn() as conn:
+        ids = [r[0] for r in conn.execute(
+            "SELECT id FROM tokens WHERE status = 'PENDING' ORDER BY id").fetchall()]
+    batches = iter([ids[i:i + CHALLAN_TOKENS] for i in range(0, len(ids), CHALLAN_TOKENS)])
+    header = {"date": date.today().strftime("%d/%m/%Y"), "from_city": ctx["from_city"],
+              "to_city": ctx["to_city"], "truck_no": "RJ14 GA 0001", "driver_name": "",
+              "driver_mobile": "", "hire": 10000, "loading_hamali": 500,
+              "unloading_hamali": 500, "other_exp": 0}
+
+    def run():
+        _, rows = db.create_challan(next(batches), header)
+        return len(rows)
+    return run
+
+
+def op_bill_month(ctx):
+    # 6_Billing "Show Bill": the biggest party's unbilled month
+    start = ctx["bill_month"]
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+    def run():
+        with db.get_conn() as conn:
+            df = pd.read_sql_query(db.BILL_TOKENS_SQL, conn,
+                                   params=(ctx["party_id"], *db.iso_range(start, end)))
+        frame = bill_frame(df)
+        bill_totals(frame)
+        return len(records(frame))
+    return run
+
+
+def op_ledger_year(ctx):
+    # 7_Ledger: summary, then every page (as the export does)
+    start, end = ctx["end"] - timedelta(days=364), ctx["end"]
+
+    def run():
+        db.ledger_summary(ctx["party_id"], start, end)
+        return sum(len(page) for page in db.iter_ledger(ctx["party_id"], start, end))
+    return run
+
+
+def op_daily_report(ctx):
+    # 8_Reports: daily booking for the last month
+    params = db.iso_range(ctx["end"] - timedelta(days=30), ctx["end"])
+
+    def run():
+        with db.get_conn() as conn:
+            return len(pd.read_sql_query(db.DAILY_BOOKING_SQL, conn, params=params))
+    return run
+
+
+def op_outstanding(ctx):
+    def run():
+        with db.get_conn() as conn:
+            return len(pd.read_sql_query(db.OUTSTANDING_SQL, conn, index_col="party_name"))
+    return run
+
+
+def op_search_prefix(ctx):
+    # app.py search box: a two-letter prefix most tokens match (generated mobiles are 98...)
+    return lambda: len(search.search("98", "token")["rows"])
+
+
+def op_search_truck(ctx):
+    return lambda: len(search.search("rj14 ga", "challan")["rows"])
+
+
+def op_token_pdf(ctx):
+    token = next(documents.batch_tokens(1, 1))
+
+    def run():
+        documents.token_pdf(token)
+        return 1
+    return run
+
+
+def op_bilty_batch(ctx):
+    path = os.path.join(ctx["dir"], "bilties.pdf")
+    return lambda: documents.bilty_batch(path, documents.batch_tokens(1, BATCH_BILTIES))
+
+
+OPERATIONS = {
+    "token_insert": (op_token_insert, 50),
+    "pending_page": (op_pending_page, 20),
+    "pending_route": (op_pending_route, 20),
+    "challan_create": (op_challan_create, 10),
+    "bill_party_month": (op_bill_month, 10),
+    "ledger_party_year": (op_ledger_year, 5),
+    "daily_report": (op_daily_report, 20),
+    "outstanding_report": (op_outstanding, 20),
+    "search_prefix": (op_search_prefix, 20),
+    "search_truck": (op_search_truck, 20),
+    "token_pdf": (op_token_pdf, 20),
+    f"bilty_batch_{BATCH_BILTIES}": (op_bilty_batch, 3),
+}
+
+
+def dataset_facts(work_dir, end):
+    """The busiest party and route, which every operation is aimed at."""
+    with db.get_conn() as conn:
+        party_id, party_name = conn.execute("""
+            SELECT party_id, party_name FROM tokens
+            GROUP BY party_id ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone()
+        from_city, to_city = conn.execute("""
+            SELECT from_city, to_city FROM tokens
+            GROUP BY from_city, to_city ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone()
+    return {"dir": work_dir, "end": end, "party_id": party_id, "party_name": party_name,
+            "from_city": from_city, "to_city": to_city, "bill_month": unbilled_from(end)}
+
+
+def run_scale(name, params, repeat_factor=1.0, only=None):
+    end = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "tms.db")
+        t0 = time.perf_counter()
+        counts = generate(**params, end=end)
+        result = {
+            "params": params,
+            "rows": counts,
+            "generate_s": round(time.perf_counter() - t0, 2),
+            "db_mb": round(os.path.getsize(db.DB_PATH) / 2**20, 1),
+            "ops": {},
+        }
+        ctx = dataset_facts(tmp, end)
+        for op, (builder, repeat) in OPERATIONS.items():
+            if only and op not in only:
+                continue
+            times, rows = timed(builder(ctx), max(1, int(repeat * repeat_factor)))
+            result["ops"][op] = summarize(times, rows)
+            print(f"  {name:<7} {op:<20} {result['ops'][op]['median_ms']:>10.2f} ms")
+        db.close_pool()
+    return result
+
+
+def environment():
+    try:
+        rev = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = ""
+    return {
+        "revision": rev,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "pandas": pd.__version__,
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpu)",
+    }
+
+
+def markdown(report, baseline=None):
+    env = report["environment"]
+    lines = [f"# TMS benchmark {env['revision']}", "",
+             f"{env['created']} · Python {env['python']} · SQLite {env['sqlite']} · "
+             f"pandas {env['pandas']} · {env['machine']}"]
+    if baseline:
+        lines.append(f"\nCompared with {baseline['environment']['revision']} "
+                     f"({baseline['environment']['created']}); ratio = this / baseline median.")
+    for name, scale in report["scales"].items():
+        rows = ", ".join(f"{v} {k}" for k, v in scale["rows"].items())
+        lines += ["", f"## {name}", "",
+                  f"{rows} · {scale['db_mb']} MB · generated in {scale['generate_s']}s", ""]
+        base_ops = (baseline or {}).get("scales", {}).get(name, {}).get("ops", {})
+        head = "| operation | runs | median ms | p95 ms | min ms | rows |"
+        rule = "|---|---:|---:|---:|---:|---:|"
+        if base_ops:
+            head, rule = head + " ratio |", rule + "---:|"
+        lines += [head, rule]
+        for op, r in scale["ops"].items():
+            line = (f"| {op} | {r['runs']} | {r['median_ms']:.2f} | {r['p95_ms']:.2f} "
+                    f"| {r['min_ms']:.2f} | {r['rows']} |")
+            if base_ops:
+                old = base_ops.get(op, {}).get("median_ms")
+                line += f" {r['median_ms'] / old:.2f} |" if old else " - |"
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", default="small,medium",
+                        help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument("--ops", default="", help="comma separated subset of the operations")
+    parser.add_argument("--repeat-factor", type=float, default=1.0,
+                        help="scale every operation's repeat count")
+    parser.add_argument("--out", default="bench_report", help="writes OUT.json and OUT.md")
+    parser.add_argument("--baseline", help="an earlier OUT.json to compare against")
+    args = parser.parse_args(argv)
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale(s): {', '.join(unknown)}")
+    only = {o.strip() for o in args.ops.split(",") if o.strip()}
+    if only - set(OPERATIONS):
+        parser.error(f"unknown operation(s): {', '.join(sorted(only - set(OPERATIONS)))}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    report = {"environment": environment(), "scales": {}}
+    for name in scales:
+        print(f"{name}: {SCALES[name]}")
+        report["scales"][name] = run_scale(name, SCALES[name], args.repeat_factor, only)
+
+    with open(args.out + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(args.out + ".md", "w", encoding="utf-8") as f:
+        f.write(markdown(report, baseline))
+    print(f"-> {args.out}.json, {args.out}.md")
+
+
+if __name__ == "__main__":
+    main()
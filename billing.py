@@ -0,0 +1,274 @@
+# billing.py
+# Month-end billing run: bill every party with unbilled tokens in a date
+# range in one transaction, then render the bill PDFs in a process pool.
+#
+#   python manage.py bill-run --from 2025-04-01 --to 2025-04-30
+#   python manage.py bill-render 1041 1042      (PDFs again, from the bills rows)
+#
+# The bills are committed before any PDF is drawn, so a PDF that fails is
+# reported by bill number and rendered again later with render_saved_bills().
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from itertools import groupby
+
+import pandas as pd
+
+import writer
+from db import get_conn, get_read_conn, iso_range, transaction, allocate_numbers
+from reporting import bill_frame, bill_totals, records
+
+BILL_DIR = "bills"
+
+BILLABLE_TOKENS_SQL = """
+    SELECT
+        t.party_id,
+        p.party_name,
+        COALESCE(t.token_no, t.id) AS token_no,
+        t.datetime,
+        t.from_city,
+        t.to_city,
+        t.weight,
+        t.packages,
+        t.amount
+    FROM tokens t
+    JOIN party_master p ON p.id = t.party_id
+    WHERE t.datetime_iso >= ? AND t.datetime_iso < ?
+      AND t.status IN ('PENDING', 'LOADED')
+      AND t.bill_id IS NULL
+    ORDER BY t.party_id, t.datetime_iso
+"""
+
+# Balance of every party before the billing period (the bill's old balance):
+# what the last year close carried forward plus the live rows since then
+OPENING_BY_PARTY_SQL = """
+    SELECT party_id, SUM(amount)
+    FROM (
+        SELECT party_id, amount FROM opening_balances
+        WHERE as_of = (SELECT MAX(as_of) FROM opening_balances WHERE as_of <= :start)
+        UNION ALL
+        SELECT party_id, amount FROM tokens WHERE datetime_iso < :start
+        UNION ALL
+        SELECT party_id, -amount FROM payments WHERE date_iso < :start
+    )
+    WHERE party_id IS NOT NULL
+    GROUP BY party_id
+"""
+
+# A saved bill and its tokens, to draw its PDF again
+SAVED_BILLS_SQL = """
+    SELECT b.id, b.bill_no, b.party_id, p.party_name, b.from_date, b.to_date,
+           b.gst_percent, b.gst_amount
+    FROM bills b
+    JOIN party_master p ON p.id = b.party_id
+    WHERE b.bill_no IN (SELECT value FROM json_each(?))
+    ORDER BY b.bill_no
+"""
+
+SAVED_BILL_TOKENS_SQL = """
+    SELECT COALESCE(token_no, id) AS token_no, datetime, from_city, to_city,
+           weight, packages, amount
+    FROM tokens
+    WHERE bill_id = ?
+    ORDER BY datetime_iso
+"""
+
+# Only LOADED tokens become BILLED; a PENDING token keeps its status (it
+# still has to go on a challan) and just gets its bill_id
+MARK_BILLED_SQL = """
+    UPDATE tokens SET bill_id = ?,
+                      status = CASE status WHEN 'LOADED' THEN 'BILLED' ELSE status END
+    WHERE party_id = ?
+      AND datetime_iso >= ? AND datetime_iso < ?
+      AND status IN ('PENDING', 'LOADED')
+      AND bill_id IS NULL
+"""
+
+
+def create_bills(start_dt, end_dt, gst_percent=0.0, party_ids=None):
+    """
+    Bills every party that has unbilled PENDING/LOADED tokens in the range.
+    Selection, bill numbering (a block from the 'bill' sequence), the bills
+    rows and the token updates all happen in one BEGIN IMMEDIATE
+    transaction, so two runs can never hand out the same bill_no or bill a
+    token twice.
+
+    Returns one job dict per bill (header + rows) for render_bills().
+    """
+    start, end = iso_range(start_dt, end_dt)
+    created_at = datetime.now()
+    jobs = []
+
+    with get_conn() as conn, transaction(conn):
+        cur = conn.cursor()
+        fetched = cur.execute(BILLABLE_TOKENS_SQL, (start, end)).fetchall()
+        opening = dict(cur.execute(OPENING_BY_PARTY_SQL, {"start": start}).fetchall())
+
+        groups = [(pid, list(rows)) for pid, rows in groupby(fetched, key=lambda r: r[0])
+                  if party_ids is None or pid in party_ids]
+        if not groups:
+            return jobs
+        # one consecutive block of bill numbers for the whole run
+        bill_no = allocate_numbers(conn, "bill", len(groups), on=created_at.date()) - 1
+
+        for party_id, party_rows in groups:
+            df = bill_frame(pd.DataFrame(
+                [r[2:] for r in party_rows],
+                columns=["token_no", "datetime", "from_city", "to_city",
+                         "weight", "packages", "amount"],
+            ))
+            totals = bill_totals(df)
+            subtotal = totals["total_amount"]
+            gst_amount = round(subtotal * gst_percent / 100, 2)
+            bill_no += 1
+
+            cur.execute("""
+                INSERT INTO bills (bill_no, party_id, from_date, to_date, subtotal,
+                                   gst_percent, gst_amount, total, created_at, created_iso)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                bill_no, party_id, start_dt.isoformat(), end_dt.isoformat(), subtotal,
+                gst_percent, gst_amount, subtotal + gst_amount,
+                created_at.strftime("%d-%m-%Y %I:%M %p"), created_at.date().isoformat(),
+            ))
+            bill_id = cur.lastrowid
+            cur.execute(MARK_BILLED_SQL, (bill_id, party_id, start, end))
+            jobs.append(_job(bill_id, bill_no, party_rows[0][1], start_dt, end_dt, df, totals,
+                             gst_percent, gst_amount, opening.get(party_id, 0.0)))
+    return jobs
+
+
+def _job(bill_id, bill_no, party_name, start_dt, end_dt, df, totals, gst_percent, gst_amount,
+         old_balance):
+    return {
+        "bill_id": bill_id,
+        "header": {
+            "bill_no": bill_no,
+            "party_name": party_name,
+            "from_date": start_dt.strftime("%d-%m-%Y"),
+            "to_date": end_dt.strftime("%d-%m-%Y"),
+            **totals,
+            "gst_percent": gst_percent,
+            "gst_amount": gst_amount,
+            "total": totals["total_amount"] + gst_amount,
+            "old_balance": old_balance,
+        },
+        "rows": records(df),
+    }
+
+
+def saved_bill_jobs(bill_nos):
+    """
+    Job dicts for bills already saved, rebuilt from their bills rows and
+    tokens, for rendering their PDFs again.  Unknown numbers are skipped.
+    """
+    jobs = []
+    with get_read_conn() as conn:
+        bills = conn.execute(SAVED_BILLS_SQL, (json.dumps(list(bill_nos)),)).fetchall()
+        # one whole-history opening query per billing period, not per bill
+        # (from_date is the ISO start of the period)
+        opening = {start: dict(conn.execute(OPENING_BY_PARTY_SQL, {"start": start}).fetchall())
+                   for start in {b[4] for b in bills}}
+        for bill_id, bill_no, party_id, party_name, from_date, to_date, gst_percent, \
+                gst_amount in bills:
+            start_dt, end_dt = date.fromisoformat(from_date), date.fromisoformat(to_date)
+            df = bill_frame(pd.read_sql_query(SAVED_BILL_TOKENS_SQL, conn, params=(bill_id,)))
+            jobs.append(_job(bill_id, bill_no, party_name, start_dt, end_dt, df, bill_totals(df),
+                             gst_percent, gst_amount, opening[from_date].get(party_id, 0.0)))
+    return jobs
+
+
+def bill_filename(header):
+    # "M/S SHARMA" must not turn into a sub-folder
+    name = re.sub(r'[\s\\/:*?"<>|]+', "_", header["party_name"])
+    return f"BILL_{header['bill_no']}_{name}.pdf"
+
+
+def _render_bill(job, out_dir):
+    # runs in a worker process
+    from utils.pdf_utils import bill_pdf
+
+    t0 = time.perf_counter()
+    buf = bill_pdf(job["header"], job["rows"])
+    path = os.path.join(out_dir, bill_filename(job["header"]))
+    with open(path, "wb") as f:
+        f.write(buf.getvalue() if hasattr(buf, "getvalue") else buf)
+    return job["bill_id"], path, time.perf_counter() - t0
+
+
+def render_bills(jobs, out_dir=BILL_DIR, workers=None):
+    """
+    Renders the bill PDFs in parallel.  Returns ({bill_id: (path, seconds)},
+    {bill_id: error}); one PDF failing does not stop the others.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    done, failed = {}, {}
+    if not jobs:
+        return done, failed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_render_bill, job, out_dir): job["bill_id"] for job in jobs}
+        for fut in as_completed(futures):
+            try:
+                bill_id, path, seconds = fut.result()
+            except Exception as e:      # reported per bill by _report()
+                failed[futures[fut]] = f"{type(e).__name__}: {e}"
+                continue
+            done[bill_id] = (path, seconds)
+    return done, failed
+
+
+def _report(jobs, rendered, failed, t_db, total):
+    parties = []
+    for job in jobs:
+        h = job["header"]
+        path, seconds = rendered.get(job["bill_id"], (None, 0.0))
+        parties.append({
+            "bill_no": h["bill_no"],
+            "party_name": h["party_name"],
+            "tokens": len(job["rows"]),
+            "amount": h["total"],
+            "render_seconds": round(seconds, 3),
+            "pdf": path,
+            "error": failed.get(job["bill_id"]),
+        })
+    n_tokens = sum(p["tokens"] for p in parties)
+    return {
+        "bills": len(jobs),
+        "tokens": n_tokens,
+        "failed": [p["bill_no"] for p in parties if p["error"]],
+        "db_seconds": round(t_db, 3),
+        "render_seconds": round(total - t_db, 3),
+        "total_seconds": round(total, 3),
+        "bills_per_second": round(len(jobs) / total, 1) if total else 0.0,
+        "tokens_per_second": round(n_tokens / total, 1) if total else 0.0,
+        "parties": parties,
+    }
+
+
+def run_billing(start_dt, end_dt, gst_percent=0.0, out_dir=BILL_DIR, workers=None,
+                party_ids=None):
+    """
+    The whole month-end run.  Returns a report dict with the throughput
+    figures, `failed` (bill numbers whose PDF could not be drawn; the bills
+    are saved, see render_saved_bills) and one line per party (bill no,
+    tokens, amount, render time, pdf or error).
+    """
+    t0 = time.perf_counter()
+    jobs = writer.call(create_bills, start_dt, end_dt, gst_percent, party_ids)
+    t_db = time.perf_counter() - t0
+
+    rendered, failed = render_bills(jobs, out_dir, workers)
+    return _report(jobs, rendered, failed, t_db, time.perf_counter() - t0)
+
+
+def render_saved_bills(bill_nos, out_dir=BILL_DIR, workers=None):
+    """The PDFs of saved bills drawn again; the same report as run_billing()."""
+    t0 = time.perf_counter()
+    jobs = saved_bill_jobs(bill_nos)
+    t_db = time.perf_counter() - t0
+
+    rendered, failed = render_bills(jobs, out_dir, workers)
+    return _report(jobs, rendered, failed, t_db, time.perf_counter() - t0)
@@ -1,17 +1,229 @@
 # db.py
+import json
+import os
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+import profiling
 
 DB_PATH = "tms.db"
 
+# ------------------------------------------------------------
+# Connection pool
+# ------------------------------------------------------------
+# Connections are opened once, tuned once, and then handed out again on
+# every rerun.  A thread that asks for a connection while it already holds
+# one gets the same connection back, so helpers can be nested freely.
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 20000            # negative cache_size = KiB
+MMAP_SIZE = 256 * 1024 * 1024
+
+_pool_lock = threading.Lock()
+_idle = []
+_local = threading.local()
+_stats = {"opened": 0, "reused": 0, "read_opened": 0, "read_reused": 0, "read_timeouts": 0}
+
+
+def _open_conn():
+    # ProfiledConnection only while profiling is on (see profiling.py)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                           timeout=BUSY_TIMEOUT_MS / 1000,
+                           factory=profiling.connection_class())
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _checkout():
+    with _pool_lock:
+        if _idle:
+            _stats["reused"] += 1
+            return _idle.pop()
+        _stats["opened"] += 1
+    return _open_conn()
+
+
+def _release(conn):
+    with _pool_lock:
+        if len(_idle) < POOL_SIZE:
+            _idle.append(conn)
+            return
+    conn.close()
+
 
+@contextmanager
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    """
+    with get_conn() as conn: ...
 
+    Commits when the outermost block exits cleanly, rolls back on error,
+    and returns the connection to the pool instead of closing it.
+    """
+    held = getattr(_local, "conn", None)
+    if held is not None:
+        _local.depth += 1
+        try:
+            yield held
+        finally:
+            _local.depth -= 1
+        return
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
+    conn = _checkout()
+    _local.conn, _local.depth = conn, 1
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _local.conn, _local.depth = None, 0
+        _release(conn)
+
+
+def pool_stats():
+    """Counters for the diagnostics: connections opened / reused / idle, both pools."""
+    with _pool_lock:
+        return dict(_stats, idle=len(_idle), read_idle=len(_read_idle))
+
+
+def close_pool():
+    with _pool_lock:
+        while _idle:
+            _idle.pop().close()
+        while _read_idle:
+            _read_idle.pop().close()
+
+
+# ------------------------------------------------------------
+# Read-only report connections
+# ------------------------------------------------------------
+# Reports, ledgers, bill views and exports read through a second pool of
+# connections opened with mode=ro and PRAGMA query_only: they can never
+# take the write lock, and in WAL mode each statement reads one snapshot
+# without waiting for, or holding up, the booking counter's inserts.
+#
+# Every block gets a deadline.  A progress handler checks it every
+# PROGRESS_STEPS virtual machine steps and interrupts a runaway report,
+# which then raises QueryTimeout instead of running on.
+
+READ_POOL_SIZE = 4
+REPORT_TIMEOUT_S = 30           # default deadline of a get_read_conn() block
+EXPORT_TIMEOUT_S = 600          # exports stream a whole year; they get longer
+PROGRESS_STEPS = 20000
+
+_read_idle = []
+_read_local = threading.local()
+
+
+class QueryTimeout(sqlite3.OperationalError):
+    """A report query ran past its deadline and was interrupted."""
+
+
+def _past_deadline():
+    deadline = getattr(_read_local, "deadline", None)
+    return 1 if deadline is not None and time.monotonic() > deadline else 0
+
+
+def _open_read_conn():
+    uri = f"file:{quote(os.path.abspath(DB_PATH))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                           timeout=BUSY_TIMEOUT_MS / 1000,
+                           factory=profiling.connection_class())
+    conn.execute("PRAGMA query_only=ON")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.set_progress_handler(_past_deadline, PROGRESS_STEPS)
+    return conn
+
+
+@contextmanager
+def get_read_conn(timeout=REPORT_TIMEOUT_S):
+    """
+    with get_read_conn() as conn: ...   (SELECTs only)
+
+    A pooled read-only connection.  Statements still running `timeout`
+    seconds after the outermost block started raise QueryTimeout.  Nested
+    blocks on the same thread share the connection and the deadline.
+    """
+    held = getattr(_read_local, "conn", None)
+    if held is not None:
+        yield held
+        return
+
+    with _pool_lock:
+        conn = _read_idle.pop() if _read_idle else None
+        _stats["read_reused" if conn else "read_opened"] += 1
+    conn = conn or _open_read_conn()
+    _read_local.conn = conn
+    _read_local.deadline = time.monotonic() + timeout if timeout else None
+    try:
+        yield conn
+    except sqlite3.OperationalError as e:
+        if str(e) == "interrupted" and _past_deadline():
+            with _pool_lock:
+                _stats["read_timeouts"] += 1
+            raise QueryTimeout(f"report query stopped after {timeout}s") from e
+        raise
+    finally:
+        _read_local.conn = _read_local.deadline = None
+        if conn.in_transaction:
+            conn.rollback()
+        with _pool_lock:
+            if len(_read_idle) < READ_POOL_SIZE:
+                _read_idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+
+# ------------------------------------------------------------
+# Schema
+# ------------------------------------------------------------
+# The schema is versioned with PRAGMA user_version; see MIGRATIONS below.
+
+# The tokens layout every page writes.  Older databases carry one of two
+# earlier layouts (see _reconcile_tokens).
+TOKEN_COLUMNS = [
+    ("token_no", "INTEGER"),
+    ("datetime", "TEXT"),
+    ("party_id", "INTEGER"),
+    ("party_name", "TEXT"),
+    ("consignor", "TEXT"),
+    ("consignee", "TEXT"),
+    ("marka", "TEXT"),
+    ("from_city", "TEXT"),
+    ("to_city", "TEXT"),
+    ("weight", "REAL"),
+    ("packages", "INTEGER"),
+    ("rate", "REAL"),
+    ("rate_type", "TEXT"),
+    ("amount", "REAL"),
+    ("truck_no", "TEXT"),
+    ("driver_name", "TEXT"),
+    ("driver_mobile", "TEXT"),
+    ("status", "TEXT DEFAULT 'PENDING'"),   # 'PENDING', 'LOADED', 'DELIVERED', 'BILLED'
+    ("challan_id", "INTEGER"),
+    ("bill_id", "INTEGER"),
+]
+
+# old name -> current name (init_db used to create date_time / pkgs)
+TOKEN_RENAMED_COLUMNS = {"date_time": "datetime", "pkgs": "packages"}
+
+
+def _create_base_tables(cur):
 
     # 1) Party Master
     cur.execute("""
@@ -50,28 +262,11 @@ def init_db():
     """)
 
     # 4) Token / Bilty Table
-    cur.execute("""
+    columns = ",\n        ".join(f"{name} {decl}" for name, decl in TOKEN_COLUMNS)
+    cur.execute(f"""
     CREATE TABLE IF NOT EXISTS tokens (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        token_no INTEGER,
-        date_time TEXT,
-        party_id INTEGER,
-        consignor TEXT,
-        consignee TEXT,
-        marka TEXT,
-        from_city TEXT,
-        to_city TEXT,
-        weight REAL,
-        pkgs INTEGER,
-        rate REAL,
-        rate_type TEXT,
-        amount REAL,
-        truck_no TEXT,
-        driver_name TEXT,
-        driver_mobile TEXT,
-        status TEXT,          -- 'PENDING', 'LOADED', 'DELIVERED', 'BILLED'
-        challan_id INTEGER,
-        bill_id INTEGER,
+        {columns},
         FOREIGN KEY(party_id) REFERENCES party_master(id)
     )
     """)
@@ -136,61 +331,1229 @@ def init_db():
     )
     """)
 
+
+def _reconcile_tokens(cur):
+    """
+    Brings a tokens table of either older layout to TOKEN_COLUMNS: the one
+    the Token / Bilty page used to create (no token_no / challan_id ...)
+    and the one init_db used to create (date_time, pkgs, no party_name).
+    """
+    columns = table_columns(cur, "tokens")
+    for old, new in TOKEN_RENAMED_COLUMNS.items():
+        if old in columns and new not in columns:
+            cur.execute(f"ALTER TABLE tokens RENAME COLUMN {old} TO {new}")
+        elif old in columns:
+            cur.execute(f"UPDATE tokens SET {new} = {old} WHERE {new} IS NULL")
+    columns = table_columns(cur, "tokens")
+    for name, decl in TOKEN_COLUMNS:
+        if name not in columns:
+            cur.execute(f"ALTER TABLE tokens ADD COLUMN {name} {decl}")
+    cur.execute("""
+        UPDATE tokens SET party_name =
+            (SELECT party_name FROM party_master WHERE id = tokens.party_id)
+        WHERE party_name IS NULL AND party_id IS NOT NULL
+    """)
+
+
+def _create_sequences(cur):
+    # Number series (token / challan / bill counters)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sequences (
+        series TEXT NOT NULL,
+        fy TEXT NOT NULL DEFAULT '',
+        last_value INTEGER NOT NULL,
+        PRIMARY KEY (series, fy)
+    )
+    """)
+
+
+# ------------------------------------------------------------
+# Normalized dates
+# ------------------------------------------------------------
+# The pages store human formatted text ("05-10-2025 03:45 PM" for tokens,
+# "05/10/2025" for payments and challans).  Every table also carries an
+# ISO-8601 copy that sorts correctly and is what queries filter on:
+#   tokens.datetime_iso  'YYYY-MM-DD HH:MM'
+#   payments.date_iso / challan.date_iso / bills.created_iso  'YYYY-MM-DD'
+
+TOKEN_DT_FORMAT = "%d-%m-%Y %I:%M %p"
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%y")
+
+# table -> (iso column, source text columns in order of preference)
+ISO_DATE_COLUMNS = {
+    "tokens": ("datetime_iso", ("datetime",)),
+    "payments": ("date_iso", ("date",)),
+    "challan": ("date_iso", ("date",)),
+    "bills": ("created_iso", ("created_at",)),
+}
+
+
+def parse_date(text):
+    """'05/10/2025' style text -> '2025-10-05', or None if unreadable."""
+    text = (text or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_token_datetime(text):
+    """'05-10-2025 03:45 PM' -> '2025-10-05 15:45' (falls back to the date)."""
+    text = (text or "").strip()
+    try:
+        return datetime.strptime(text, TOKEN_DT_FORMAT).strftime("%Y-%m-%d %H:%M")
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            pass
+    day = parse_date(text.split(" ")[0])
+    return f"{day} 00:00" if day else None
+
+
+def iso_range(start_dt, end_dt):
+    """Half-open ISO bounds [start, day after end) for a date-range filter."""
+    return start_dt.isoformat(), (end_dt + timedelta(days=1)).isoformat()
+
+
+def _add_date_columns(cur):
+    """
+    Adds the ISO column to each table and backfills it once, at the moment
+    the column is created.  Rows written afterwards fill it themselves.
+    """
+    for table, (iso_col, sources) in ISO_DATE_COLUMNS.items():
+        columns = table_columns(cur, table)
+        if iso_col in columns:
+            continue
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {iso_col} TEXT")
+        source = next((c for c in sources if c in columns), None)
+        if source is None:
+            continue
+        parse = parse_token_datetime if table == "tokens" else parse_date
+        rows = cur.execute(
+            f"SELECT id, {source} FROM {table} WHERE {source} IS NOT NULL"
+        ).fetchall()
+        cur.executemany(
+            f"UPDATE {table} SET {iso_col} = ? WHERE id = ?",
+            [(parse(text), rid) for rid, text in rows],
+        )
+
+
+# ------------------------------------------------------------
+# Indexes
+# ------------------------------------------------------------
+# (name, table, columns).  A migration step that adds an index re-runs
+# _create_indexes(), which creates whichever are missing.
+
+INDEXES = [
+    ("idx_tokens_party_day", "tokens", ("party_id", "datetime_iso")),
+    ("idx_tokens_status_day", "tokens", ("status", "datetime_iso")),
+    ("idx_tokens_status_route", "tokens", ("status", "from_city", "to_city", "datetime_iso")),
+    ("idx_tokens_day", "tokens", ("datetime_iso",)),
+    ("idx_tokens_token_no", "tokens", ("token_no",)),
+    ("idx_challan_no", "challan", ("challan_no",)),
+    ("idx_challan_day", "challan", ("date_iso",)),
+    ("idx_challan_tokens_challan", "challan_tokens", ("challan_id",)),
+    ("idx_challan_tokens_token", "challan_tokens", ("token_id",)),
+    ("idx_bills_no", "bills", ("bill_no",)),
+    ("idx_bills_party_day", "bills", ("party_id", "created_iso")),
+    ("idx_payments_party_day", "payments", ("party_id", "date_iso")),
+]
+
+# Superseded by the *_day indexes on the ISO date columns.
+RETIRED_INDEXES = [
+    "idx_tokens_party_dt", "idx_tokens_status_dt",
+    "idx_bills_party", "idx_payments_party_date",
+]
+
+
+def table_columns(cur, table):
+    return {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}
+
+
+def table_exists(cur, name):
+    return cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                       (name,)).fetchone() is not None
+
+
+def _create_indexes(cur):
+    for name in RETIRED_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+    for name, table, cols in INDEXES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(cols)})")
+
+
+# ------------------------------------------------------------
+# Party balance summary
+# ------------------------------------------------------------
+# party_balance holds the running totals per party and is kept current by
+# triggers on tokens and payments, so reading a balance is one row lookup.
+# check_party_balances() recomputes from the raw tables and reports drift.
+
+# source table -> party_balance column it feeds
+BALANCE_SOURCES = {"tokens": "token_total", "payments": "paid_total"}
+
+_BALANCE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_balance_ins AFTER INSERT ON {table}
+    WHEN NEW.party_id IS NOT NULL
+    BEGIN
+        INSERT INTO party_balance (party_id, {col}) VALUES (NEW.party_id, COALESCE(NEW.amount, 0))
+        ON CONFLICT(party_id) DO UPDATE SET {col} = {col} + excluded.{col};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_balance_del AFTER DELETE ON {table}
+    WHEN OLD.party_id IS NOT NULL
+    BEGIN
+        UPDATE party_balance SET {col} = {col} - COALESCE(OLD.amount, 0)
+        WHERE party_id = OLD.party_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_balance_upd AFTER UPDATE OF party_id, amount ON {table}
+    BEGIN
+        UPDATE party_balance SET {col} = {col} - COALESCE(OLD.amount, 0)
+        WHERE party_id = OLD.party_id;
+        INSERT INTO party_balance (party_id, {col})
+        SELECT NEW.party_id, COALESCE(NEW.amount, 0) WHERE NEW.party_id IS NOT NULL
+        ON CONFLICT(party_id) DO UPDATE SET {col} = {col} + excluded.{col};
+    END
+    """,
+]
+
+_BALANCE_FROM_RAW_SQL = """
+    SELECT party_id, SUM(token_total), SUM(paid_total)
+    FROM (
+        SELECT party_id, amount AS token_total, 0 AS paid_total FROM tokens
+        UNION ALL
+        SELECT party_id, 0, amount FROM payments{carried}
+    )
+    WHERE party_id IS NOT NULL
+    GROUP BY party_id
+"""
+
+# Totals of the archived years, carried by the latest financial-year close
+_BALANCE_CARRIED = """
+        UNION ALL
+        SELECT party_id, token_total, paid_total FROM opening_balances
+        WHERE as_of = (SELECT MAX(as_of) FROM opening_balances)"""
+
+
+def _balance_from_raw_sql(cur):
+    # opening_balances only exists from migration 8 on
+    carried = _BALANCE_CARRIED if table_exists(cur, "opening_balances") else ""
+    return _BALANCE_FROM_RAW_SQL.format(carried=carried)
+
+
+def _create_party_balance(cur):
+    is_new = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='party_balance'"
+    ).fetchone() is None
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS party_balance (
+        party_id INTEGER PRIMARY KEY,
+        token_total REAL NOT NULL DEFAULT 0,
+        paid_total REAL NOT NULL DEFAULT 0
+    )
+    """)
+    for table, col in BALANCE_SOURCES.items():
+        for trigger in _BALANCE_TRIGGERS:
+            cur.execute(trigger.format(table=table, col=col))
+    if is_new:
+        rebuild_party_balance(cur)
+
+
+def rebuild_party_balance(cur):
+    cur.execute("DELETE FROM party_balance")
+    cur.execute("INSERT INTO party_balance (party_id, token_total, paid_total) "
+                + _balance_from_raw_sql(cur))
+
+
+def check_party_balances(fix=False, tolerance=0.005):
+    """
+    Recomputes every party's totals from tokens and payments (plus the
+    totals carried from archived years) and compares
+    them with party_balance.  Returns [(party_id, stored, actual)] for the
+    parties that differ; with fix=True the table is rebuilt afterwards.
+    """
+    with get_conn() as conn:
+        actual = {pid: (tok or 0) - (paid or 0)
+                  for pid, tok, paid in conn.execute(_balance_from_raw_sql(conn))}
+        stored = {pid: tok - paid for pid, tok, paid in conn.execute(
+            "SELECT party_id, token_total, paid_total FROM party_balance")}
+        diffs = []
+        for pid in sorted(set(actual) | set(stored)):
+            a, s = actual.get(pid, 0.0), stored.get(pid, 0.0)
+            if abs(a - s) > tolerance:
+                diffs.append((pid, s, a))
+        if fix and diffs:
+            rebuild_party_balance(conn.cursor())
+    return diffs
+
+
+# ------------------------------------------------------------
+# Daily booking rollup
+# ------------------------------------------------------------
+# One row per day x party x route with token count, weight, packages and
+# amount, maintained by triggers on tokens.  Only the columns that feed the
+# rollup fire the update trigger, so loading/billing a token (a status
+# change) costs nothing here.  NULL party / city are stored as 0 / '' so
+# that the primary key groups them.
+
+_ROLLUP_KEY_NEW = ("substr(NEW.datetime_iso, 1, 10), COALESCE(NEW.party_id, 0), "
+                   "COALESCE(NEW.from_city, ''), COALESCE(NEW.to_city, '')")
+
+_ROLLUP_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_tokens_rollup_ins AFTER INSERT ON tokens
+    WHEN NEW.datetime_iso IS NOT NULL
+    BEGIN
+        INSERT INTO daily_booking_summary
+            (day, party_id, from_city, to_city, tokens, weight, packages, amount)
+        VALUES ({key_new}, 1, COALESCE(NEW.weight, 0), COALESCE(NEW.packages, 0),
+                COALESCE(NEW.amount, 0))
+        ON CONFLICT(day, party_id, from_city, to_city) DO UPDATE SET
+            tokens = tokens + 1,
+            weight = weight + excluded.weight,
+            packages = packages + excluded.packages,
+            amount = amount + excluded.amount;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_tokens_rollup_del AFTER DELETE ON tokens
+    WHEN OLD.datetime_iso IS NOT NULL
+    BEGIN
+        UPDATE daily_booking_summary SET
+            tokens = tokens - 1,
+            weight = weight - COALESCE(OLD.weight, 0),
+            packages = packages - COALESCE(OLD.packages, 0),
+            amount = amount - COALESCE(OLD.amount, 0)
+        WHERE day = substr(OLD.datetime_iso, 1, 10)
+          AND party_id = COALESCE(OLD.party_id, 0)
+          AND from_city = COALESCE(OLD.from_city, '')
+          AND to_city = COALESCE(OLD.to_city, '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_tokens_rollup_upd
+    AFTER UPDATE OF datetime_iso, party_id, from_city, to_city, weight, packages, amount ON tokens
+    BEGIN
+        UPDATE daily_booking_summary SET
+            tokens = tokens - 1,
+            weight = weight - COALESCE(OLD.weight, 0),
+            packages = packages - COALESCE(OLD.packages, 0),
+            amount = amount - COALESCE(OLD.amount, 0)
+        WHERE OLD.datetime_iso IS NOT NULL
+          AND day = substr(OLD.datetime_iso, 1, 10)
+          AND party_id = COALESCE(OLD.party_id, 0)
+          AND from_city = COALESCE(OLD.from_city, '')
+          AND to_city = COALESCE(OLD.to_city, '');
+        INSERT INTO daily_booking_summary
+            (day, party_id, from_city, to_city, tokens, weight, packages, amount)
+        SELECT {key_new}, 1, COALESCE(NEW.weight, 0), COALESCE(NEW.packages, 0),
+               COALESCE(NEW.amount, 0)
+        WHERE NEW.datetime_iso IS NOT NULL
+        ON CONFLICT(day, party_id, from_city, to_city) DO UPDATE SET
+            tokens = tokens + 1,
+            weight = weight + excluded.weight,
+            packages = packages + excluded.packages,
+            amount = amount + excluded.amount;
+    END
+    """,
+]
+
+
+def _create_daily_booking_summary(cur):
+    is_new = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_booking_summary'"
+    ).fetchone() is None
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS daily_booking_summary (
+        day TEXT NOT NULL,
+        party_id INTEGER NOT NULL,
+        from_city TEXT NOT NULL,
+        to_city TEXT NOT NULL,
+        tokens INTEGER NOT NULL DEFAULT 0,
+        weight REAL NOT NULL DEFAULT 0,
+        packages INTEGER NOT NULL DEFAULT 0,
+        amount REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, party_id, from_city, to_city)
+    )
+    """)
+    for trigger in _ROLLUP_TRIGGERS:
+        cur.execute(trigger.format(key_new=_ROLLUP_KEY_NEW))
+    if is_new:
+        rebuild_daily_booking_summary(cur)
+
+
+def rebuild_daily_booking_summary(cur, start_dt=None, end_dt=None):
+    """
+    Recomputes the rollup from tokens, for all days or for the days in
+    [start_dt, end_dt].  Returns the number of summary rows written.
+    """
+    where, params = "", ()
+    if start_dt is not None and end_dt is not None:
+        params = iso_range(start_dt, end_dt)
+        where = "WHERE day >= ? AND day < ?"
+    cur.execute(f"DELETE FROM daily_booking_summary {where}", params)
+    cur.execute(f"""
+        INSERT INTO daily_booking_summary
+            (day, party_id, from_city, to_city, tokens, weight, packages, amount)
+        SELECT day, party_id, from_city, to_city,
+               COUNT(*), SUM(weight), SUM(pkgs), SUM(amount)
+        FROM (
+            SELECT substr(datetime_iso, 1, 10) AS day,
+                   COALESCE(party_id, 0) AS party_id,
+                   COALESCE(from_city, '') AS from_city,
+                   COALESCE(to_city, '') AS to_city,
+                   COALESCE(weight, 0) AS weight,
+                   COALESCE(packages, 0) AS pkgs,
+                   COALESCE(amount, 0) AS amount
+            FROM tokens
+            WHERE datetime_iso IS NOT NULL
+        )
+        {where}
+        GROUP BY day, party_id, from_city, to_city
+    """, params)
+    return cur.rowcount
+
+
+# ------------------------------------------------------------
+# Financial-year archives
+# ------------------------------------------------------------
+# archive.close_year() moves a closed year's tokens, payments, challans and
+# bills into  <db folder>/archive/<db name>_<fy>.db  and records it in
+# `archives`.  Each party's lifetime totals up to the close are kept in
+# opening_balances (as_of = first day of the next year), so balances and
+# ledgers do not need the archived rows.  Queries over a date range attach
+# only the archives whose year overlaps it (attach_archives).
+
+ARCHIVE_DIR = "archive"
+MAX_ATTACHED = 8                # SQLite allows 10 attached databases per connection
+
+
+def _create_archive_tables(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS archives (
+        fy TEXT PRIMARY KEY,            -- '2024-25'
+        path TEXT NOT NULL,             -- relative to the live database's folder
+        start_iso TEXT NOT NULL,        -- first day of the year
+        end_iso TEXT NOT NULL,          -- first day after it
+        closed_at TEXT NOT NULL,
+        counts TEXT NOT NULL            -- JSON {table: rows moved}
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS opening_balances (
+        party_id INTEGER NOT NULL,
+        as_of TEXT NOT NULL,            -- balance at the start of this day
+        fy TEXT NOT NULL,               -- the year whose close carried it
+        token_total REAL NOT NULL,      -- lifetime totals up to as_of
+        paid_total REAL NOT NULL,
+        amount REAL NOT NULL,           -- token_total - paid_total
+        PRIMARY KEY (party_id, as_of)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_opening_balances_day ON opening_balances (as_of)")
+
+
+def archive_schema(fy):
+    """'2024-25' -> 'fy2024_25', the name the archive is attached as."""
+    return "fy" + fy.replace("-", "_")
+
+
+def archive_path(fy):
+    folder, name = os.path.split(os.path.abspath(DB_PATH))
+    return os.path.join(folder, ARCHIVE_DIR, f"{os.path.splitext(name)[0]}_{fy}.db")
+
+
+def archived_years(start_iso, end_iso):
+    """Closed years overlapping [start_iso, end_iso), oldest first."""
+    with get_conn() as conn:
+        if not table_exists(conn, "archives"):
+            return []
+        return [fy for fy, in conn.execute(
+            "SELECT fy FROM archives WHERE start_iso < ? AND end_iso > ? ORDER BY fy",
+            (end_iso, start_iso))]
+
+
+def attach_archives(conn, years):
+    """
+    Attaches the archives of `years` to this pooled connection and returns
+    their schema names, e.g. ['fy2024_25'].  They stay attached for the
+    next query; archives it does not need are detached once MAX_ATTACHED
+    would be exceeded.  Must be called outside a transaction.
+    """
+    if not years:
+        return []
+    if len(years) > MAX_ATTACHED:
+        raise ValueError(f"at most {MAX_ATTACHED} closed years can be read at once "
+                         f"({len(years)} asked) - narrow the dates")
+    wanted = [archive_schema(fy) for fy in years]
+    attached = [r[1] for r in conn.execute("PRAGMA database_list") if r[1] not in ("main", "temp")]
+    missing = [fy for fy in years if archive_schema(fy) not in attached]
+    spare = [name for name in attached if name not in wanted]
+    while spare and len(attached) + len(missing) > MAX_ATTACHED:
+        name = spare.pop(0)
+        conn.execute(f"DETACH DATABASE {name}")
+        attached.remove(name)
+    for fy in missing:
+        conn.execute(f"ATTACH DATABASE ? AS {archive_schema(fy)}", (archive_path(fy),))
+    return wanted
+
+
+# ------------------------------------------------------------
+# Full-text search
+# ------------------------------------------------------------
+# One contentless FTS5 index per searchable table, kept current by
+# triggers; search.py queries them.  Each index holds the table's text
+# columns plus `keys`: truck numbers, mobiles and GST numbers again with
+# spaces, dashes, dots and slashes removed, so "RJ14GA" finds
+# "RJ14 GA 0001" and "9829012" finds "98290 12345".  Contentless means
+# deleting needs the old values, which the triggers pass from OLD.
+
+# table -> (index, indexed columns, columns repeated compacted in `keys`)
+SEARCH_SOURCES = {
+    "party_master": ("party_fts", ("party_name", "marka", "mobile", "gst_no"),
+                     ("mobile", "gst_no")),
+    "tokens": ("token_fts", ("marka", "consignor", "consignee", "truck_no", "driver_mobile"),
+               ("truck_no", "driver_mobile")),
+    "challan": ("challan_fts", ("truck_no", "driver_name", "driver_mobile"),
+                ("truck_no", "driver_mobile")),
+}
+
+# bm25 weight per indexed column, then `keys`: names and trucks outrank the rest
+SEARCH_WEIGHTS = {
+    "party_fts": (10, 5, 2, 2, 1),
+    "token_fts": (5, 3, 3, 5, 2, 1),
+    "challan_fts": (5, 3, 2, 1),
+}
+
+SEARCH_PREFIXES = "2 3 4"       # prefix indexes: 2-4 letter prefix queries are index lookups
+
+
+def _compact(expr):
+    for ch in " -./":
+        expr = f"replace({expr}, '{ch}', '')"
+    return expr
+
+
+def _search_values(table, row):
+    """SQL values for (rowid, columns..., keys) of `row` (NEW / OLD / a table alias)."""
+    _, cols, compact = SEARCH_SOURCES[table]
+    keys = " || ' ' || ".join(_compact(f"COALESCE({row}.{c}, '')") for c in compact)
+    return ", ".join([f"{row}.id", *(f"{row}.{c}" for c in cols), keys])
+
+
+def _search_triggers(table):
+    fts, cols, _ = SEARCH_SOURCES[table]
+    names = ", ".join(cols)
+    delete = (f"INSERT INTO {fts} ({fts}, rowid, {names}, keys) "
+              f"VALUES ('delete', {_search_values(table, 'OLD')});")
+    insert = (f"INSERT INTO {fts} (rowid, {names}, keys) "
+              f"VALUES ({_search_values(table, 'NEW')});")
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_ins AFTER INSERT ON {table} "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_del AFTER DELETE ON {table} "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_upd AFTER UPDATE OF {names} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+def _create_search_index(cur):
+    for table, (fts, cols, _) in SEARCH_SOURCES.items():
+        is_new = not table_exists(cur, fts)
+        cur.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {", ".join(cols)}, keys,
+                content='', prefix='{SEARCH_PREFIXES}',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        weights = ", ".join(str(w) for w in SEARCH_WEIGHTS[fts])
+        cur.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25({weights})')")
+        for trigger in _search_triggers(table):
+            cur.execute(trigger)
+        if is_new:
+            _fill_search_index(cur, table)
+
+
+def _fill_search_index(cur, table):
+    fts, cols, _ = SEARCH_SOURCES[table]
+    cur.execute(f"INSERT INTO {fts} (rowid, {', '.join(cols)}, keys) "
+                f"SELECT {_search_values(table, table)} FROM {table}")
+    return cur.rowcount
+
+
+def rebuild_search_index(cur):
+    """Re-indexes every searchable table from scratch.  Returns {index: rows}."""
+    counts = {}
+    for table, (fts, _, _) in SEARCH_SOURCES.items():
+        cur.execute(f"INSERT INTO {fts} ({fts}) VALUES ('delete-all')")
+        counts[fts] = _fill_search_index(cur, table)
+    return counts
+
+
+# ------------------------------------------------------------
+# Schema migrations
+# ------------------------------------------------------------
+# Ordered (version, description, step).  migrate() runs every step above
+# the database's PRAGMA user_version, each in its own BEGIN IMMEDIATE
+# transaction together with the version bump.  Databases made before
+# versioning start at 0 and may already have any of these objects, so the
+# steps tolerate that.  Append new steps; never edit one that has shipped.
+
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "reconcile the tokens layouts", _reconcile_tokens),
+    (3, "ISO date columns", _add_date_columns),
+    (4, "indexes", _create_indexes),
+    (5, "party_balance rollup", _create_party_balance),
+    (6, "daily_booking_summary rollup", _create_daily_booking_summary),
+    (7, "number sequences", _create_sequences),
+    (8, "financial-year archives", _create_archive_tables),
+    (9, "full-text search", _create_search_index),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_schema_lock = threading.Lock()
+_schema_version = {}            # DB_PATH -> version this process has ensured
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    """Applies the pending MIGRATIONS.  Returns [(version, description)] applied."""
+    applied = []
+    with get_conn() as conn:
+        for version, description, step in MIGRATIONS:
+            if version <= schema_version(conn):
+                continue
+            with transaction(conn):
+                # another process may have applied it while we waited
+                if version <= schema_version(conn):
+                    continue
+                step(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version}")
+            applied.append((version, description))
+    return applied
+
+
+def init_db():
+    """
+    Makes sure the schema is current.  The first call in a process runs
+    migrate() under a lock; every later call - each page rerun - is one
+    cached integer comparison.
+    """
+    if _schema_version.get(DB_PATH, 0) >= SCHEMA_VERSION:
+        return
+    with _schema_lock:
+        if _schema_version.get(DB_PATH, 0) < SCHEMA_VERSION:
+            migrate()
+            with get_conn() as conn:
+                _schema_version[DB_PATH] = schema_version(conn)
+
+
+# ------------------------------------------------------------
+# Transactions and number series
+# ------------------------------------------------------------
+@contextmanager
+def transaction(conn):
+    """
+    BEGIN IMMEDIATE ... COMMIT, so the write lock is taken up front and
+    read-then-write sequences cannot interleave with another writer.
+    Inside an already open transaction it becomes a SAVEPOINT instead.
+    """
+    if conn.in_transaction:
+        conn.execute("SAVEPOINT txn")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO txn")
+            conn.execute("RELEASE txn")
+            raise
+        conn.execute("RELEASE txn")
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
     conn.commit()
-    conn.close()
+
+
+# series -> (table, number column, ISO date column used for per-year seeding)
+SEQUENCE_SOURCES = {
+    "token": ("tokens", "token_no", "datetime_iso"),
+    "challan": ("challan", "challan_no", "date_iso"),
+    "bill": ("bills", "bill_no", "created_iso"),
+}
+
+# Series whose numbering restarts every financial year (April - March)
+FY_SERIES = {"bill"}
+
+
+def financial_year(on=None):
+    """date -> '2025-26' (Indian financial year, April to March)."""
+    on = on or date.today()
+    start = on.year if on.month >= 4 else on.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def _series_key(series, on):
+    if series not in SEQUENCE_SOURCES:
+        raise ValueError(f"unknown number series: {series}")
+    return series, financial_year(on) if series in FY_SERIES else ""
+
+
+def _sequence_seed(conn, series, fy):
+    # First use of a series: continue after the highest number already in
+    # the table (tokens were numbered by id before token_no existed).
+    table, col, day_col = SEQUENCE_SOURCES[series]
+    where, params = "", ()
+    if fy:
+        start = int(fy[:4])
+        where, params = f"WHERE {day_col} >= ? AND {day_col} < ?", (f"{start}-04-01", f"{start + 1}-04-01")
+    expr = f"COALESCE(MAX({col}), 0)"
+    if series == "token":
+        expr = f"MAX({expr}, COALESCE(MAX(id), 0))"
+    return conn.execute(f"SELECT {expr} FROM {table} {where}", params).fetchone()[0]
+
+
+def allocate_numbers(conn, series, count=1, on=None):
+    """
+    Takes the next `count` consecutive numbers of a series inside the
+    caller's transaction and returns the first one.  Call it in the same
+    transaction as the INSERT that uses the numbers: if that rolls back,
+    so does the allocation, and no gap is left behind.
+    """
+    key = _series_key(series, on)
+    with transaction(conn):
+        row = conn.execute(
+            "UPDATE sequences SET last_value = last_value + ? "
+            "WHERE series = ? AND fy = ? RETURNING last_value",
+            (count, *key),
+        ).fetchall()
+        if row:
+            last = row[0][0]
+        else:
+            last = _sequence_seed(conn, *key) + count
+            conn.execute("INSERT INTO sequences (series, fy, last_value) VALUES (?, ?, ?)",
+                         (*key, last))
+    return last - count + 1
+
+
+def pin_sequence(conn, series, on=None):
+    """
+    Makes sure a series has its sequences row, seeding it from the table if
+    it was never used, so its numbering no longer depends on the rows still
+    being there (archive.close_year moves them out).
+    """
+    key = _series_key(series, on)
+    conn.execute("INSERT OR IGNORE INTO sequences (series, fy, last_value) VALUES (?, ?, ?)",
+                 (*key, _sequence_seed(conn, *key)))
+
+
+def peek_next_number(series, on=None):
+    """The number the next allocation would get (display only)."""
+    key = _series_key(series, on)
+    with get_conn() as conn:
+        row = conn.execute(PAGE_QUERIES["sequence.peek"][0], key).fetchone()
+        last = row[0] if row else _sequence_seed(conn, *key)
+    return last + 1
 
 
 def get_next_token_no():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT COALESCE(MAX(token_no), 0) + 1 FROM tokens")
-    nxt = cur.fetchone()[0]
-    conn.close()
-    return nxt
+    return peek_next_number("token")
 
 
 def get_next_challan_no():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT COALESCE(MAX(challan_no), 0) + 1 FROM challan")
-    nxt = cur.fetchone()[0]
-    conn.close()
-    return nxt
+    return peek_next_number("challan")
 
 
 def get_next_bill_no():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT COALESCE(MAX(bill_no), 0) + 1 FROM bills")
-    nxt = cur.fetchone()[0]
-    conn.close()
-    return nxt
+    return peek_next_number("bill")
 
 
 def get_party_list():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, party_name, marka FROM party_master ORDER BY party_name")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with get_conn() as conn:
+        return conn.execute(
+            "SELECT id, party_name, marka FROM party_master ORDER BY party_name"
+        ).fetchall()
 
 
 def compute_party_balance(party_id: int):
     """
     Balance = (Total token amount) - (Total payments)
-    Very simple logic for now.
+    Read from the trigger-maintained party_balance row.
     """
-    conn = get_conn()
-    cur = conn.cursor()
+    with get_conn() as conn:
+        row = conn.execute(PAGE_QUERIES["balance.party"][0], (party_id,)).fetchone()
+    return row[0] if row else 0.0
 
-    cur.execute("SELECT COALESCE(SUM(amount),0) FROM tokens WHERE party_id=?",
-                (party_id,))
-    token_total = cur.fetchone()[0]
 
-    cur.execute("SELECT COALESCE(SUM(amount),0) FROM payments WHERE party_id=?",
-                (party_id,))
-    paid = cur.fetchone()[0]
+# ------------------------------------------------------------
+# Challan creation
+# ------------------------------------------------------------
+# A truck carries a few hundred tokens.  They are loaded with one UPDATE
+# over a JSON array of ids; only tokens still PENDING are touched, and its
+# RETURNING rows are both the optimistic check and the challan PDF rows.
+# A token billed while still PENDING (billing.py) goes straight to BILLED.
+# The unary + keeps the planner on rowid lookups for the ids: through
+# idx_tokens_status_* it would walk every PENDING token instead.
 
-    conn.close()
-    return token_total - paid
+CHALLAN_HEADER_FIELDS = (
+    "date", "from_city", "to_city", "truck_no", "driver_name", "driver_mobile",
+    "hire", "loading_hamali", "unloading_hamali", "other_exp",
+)
+
+LOAD_TOKENS_SQL = """
+    UPDATE tokens SET status = CASE WHEN bill_id IS NULL THEN 'LOADED' ELSE 'BILLED' END,
+                      challan_id = :challan_id
+    WHERE id IN (SELECT value FROM json_each(:ids))
+      AND +status = 'PENDING'
+    RETURNING
+        id,
+        COALESCE(token_no, id),
+        COALESCE(weight, 0),
+        COALESCE(amount, 0),
+        COALESCE((SELECT party_name FROM party_master WHERE id = tokens.party_id), '')
+"""
+
+
+class TokensNotPending(ValueError):
+    """Some selected tokens were loaded (or removed) by someone else meanwhile."""
+
+    def __init__(self, token_ids):
+        self.token_ids = sorted(token_ids)
+        super().__init__(f"tokens no longer pending: {self.token_ids}")
+
+
+def create_challan(token_ids, header):
+    """
+    Creates a challan for `token_ids` (tokens.id) in one BEGIN IMMEDIATE
+    transaction: challan number, challan row, token status + challan_id,
+    and the challan_tokens links.  `header` carries CHALLAN_HEADER_FIELDS.
+
+    Raises TokensNotPending - and writes nothing - if any token is no longer
+    PENDING, ValueError if the date is unreadable.  Returns (challan dict,
+    PDF rows ordered by token no).
+    """
+    token_ids = sorted({int(t) for t in token_ids})
+    if not token_ids:
+        raise ValueError("no tokens selected")
+    # a challan without date_iso would drop out of every date range and the year close
+    date_iso = parse_date(header.get("date"))
+    if date_iso is None:
+        raise ValueError(f"unreadable challan date: {header.get('date')!r}")
+    challan = {f: header.get(f) for f in CHALLAN_HEADER_FIELDS}
+    for f in ("hire", "loading_hamali", "unloading_hamali", "other_exp"):
+        challan[f] = challan[f] or 0.0
+
+    with get_conn() as conn, transaction(conn):
+        cur = conn.cursor()
+        challan["challan_no"] = allocate_numbers(conn, "challan")
+        cur.execute(f"""
+            INSERT INTO challan (challan_no, date_iso, {", ".join(CHALLAN_HEADER_FIELDS)})
+            VALUES (?, ?, {", ".join("?" * len(CHALLAN_HEADER_FIELDS))})
+        """, (challan["challan_no"], date_iso,
+              *(challan[f] for f in CHALLAN_HEADER_FIELDS)))
+        challan["challan_id"] = cur.lastrowid
+
+        loaded = cur.execute(LOAD_TOKENS_SQL, {
+            "challan_id": challan["challan_id"], "ids": json.dumps(token_ids),
+        }).fetchall()
+        if len(loaded) != len(token_ids):
+            raise TokensNotPending(set(token_ids) - {r[0] for r in loaded})
+
+        cur.executemany("INSERT INTO challan_tokens (challan_id, token_id) VALUES (?, ?)",
+                        [(challan["challan_id"], r[0]) for r in loaded])
+
+        challan["total_weight"] = sum(r[2] for r in loaded)
+        challan["total_amount"] = sum(r[3] for r in loaded)
+        challan["balance"] = challan["total_amount"] - sum(
+            challan[f] for f in ("hire", "loading_hamali", "unloading_hamali", "other_exp"))
+        cur.execute("UPDATE challan SET balance = ? WHERE id = ?",
+                    (challan["balance"], challan["challan_id"]))
+
+    rows = [{"token_no": r[1], "weight": r[2], "amount": r[3], "party_name": r[4]}
+            for r in sorted(loaded, key=lambda r: r[1])]
+    return challan, rows
+
+
+# ------------------------------------------------------------
+# Page queries
+# ------------------------------------------------------------
+# The hot-path SELECTs used by the pages live here so that
+# check_query_plans() inspects exactly what the pages run.
+
+# Challan picker: PENDING tokens one page at a time, oldest first, with
+# only the filters the user set.  Keyset pagination on (datetime_iso, id)
+# follows idx_tokens_status_day / idx_tokens_status_route, so every page
+# costs the same however many tokens are pending.
+#
+# Legacy tokens whose date text could not be parsed have no datetime_iso.
+# They come first, by id, while the cursor's day is '' (then the dated
+# ones follow), so they can still be loaded; a date filter leaves them out.
+PENDING_PAGE_SIZE = 200
+
+# `id` is what create_challan() takes; `token_no` is the number printed on the bilty
+PENDING_COLUMNS = ["id", "token_no", "datetime", "party_name", "marka", "from_city", "to_city",
+                   "weight", "packages", "amount"]
+
+PENDING_PAGE_SQL = """
+    SELECT
+        t.id,
+        COALESCE(t.token_no, t.id) AS token_no,
+        t.datetime,
+        p.party_name,
+        t.marka,
+        t.from_city,
+        t.to_city,
+        COALESCE(t.weight, 0),
+        COALESCE(t.packages, 0),
+        COALESCE(t.amount, 0),
+        COALESCE(t.datetime_iso, '')
+    FROM tokens t
+    LEFT JOIN party_master p ON p.id = t.party_id
+    WHERE t.status = 'PENDING'{filters}
+      AND {keyset}
+    ORDER BY t.datetime_iso, t.id
+    LIMIT :limit
+"""
+
+PENDING_KEYSET = "(t.datetime_iso, t.id) > (:after_d, :after_id)"
+UNDATED_KEYSET = "t.datetime_iso IS NULL AND t.id > :after_id"
+
+PENDING_FILTERS = {
+    "from_city": "t.from_city = :from_city",
+    "to_city": "t.to_city = :to_city",
+    "party_id": "t.party_id = :party_id",
+    "marka": "t.marka LIKE :marka || '%'",
+    "start": "t.datetime_iso >= :start",
+    "end": "t.datetime_iso < :end",
+}
+
+
+def pending_tokens_sql(filters, undated=False):
+    """PENDING_PAGE_SQL with a WHERE term for each filter that is set."""
+    terms = "".join(f"\n      AND {PENDING_FILTERS[k]}"
+                    for k in PENDING_FILTERS if filters.get(k) not in (None, ""))
+    return PENDING_PAGE_SQL.format(filters=terms,
+                                   keyset=UNDATED_KEYSET if undated else PENDING_KEYSET)
+
+
+def pending_tokens_page(filters=None, cursor=None, limit=PENDING_PAGE_SIZE):
+    """
+    One page of PENDING tokens (dicts keyed by PENDING_COLUMNS) plus the
+    cursor for the next page, or None on the last page.  `filters` may set
+    from_city, to_city, party_id, marka (prefix), start / end (ISO bounds).
+    """
+    filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+    after_d, after_id = cursor or ("", -1)
+    params = dict(filters, after_d=after_d, after_id=after_id, limit=limit)
+    fetched = []
+    with get_conn() as conn:
+        if after_d == "" and "start" not in filters and "end" not in filters:
+            fetched = conn.execute(pending_tokens_sql(filters, undated=True), params).fetchall()
+            params.update(after_id=-1, limit=limit - len(fetched))
+        if len(fetched) < limit:
+            fetched += conn.execute(pending_tokens_sql(filters), params).fetchall()
+
+    rows = [dict(zip(PENDING_COLUMNS, r)) for r in fetched]
+    if len(fetched) < limit:
+        return rows, None
+    return rows, (fetched[-1][-1], fetched[-1][0])
+
+
+# A party's unbilled tokens in a period - the rows the bill run picks up
+# (billing.BILLABLE_TOKENS_SQL).  Billed PENDING tokens keep their status
+# until loaded, so bill_id is what marks them as billed.
+BILL_TOKENS_SQL = """
+    SELECT
+        COALESCE(t.token_no, t.id) AS token_no,
+        t.datetime,
+        t.weight,
+        t.packages,
+        t.amount,
+        t.from_city,
+        t.to_city
+    FROM tokens t
+    WHERE t.party_id = ?
+      AND t.datetime_iso >= ? AND t.datetime_iso < ?
+      AND t.status IN ('PENDING', 'LOADED')
+      AND t.bill_id IS NULL
+    ORDER BY t.datetime_iso
+"""
+
+_DAILY_BOOKING = """
+    SELECT
+        s.day AS d,
+        SUM(s.tokens) AS tokens,
+        SUM(s.weight) AS weight,
+        SUM(s.packages) AS packages,
+        SUM(s.amount) AS amount
+    FROM {summary} s
+    WHERE s.day >= ? AND s.day < ?
+    GROUP BY s.day
+    HAVING SUM(s.tokens) > 0
+    ORDER BY s.day
+"""
+
+
+def daily_booking_sql(schemas=()):
+    """Daily booking over the live rollup plus the attached archives `schemas`."""
+    if not schemas:
+        return _DAILY_BOOKING.format(summary="daily_booking_summary")
+    union = " UNION ALL ".join(f"SELECT * FROM {s}.daily_booking_summary"
+                               for s in ("main", *schemas))
+    return _DAILY_BOOKING.format(summary=f"({union})")
+
+
+DAILY_BOOKING_SQL = daily_booking_sql()
+
+OUTSTANDING_SQL = """
+    SELECT
+        p.party_name,
+        b.token_total AS "Total Billing",
+        b.paid_total AS "Payments",
+        b.token_total - b.paid_total AS "Outstanding"
+    FROM party_balance b
+    JOIN party_master p ON p.id = b.party_id
+    WHERE b.token_total != 0 OR b.paid_total != 0
+    ORDER BY p.party_name
+"""
+
+RECENT_PAYMENTS_SQL = """
+    SELECT date, amount, mode, remark
+    FROM payments
+    WHERE party_id=?
+    ORDER BY id DESC LIMIT 50
+"""
+
+# ------------------------------------------------------------
+# Ledger
+# ------------------------------------------------------------
+# Tokens (debit) and payments (credit) are merged in SQL and ordered by
+# (day, kind, id).  The running balance is a window SUM seeded with the
+# balance carried in the page cursor, so every page is computed only from
+# the rows after the cursor and pages can be streamed one after another.
+
+LEDGER_PAGE_SIZE = 500
+
+# The balance carried by the latest close on or before :start.  Every party
+# with any history gets a row at each close, so a party without one (e.g.
+# created since) starts from 0 there - not from the very first archive.
+LEDGER_CARRIED_SQL = """
+    SELECT c.as_of, COALESCE(o.amount, 0)
+    FROM (SELECT MAX(as_of) AS as_of FROM opening_balances WHERE as_of <= :start) c
+    LEFT JOIN opening_balances o ON o.party_id = :party AND o.as_of = c.as_of
+    WHERE c.as_of IS NOT NULL
+"""
+
+_LEDGER_TOKENS = """
+        SELECT
+            substr(t.datetime_iso, 1, 10) AS d,
+            0 AS kind,
+            t.id AS ref_id,
+            'TOKEN' AS type,
+            'Token #' || COALESCE(t.token_no, t.id) AS details,
+            COALESCE(t.amount, 0) AS debit,
+            0 AS credit
+        FROM {db}tokens t
+        WHERE t.party_id = :party
+          AND t.datetime_iso >= :start AND t.datetime_iso < :end"""
+
+_LEDGER_PAYMENTS = """
+        SELECT
+            y.date_iso,
+            1,
+            y.id,
+            'PAYMENT',
+            'Payment (' || COALESCE(y.mode, '') || ')'
+                || CASE WHEN COALESCE(y.remark, '') != '' THEN ' - ' || y.remark ELSE '' END,
+            0,
+            COALESCE(y.amount, 0)
+        FROM {db}payments y
+        WHERE y.party_id = :party
+          AND y.date_iso >= :start AND y.date_iso < :end"""
+
+
+def ledger_entries_cte(schemas=()):
+    """The `entries` CTE over the live tables plus the attached archives `schemas`."""
+    parts = [part.format(db=prefix)
+             for prefix in ("", *(f"{s}." for s in schemas))
+             for part in (_LEDGER_TOKENS, _LEDGER_PAYMENTS)]
+    return "\n    WITH entries AS (" + "\n        UNION ALL".join(parts) + "\n    )\n"
+
+
+LEDGER_ENTRIES_CTE = ledger_entries_cte()
+
+_LEDGER_PAGE = """
+    SELECT
+        d, kind, ref_id,
+        substr(d, 9, 2) || '-' || substr(d, 6, 2) || '-' || substr(d, 1, 4) AS date,
+        type, details, debit, credit,
+        :carry + SUM(debit - credit) OVER (
+            ORDER BY d, kind, ref_id ROWS UNBOUNDED PRECEDING
+        ) AS balance
+    FROM entries
+    WHERE (d, kind, ref_id) > (:after_d, :after_kind, :after_id)
+    ORDER BY d, kind, ref_id
+    LIMIT :limit
+"""
+
+_LEDGER_TOTALS = """
+    SELECT COUNT(*), COALESCE(SUM(debit), 0), COALESCE(SUM(credit), 0) FROM entries
+"""
+
+LEDGER_PAGE_SQL = LEDGER_ENTRIES_CTE + _LEDGER_PAGE
+LEDGER_TOTALS_SQL = LEDGER_ENTRIES_CTE + _LEDGER_TOTALS
+
+LEDGER_COLUMNS = ["date", "type", "details", "debit", "credit", "balance"]
+
+
+def _ledger_params(party_id, start_dt, end_dt):
+    start, end = iso_range(start_dt, end_dt)
+    return {"party": party_id, "start": start, "end": end}
+
+
+def _ledger_sql(conn, tail, start_iso, end_iso):
+    # archived years are read only when the range reaches into them
+    schemas = attach_archives(conn, archived_years(start_iso, end_iso))
+    return ledger_entries_cte(schemas) + tail
+
+
+def ledger_opening_balance(party_id, start_dt):
+    """Everything booked or paid before start_dt."""
+    start = start_dt.isoformat()
+    with get_read_conn() as conn:
+        row = conn.execute(LEDGER_CARRIED_SQL, {"party": party_id, "start": start}).fetchone()
+        as_of, carried = row or ("", 0.0)
+        _, debit, credit = conn.execute(
+            _ledger_sql(conn, _LEDGER_TOTALS, as_of, start),
+            {"party": party_id, "start": as_of, "end": start}).fetchone()
+    return carried + debit - credit
+
+
+def ledger_summary(party_id, start_dt, end_dt):
+    """Opening / debit / credit / closing for the range, without reading the rows."""
+    opening = ledger_opening_balance(party_id, start_dt)
+    params = _ledger_params(party_id, start_dt, end_dt)
+    with get_read_conn() as conn:
+        count, debit, credit = conn.execute(
+            _ledger_sql(conn, _LEDGER_TOTALS, params["start"], params["end"]), params).fetchone()
+    return {
+        "entries": count,
+        "opening": opening,
+        "debit": debit,
+        "credit": credit,
+        "closing": opening + debit - credit,
+    }
+
+
+def ledger_page(party_id, start_dt, end_dt, cursor=None, limit=LEDGER_PAGE_SIZE):
+    """
+    One page of ledger rows (dicts keyed by LEDGER_COLUMNS) plus the cursor
+    for the next page, or None when this was the last page.  Pass
+    cursor=None for the first page; the opening balance is derived then.
+    """
+    if cursor is None:
+        cursor = ("", -1, -1, ledger_opening_balance(party_id, start_dt))
+    after_d, after_kind, after_id, carry = cursor
+    params = _ledger_params(party_id, start_dt, end_dt)
+    params.update(after_d=after_d, after_kind=after_kind, after_id=after_id,
+                  carry=carry, limit=limit)
+    with get_read_conn() as conn:
+        sql = _ledger_sql(conn, _LEDGER_PAGE, params["start"], params["end"])
+        fetched = conn.execute(sql, params).fetchall()
+
+    rows = [dict(zip(LEDGER_COLUMNS, r[3:])) for r in fetched]
+    if len(fetched) < limit:
+        return rows, None
+    last = fetched[-1]
+    return rows, (last[0], last[1], last[2], last[-1])
+
+
+def iter_ledger(party_id, start_dt, end_dt, page_size=LEDGER_PAGE_SIZE):
+    """Yields the ledger page by page, for exports of any size."""
+    cursor = None
+    while True:
+        rows, cursor = ledger_page(party_id, start_dt, end_dt, cursor, page_size)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+_RANGE = ("2025-04-01", "2025-05-01")
+
+# name -> (sql, sample params)
+PAGE_QUERIES = {
+    "challan.pending_page": (pending_tokens_sql({}), dict(after_d="", after_id=-1, limit=200)),
+    "challan.pending_undated": (pending_tokens_sql({}, undated=True),
+                                dict(after_d="", after_id=-1, limit=200)),
+    "challan.pending_route": (
+        pending_tokens_sql({"from_city": 1, "to_city": 1}),
+        dict(from_city="DELHI", to_city="JAIPUR", after_d="", after_id=-1, limit=200)),
+    # party_id and the day range on idx_tokens_party_day; status and bill_id filter
+    "billing.party_tokens": (BILL_TOKENS_SQL, (1, *_RANGE)),
+    "ledger.page": (LEDGER_PAGE_SQL, dict(party=1, start=_RANGE[0], end=_RANGE[1], carry=0,
+                                          after_d="", after_kind=-1, after_id=-1, limit=500)),
+    "ledger.carried": (LEDGER_CARRIED_SQL, dict(party=1, start=_RANGE[0])),
+    "ledger.totals": (LEDGER_TOTALS_SQL, dict(party=1, start=_RANGE[0], end=_RANGE[1])),
+    "reports.daily_booking": (DAILY_BOOKING_SQL, _RANGE),
+    "payments.recent": (RECENT_PAYMENTS_SQL, (1,)),
+    "balance.party": ("SELECT token_total - paid_total FROM party_balance WHERE party_id=?", (1,)),
+    "sequence.peek": ("SELECT last_value FROM sequences WHERE series = ? AND fy = ?",
+                      ("bill", "2025-26")),
+}
+
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN detail lines for one statement."""
+    return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def check_query_plans(queries=None):
+    """
+    Returns a list of (query name, problem) for every page query whose plan
+    scans a whole table (a bare "SCAN <table>" step) or that fails to
+    prepare.  An empty list means every query is served from an index.
+    Scans of CTEs and subqueries are fine; their own steps are checked.
+    """
+    problems = []
+    with get_conn() as conn:
+        for name, (sql, params) in (queries or PAGE_QUERIES).items():
+            try:
+                plan = explain(conn, sql, params)
+            except sqlite3.OperationalError as e:
+                problems.append((name, f"error: {e}"))
+                continue
+            derived = {d.split(" ", 1)[1] for d in plan
+                       if d.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+            for detail in plan:
+                if not detail.startswith("SCAN ") or " USING " in detail:
+                    continue
+                if detail[5:] in derived or detail == "SCAN CONSTANT ROW":
+                    continue
+                problems.append((name, detail))
+    return problems
+
+
+def assert_query_plans(queries=None):
+    problems = check_query_plans(queries)
+    assert not problems, "full table scans: " + "; ".join(
+        f"{name}: {detail}" for name, detail in problems)
@@ -0,0 +1,132 @@
+# diagnostics.py
+# Hidden diagnostics page, opened as  app.py?diagnostics=1  (it is not in
+# the sidebar).  Shows what profiling.py recorded: per page and per rerun
+# timings, the slowest statements, pandas / PDF / export timers, the pool,
+# cache and writer queue counters, the backups (with a "Backup now"
+# button) and a cProfile capture of one rerun.
+import os
+import time
+
+import pandas as pd
+import streamlit as st
+
+import backup
+import db
+import documents
+import masters
+import profiling
+import writer
+
+PAGE_FILES = sorted(
+    profiling.page_name(f) for f in os.listdir(os.path.dirname(os.path.abspath(__file__)))
+    if f[:1].isdigit() and f.endswith(".py")
+) + ["app"]
+
+
+def _table(rows, empty="Nothing recorded yet."):
+    if rows:
+        st.dataframe(pd.DataFrame(rows), width="stretch", hide_index=True)
+    else:
+        st.caption(empty)
+
+
+def show():
+    st.title("🩺 Diagnostics")
+
+    on = st.toggle("Profiling on", value=profiling.enabled(),
+                   help="हर query / pandas / PDF step का time record होता है। काम के बाद बंद कर दो।")
+    if on != profiling.enabled():
+        profiling.set_enabled(on)
+        st.rerun()
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        st.caption("Connection pool")
+        st.json(db.pool_stats())
+    with c2:
+        st.caption("Master cache")
+        st.json(masters.cache_stats())
+    with c3:
+        st.caption("Document cache")
+        st.json(documents.stats())
+    with c4:
+        st.caption("Writer queue")
+        st.json(writer.stats())
+
+    # -------------------------
+    #   BACKUPS
+    # -------------------------
+    st.subheader("Backups")
+    progress = backup.status()
+    b1, b2 = st.columns([1, 3])
+    with b1:
+        running = progress["phase"] not in ("idle", "failed")
+        if st.button("💾 Backup now", disabled=running):
+            backup.start()
+            st.rerun()
+    with b2:
+        if running:
+            done, total = progress.get("pages_done", 0), progress.get("pages_total", 0)
+            st.caption(f"{progress['phase']}... {done}/{total} pages · app चलता रहेगा")
+        elif progress["phase"] == "failed":
+            st.error(f"Backup failed: {progress.get('error')}")
+    _table([{"file": m["file"], "created": m["created"],
+             "mb": round(m["gz_bytes"] / 2**20, 1),
+             "tokens": m["tables"].get("tokens", {}).get("rows"),
+             "seconds": m["seconds"]["total"]} for m in backup.backups()],
+           empty="No backups yet.")
+
+    if not profiling.enabled() and not profiling.runs():
+        st.info("Profiling बंद है। ऊपर से on करो, फिर slow page चलाओ और यहाँ वापस आओ।")
+        return
+
+    if st.button("🧹 Clear recorded data"):
+        profiling.clear()
+        st.rerun()
+
+    # -------------------------
+    #   PAGES / RERUNS
+    # -------------------------
+    st.subheader("Per page")
+    _table(profiling.page_rows())
+
+    st.subheader("Recent reruns")
+    st.caption("elapsed = page start से आख़िरी DB / pandas / PDF step तक; "
+               "बाकी समय Streamlit rendering का है।")
+    _table(profiling.run_rows(limit=50))
+
+    # -------------------------
+    #   QUERIES / TIMERS
+    # -------------------------
+    top_n = st.number_input("Top N", min_value=5, max_value=200, value=20, step=5)
+
+    st.subheader("Slowest statements")
+    _table(profiling.slowest_queries(int(top_n)))
+
+    st.subheader("Statements by total time")
+    _table(profiling.statement_rows(int(top_n)))
+
+    st.subheader("pandas / PDF / export")
+    _table(profiling.timer_rows())
+
+    # -------------------------
+    #   cPROFILE (ONE RERUN)
+    # -------------------------
+    st.subheader("cProfile")
+    p1, p2 = st.columns([2, 1])
+    with p1:
+        page = st.selectbox("Page", ["*"] + PAGE_FILES,
+                            format_func=lambda p: "Any page" if p == "*" else p)
+    with p2:
+        st.write("")
+        if st.button("Profile next rerun", disabled=not profiling.enabled()):
+            profiling.capture_next(page)
+    if profiling.capture_pending():
+        st.info(f"Waiting for the next rerun of: {profiling.capture_pending()}")
+
+    run = profiling.last_profiled()
+    if run is not None:
+        sort = st.radio("Sort", ["cumulative", "tottime", "ncalls"], horizontal=True)
+        started = time.strftime("%d-%m-%Y %H:%M:%S", time.localtime(run.started))
+        st.caption(f"{run.page} · {started}")
+        st.code(profiling.profile_text(run, sort), language=None)
@@ -0,0 +1,345 @@
+# documents.py
+# PDF documents (token / challan / bill / ledger) rendered in a worker
+# process pool and cached on disk.
+#
+# A document is cached under  DOC_DIR/<kind>_<id>_<hash>.pdf  where the
+# hash covers the header and rows it was built from.  Asking again for the
+# same data is a file read; once the tokens or payments behind it change,
+# the hash changes, the PDF is rendered again and the version this process
+# last served for that id is back-dated, so the next prune removes it.
+# Nothing is deleted straight away: another session may be reading it.
+#
+# The folder is pruned every PRUNE_INTERVAL_S: files not used for
+# CACHE_MAX_DAYS go, then the least recently used ones until it is under
+# CACHE_MAX_MB (python manage.py prune-documents does the same by hand).
+#
+# Bilties for a token range or a challan can also be printed as one
+# merged PDF (bilty_batch, python manage.py print-bilties).
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from db import EXPORT_TIMEOUT_S, get_read_conn
+from profiling import timed, timer
+
+DOC_DIR = "documents"
+DOC_WORKERS = 2
+CACHE_MAX_MB = 500
+CACHE_MAX_DAYS = 30
+PRUNE_INTERVAL_S = 600
+
+# kind -> (module, function); called as function(header, rows) in a worker
+RENDERERS = {
+    "token": ("documents", "token_pdf"),
+    "challan": ("utils.pdf_utils", "challan_pdf"),
+    "bill": ("utils.pdf_utils", "bill_pdf"),
+    "ledger": ("utils.pdf_utils", "ledger_pdf"),
+}
+
+_lock = threading.Lock()
+_pool = None
+_pending = {}                   # cache path -> Future of a render in flight
+_latest = {}                    # (kind, doc id) -> path last rendered or served
+_stats = {"hits": 0, "renders": 0, "pruned": 0}
+_last_prune = 0.0
+
+
+# -------------------------
+#   TOKEN / BILTY
+# -------------------------
+def token_lines(token):
+    return [
+        f"Token No: {token['token_no']}",
+        f"Date/Time: {token['datetime']}",
+        f"Party: {token['party_name']}",
+        f"Marka: {token['marka']}",
+        f"From: {token['from_city']}",
+        f"To: {token['to_city']}",
+        f"Weight (KG): {token['weight']}",
+        f"Rate: {token['rate']} / {token.get('rate_type', 'KG')}",
+        f"Amount: {token['amount']}",
+        f"Packages: {token['packages']}",
+        f"Driver Mobile: {token['driver_mobile']}"
+    ]
+
+
+def draw_token(c, token):
+    """One bilty page on canvas `c`."""
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(180, 800, "TOKEN / BILTY")
+
+    c.setFont("Helvetica", 12)
+    y = 770
+    for line in token_lines(token):
+        c.drawString(50, y, line)
+        y -= 25
+
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(200, y - 20, "Thank You")
+    c.showPage()
+
+
+@timed("pdf")
+def token_pdf(token, rows=()):
+    """The single-page bilty (rows is unused; same call shape as pdf_utils)."""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    draw_token(c, token)
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+# -------------------------
+#   BATCH PRINT (BILTIES)
+# -------------------------
+BATCH_FETCH = 500
+
+BATCH_TOKEN_COLUMNS = ["token_no", "datetime", "party_name", "marka", "from_city", "to_city",
+                       "weight", "rate", "rate_type", "amount", "packages", "driver_mobile"]
+
+_BATCH_SELECT = """
+    SELECT COALESCE(t.token_no, t.id), t.datetime, COALESCE(p.party_name, ''),
+           COALESCE(t.marka, ''), t.from_city, t.to_city, t.weight, t.rate,
+           COALESCE(t.rate_type, 'KG'), t.amount, t.packages, COALESCE(t.driver_mobile, '')
+    FROM tokens t
+    LEFT JOIN party_master p ON p.id = t.party_id
+"""
+
+# tokens written before token_no existed are numbered by id
+TOKENS_BY_NO_SQL = _BATCH_SELECT + """
+    WHERE t.token_no BETWEEN :first AND :last
+       OR (t.token_no IS NULL AND t.id BETWEEN :first AND :last)
+    ORDER BY 1
+"""
+
+TOKENS_BY_CHALLAN_SQL = _BATCH_SELECT + """
+    JOIN challan_tokens ct ON ct.token_id = t.id
+    JOIN challan ch ON ch.id = ct.challan_id
+    WHERE ch.challan_no = :challan_no
+    ORDER BY 1
+"""
+
+
+def batch_tokens(first_no=None, last_no=None, challan_no=None):
+    """
+    Yields bilty dicts for a token-number range or for one challan.  The
+    cursor stays open while the caller draws each page, so it runs under
+    the export deadline rather than the report one.
+    """
+    if challan_no is not None:
+        sql, params = TOKENS_BY_CHALLAN_SQL, {"challan_no": challan_no}
+    else:
+        sql, params = TOKENS_BY_NO_SQL, {"first": first_no, "last": last_no}
+    with get_read_conn(EXPORT_TIMEOUT_S) as conn:
+        cur = conn.execute(sql, params)
+        while True:
+            fetched = cur.fetchmany(BATCH_FETCH)
+            if not fetched:
+                break
+            for r in fetched:
+                yield dict(zip(BATCH_TOKEN_COLUMNS, r))
+
+
+@timed("pdf")
+def bilty_batch(path, tokens):
+    """
+    Writes every bilty in `tokens` into one multi-page PDF at `path`: one
+    canvas, one set of font resources, compressed pages.  Rows are drawn
+    as they are fetched, so the token list is never held in memory; only
+    reportlab's compressed page streams (a few KB a page) are, until the
+    file is written.  Returns the number of pages.
+    """
+    # a temp file of its own: two sessions may print the same range at once
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".",
+                               suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        c = canvas.Canvas(tmp, pagesize=A4, pageCompression=1)
+        pages = 0
+        for token in tokens:
+            draw_token(c, token)
+            pages += 1
+        if pages:
+            c.save()
+            os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return pages
+
+
+# -------------------------
+#   CACHE
+# -------------------------
+def content_hash(header, rows):
+    blob = json.dumps([header, rows], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()[:20]
+
+
+def _safe(doc_id):
+    return str(doc_id).replace(" ", "_").replace("/", "-")
+
+
+def cache_path(kind, doc_id, header, rows, doc_dir=None):
+    name = f"{kind}_{_safe(doc_id)}_{content_hash(header, rows)}.pdf"
+    return os.path.join(doc_dir or DOC_DIR, name)
+
+
+def invalidate(kind, doc_id, keep=None):
+    """
+    Marks the cached version of one document last rendered or served by
+    this process as stale, unless it is `keep`, which becomes the current
+    one.  A session may still be reading it, so it is only back-dated and
+    the next prune() removes it; older versions (from before a restart)
+    age out there too.
+    """
+    with _lock:
+        old = _latest.pop((kind, doc_id), None)
+        if keep is not None:
+            _latest[(kind, doc_id)] = keep
+    if old is not None and old != keep:
+        try:
+            os.utime(old, (0, 0))
+        except FileNotFoundError:
+            pass
+
+
+def prune(max_mb=CACHE_MAX_MB, max_days=CACHE_MAX_DAYS, doc_dir=None):
+    """
+    Deletes cached PDFs (and batch files) not used for `max_days`, then the
+    least recently used ones until the folder is under `max_mb`.  Renders
+    in flight are left alone.  Returns {removed, freed_mb, kept_mb}.
+    """
+    global _last_prune
+    doc_dir = doc_dir or DOC_DIR
+    with _lock:
+        _last_prune = time.time()
+        busy = set(_pending)
+    if not os.path.isdir(doc_dir):
+        return {"removed": 0, "freed_mb": 0.0, "kept_mb": 0.0}
+    files = sorted((e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(doc_dir)
+                   if e.is_file() and e.path not in busy)
+    cutoff = _last_prune - max_days * 86400
+    total = sum(size for _, size, _ in files)
+    removed = freed = 0
+    for mtime, size, path in files:             # oldest first
+        if mtime >= cutoff and total - freed <= max_mb * 2**20:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        removed += 1
+        freed += size
+    with _lock:
+        _stats["pruned"] += removed
+    return {"removed": removed, "freed_mb": round(freed / 2**20, 1),
+            "kept_mb": round((total - freed) / 2**20, 1)}
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def stats():
+    with _lock:
+        return dict(_stats, in_flight=len(_pending))
+
+
+def _maybe_prune():
+    with _lock:
+        due = time.time() - _last_prune > PRUNE_INTERVAL_S
+    if due:
+        prune()
+
+
+# -------------------------
+#   RENDERING
+# -------------------------
+def _render(kind, header, rows, path):
+    # runs in a worker process
+    from importlib import import_module
+
+    module, func = RENDERERS[kind]
+    buf = getattr(import_module(module), func)(header, rows)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf.getvalue() if hasattr(buf, "getvalue") else buf)
+    os.replace(tmp, path)
+    return path
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=DOC_WORKERS)
+    return _pool
+
+
+def _finished(future, done, kind, doc_id, path):
+    with _lock:
+        _pending.pop(path, None)
+    error = future.exception()
+    if error is None:
+        invalidate(kind, doc_id, keep=path)
+        done.set_result(path)
+    else:
+        done.set_exception(error)
+
+
+def request(kind, doc_id, header, rows=()):
+    """
+    Future whose result is the path of the PDF.  Already cached: the future
+    is done at once.  Already being rendered: the same future is returned,
+    so a double click or a second session does not render it twice.
+    """
+    if kind not in RENDERERS:
+        raise ValueError(f"unknown document kind: {kind}")
+    path = cache_path(kind, doc_id, header, rows)
+    with _lock:
+        if path in _pending:
+            return _pending[path]
+        if os.path.exists(path):
+            _stats["hits"] += 1
+            _latest[(kind, doc_id)] = path
+            os.utime(path)              # recently used, for prune()
+            done = Future()
+            done.set_result(path)
+            return done
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        future = _executor().submit(_render, kind, header, rows, path)
+        # callers get `done`, settled only once the cache bookkeeping is
+        # through, so a finished render is already the current version
+        done = _pending[path] = Future()
+        _stats["renders"] += 1
+    future.add_done_callback(lambda f: _finished(f, done, kind, doc_id, path))
+    _maybe_prune()
+    return done
+
+
+def render(kind, doc_id, header, rows=(), timeout=None):
+    """Bytes of the PDF, waiting for the worker if it is not cached yet."""
+    with timer("pdf", f"render {kind}"):
+        try:
+            return read(request(kind, doc_id, header, rows).result(timeout))
+        except FileNotFoundError:
+            # pruned between the cache check and the read: render it again
+            return read(request(kind, doc_id, header, rows).result(timeout))
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
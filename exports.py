@@ -0,0 +1,141 @@
+# exports.py
+# Excel / CSV downloads that stream rows into a temp file.
+#
+# Rows come from a SQL cursor (or any iterator) EXPORT_CHUNK at a time and
+# go straight into an openpyxl write-only sheet or a gzip'd CSV, so the
+# memory used does not grow with the number of rows - a year's ledger of a
+# big party costs the same as one page of it.  pandas.to_excel() instead
+# builds the whole workbook as objects in RAM.
+import csv
+import gzip
+import io
+import os
+import tempfile
+
+from db import EXPORT_TIMEOUT_S, get_read_conn, attach_archives
+from profiling import timer
+
+EXPORT_CHUNK = 5000
+
+FORMATS = {
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+}
+
+
+def query_rows(sql, params=(), chunk=EXPORT_CHUNK, archives=(), timeout=EXPORT_TIMEOUT_S):
+    """
+    Yields the rows of a query, fetched `chunk` rows at a time.  `archives`
+    are the closed years the SQL reads (see db.attach_archives).  Runs on
+    a read-only connection; past `timeout` seconds it raises db.QueryTimeout.
+    """
+    with get_read_conn(timeout) as conn:
+        attach_archives(conn, archives)
+        cur = conn.execute(sql, params)
+        while True:
+            fetched = cur.fetchmany(chunk)
+            if not fetched:
+                return
+            yield from fetched
+
+
+def frame_rows(df, columns=None, chunk=EXPORT_CHUNK):
+    """Row tuples of a DataFrame that is already loaded, `chunk` rows at a time."""
+    columns = list(df.columns) if columns is None else list(columns)
+    for start in range(0, len(df), chunk):
+        part = df.iloc[start:start + chunk]
+        yield from zip(*(part[c].tolist() for c in columns))
+
+
+def dict_rows(pages, columns):
+    """Pages of row dicts (e.g. db.iter_ledger) -> row tuples in `columns` order."""
+    for page in pages:
+        for r in page:
+            yield tuple(r[c] for c in columns)
+
+
+def write_xlsx(path, columns, rows, sheet="Sheet1"):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet)
+    ws.append(list(columns))
+    count = 0
+    for row in rows:
+        ws.append(row)
+        count += 1
+    wb.save(path)
+    return count
+
+
+def write_csv_gz(path, columns, rows):
+    count = 0
+    with gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6) as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == EXPORT_CHUNK:
+                writer.writerows(batch)
+                count += len(batch)
+                batch = []
+        writer.writerows(batch)
+        count += len(batch)
+    return count
+
+
+WRITERS = {"xlsx": write_xlsx, "csv.gz": write_csv_gz}
+
+
+def export(columns, rows, fmt="xlsx", prefix="export_"):
+    """
+    Writes `rows` (an iterator of tuples) to a temp file in format `fmt`.
+    Returns (path, row count); the caller removes the file (see take()).
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown export format: {fmt}")
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix="." + FORMATS[fmt][0])
+    os.close(fd)
+    try:
+        with timer("export", f"{prefix}{fmt}"):
+            count = WRITERS[fmt](path, columns, rows)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
+
+
+def export_query(sql, params, columns, fmt="xlsx", prefix="export_", archives=()):
+    return export(columns, query_rows(sql, params, archives=archives), fmt, prefix)
+
+
+def take(path):
+    """Reads a finished export for st.download_button and deletes the file."""
+    try:
+        with open(path, "rb") as f:
+            return io.BytesIO(f.read())
+    finally:
+        os.remove(path)
+
+
+def read(path):
+    """Reads a finished export that is kept for later reruns (see discard())."""
+    with open(path, "rb") as f:
+        return io.BytesIO(f.read())
+
+
+def discard(path):
+    """Removes a kept export; a file already gone is fine."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def file_name(name, fmt):
+    return f"{name}.{FORMATS[fmt][0]}"
+
+
+def mime(fmt):
+    return FORMATS[fmt][1]
@@ -0,0 +1,279 @@
+# importer.py
+# Bulk token import from the branch offices' booking sheets (CSV or XLSX).
+#
+#   python manage.py import-tokens sheet.xlsx --errors sheet_errors.csv
+#
+# The sheet is read as a stream and handled CHUNK_SIZE rows at a time:
+# rows are validated, party names are mapped to ids through the cached
+# party index, rates come from rates.rate_index(), and each chunk is
+# written with one executemany in its own transaction together with its
+# block of token numbers.  A bad row goes to the error file with the
+# reason; it never stops the load.
+import csv
+import io
+import os
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+import masters
+import writer
+from db import (get_conn, transaction, allocate_numbers,
+                parse_token_datetime, TOKEN_DT_FORMAT)
+from rates import rate_index, amount_for, RATE_TYPES
+
+CHUNK_SIZE = 2000
+
+REQUIRED = ("date", "party", "from_city", "to_city", "weight")
+OPTIONAL = ("packages", "rate_type", "rate", "marka", "driver_mobile")
+
+# header spellings seen in the branch sheets -> our column names
+HEADER_ALIASES = {
+    "datetime": "date", "date_time": "date", "booking_date": "date",
+    "party_name": "party", "from": "from_city", "to": "to_city",
+    "weight_kg": "weight", "pkgs": "packages", "mobile": "driver_mobile",
+    "type": "rate_type",
+}
+
+INSERT_TOKEN_SQL = """
+    INSERT INTO tokens (token_no, datetime, datetime_iso, party_id, party_name, marka,
+                        from_city, to_city, weight, rate, rate_type, amount, packages,
+                        driver_mobile, status)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,'PENDING')
+"""
+
+
+class RowError(ValueError):
+    """A sheet row that cannot be imported (the message goes to the error file)."""
+
+
+# -------------------------
+#   READING
+# -------------------------
+def _header(name):
+    key = str(name or "").strip().lower().replace(" ", "_").replace("/", "_")
+    return HEADER_ALIASES.get(key, key)
+
+
+def _is_xlsx(filename):
+    return os.path.splitext(filename or "")[1].lower() in (".xlsx", ".xlsm")
+
+
+def read_rows(source, filename=None):
+    """
+    Yields (line number, {column: value}) for a CSV or XLSX sheet.
+    `source` is a path or a binary file object (e.g. a Streamlit upload);
+    `filename` decides the format when `source` is not a path.
+    """
+    filename = filename or (source if isinstance(source, str) else getattr(source, "name", ""))
+    rows = _xlsx_rows(source) if _is_xlsx(filename) else _csv_rows(source)
+    header = [_header(h) for h in next(rows, [])]
+    missing = [c for c in REQUIRED if c not in header]
+    if missing:
+        raise ValueError(f"sheet is missing column(s): {', '.join(missing)}")
+    for line, values in enumerate(rows, start=2):
+        if not any(v not in (None, "") for v in values):
+            continue
+        yield line, dict(zip(header, values))
+
+
+def _csv_rows(source):
+    if isinstance(source, str):
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            yield from csv.reader(f)
+    else:
+        yield from csv.reader(io.TextIOWrapper(source, encoding="utf-8-sig", newline=""))
+
+
+def _xlsx_rows(source):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        for values in wb.active.iter_rows(values_only=True):
+            yield list(values)
+    finally:
+        wb.close()
+
+
+# -------------------------
+#   VALIDATION
+# -------------------------
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+def _number(row, col, default=None):
+    value = row.get(col)
+    if value in (None, ""):
+        if default is None:
+            raise RowError(f"{col} is blank")
+        return default
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        raise RowError(f"{col} is not a number: {value!r}") from None
+
+
+def _when(value):
+    """Sheet date cell -> (display text, ISO 'YYYY-MM-DD HH:MM')."""
+    if isinstance(value, datetime):
+        return value.strftime(TOKEN_DT_FORMAT), value.strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, date):
+        return _when(datetime(value.year, value.month, value.day))
+    parsed = _when_text(_text(value))
+    if parsed is None:
+        raise RowError(f"date not understood: {value!r}")
+    return parsed
+
+
+@lru_cache(maxsize=4096)
+def _when_text(text):
+    # a sheet repeats a handful of booking times; parse each one once
+    iso = parse_token_datetime(text)
+    if iso is None:
+        return None
+    return datetime.strptime(iso, "%Y-%m-%d %H:%M").strftime(TOKEN_DT_FORMAT), iso
+
+
+def _party_keys():
+    # party names as typed in the sheets: any case, stray spaces
+    return masters.cached("party_keys", ("party",), lambda: {
+        p.party_name.strip().upper(): p for p in masters.parties().parties
+    })
+
+
+def validate_row(row, party_keys):
+    """
+    One sheet row -> a dict of token fields.  The rate is None when the
+    sheet leaves it blank; price_rows() fills it in from the rate master.
+    """
+    party = party_keys.get(_text(row.get("party")).upper())
+    if party is None:
+        raise RowError(f"unknown party: {_text(row.get('party'))!r}")
+    rate_type = _text(row.get("rate_type")).upper() or "KG"
+    if rate_type not in RATE_TYPES:
+        raise RowError(f"rate_type must be one of {', '.join(RATE_TYPES)}")
+    from_city, to_city = _text(row.get("from_city")).upper(), _text(row.get("to_city")).upper()
+    if not from_city or not to_city:
+        raise RowError("from_city / to_city is blank")
+
+    weight = _number(row, "weight")
+    packages = _number(row, "packages", default=1)
+    if weight < 0 or packages < 0 or packages != int(packages):
+        raise RowError("weight / packages must be positive (packages a whole number)")
+    rate = _number(row, "rate", default=-1.0)
+    shown, iso = _when(row.get("date"))
+
+    return {
+        "datetime": shown, "datetime_iso": iso,
+        "party_id": party.id, "party_name": party.party_name,
+        "marka": _text(row.get("marka")) or party.marka or "",
+        "from_city": from_city, "to_city": to_city,
+        "weight": weight, "packages": int(packages),
+        "rate": None if rate < 0 else rate, "rate_type": rate_type,
+        "driver_mobile": _text(row.get("driver_mobile")),
+    }
+
+
+def price_rows(tokens):
+    """Fills rate (where blank) and amount for a chunk of validated rows."""
+    todo = [t for t in tokens if t["rate"] is None]
+    if todo:
+        found = rate_index().rate_many(
+            [t["party_id"] for t in todo], [t["from_city"] for t in todo],
+            [t["to_city"] for t in todo], [t["rate_type"] for t in todo],
+        )
+        for t, rate in zip(todo, found):
+            t["rate"] = rate
+    for t in tokens:
+        if t["rate"] is not None:
+            t["amount"] = amount_for(t["rate_type"], t["rate"], t["weight"], t["packages"])
+
+
+# -------------------------
+#   WRITING
+# -------------------------
+def write_chunk(tokens):
+    """Inserts validated, priced rows.  Returns the first token number."""
+    with get_conn() as conn, transaction(conn):
+        first = allocate_numbers(conn, "token", len(tokens))
+        conn.executemany(INSERT_TOKEN_SQL, [
+            (first + i, t["datetime"], t["datetime_iso"], t["party_id"], t["party_name"],
+             t["marka"], t["from_city"], t["to_city"], t["weight"], t["rate"],
+             t["rate_type"], t["amount"], t["packages"], t["driver_mobile"])
+            for i, t in enumerate(tokens)
+        ])
+    return first
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_tokens(source, filename=None, errors=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Imports a booking sheet.  `errors` is a path or a text file object
+    that receives one CSV line per rejected row (line, error, raw values);
+    `progress(rows_done)` is called after every chunk.
+
+    Returns a report dict: rows read / imported / rejected, the token
+    number range, seconds and rows per second.
+    """
+    t0 = time.perf_counter()
+    party_keys = _party_keys()
+    columns = list(REQUIRED + OPTIONAL)
+    report = {"rows": 0, "imported": 0, "rejected": 0,
+              "first_token_no": None, "last_token_no": None}
+
+    own_file = isinstance(errors, str)
+    err_file = open(errors, "w", newline="", encoding="utf-8") if own_file else errors
+    err_writer = None
+    try:
+        for chunk in _chunks(read_rows(source, filename), chunk_size):
+            valid, bad = [], []
+            for line, row in chunk:
+                try:
+                    valid.append((line, row, validate_row(row, party_keys)))
+                except RowError as e:
+                    bad.append((line, str(e), row))
+            price_rows([t for _, _, t in valid])
+            good = []
+            for line, row, t in valid:
+                if t["rate"] is None:
+                    bad.append((line, "no rate for this party / route", row))
+                else:
+                    good.append(t)
+
+            if good:
+                # one write per chunk, so clerks' bookings get in between
+                first = writer.call(write_chunk, good)
+                report["first_token_no"] = report["first_token_no"] or first
+                report["last_token_no"] = first + len(good) - 1
+            report["rows"] += len(chunk)
+            report["imported"] += len(good)
+            report["rejected"] += len(bad)
+
+            if bad and err_file is not None:
+                if err_writer is None:
+                    err_writer = csv.writer(err_file)
+                    err_writer.writerow(["line", "error", *columns])
+                for line, message, row in sorted(bad, key=lambda b: b[0]):
+                    err_writer.writerow([line, message, *(row.get(c, "") for c in columns)])
+            if progress:
+                progress(report["rows"])
+    finally:
+        if own_file:
+            err_file.close()
+
+    seconds = time.perf_counter() - t0
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_second"] = round(report["rows"] / seconds, 1) if seconds else 0.0
+    return report
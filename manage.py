@@ -0,0 +1,278 @@
+# manage.py
+# Command line maintenance tasks:  python manage.py <command> --help
+import argparse
+import json
+import sys
+from datetime import date
+
+import db
+
+
+def cmd_migrate(args):
+    applied = db.migrate()
+    for version, description in applied:
+        print(f"applied {version}: {description}")
+    with db.get_conn() as conn:
+        print(f"schema version {db.schema_version(conn)} (code expects {db.SCHEMA_VERSION})")
+    return 0
+
+
+def cmd_check_plans(args):
+    db.init_db()
+    problems = db.check_query_plans()
+    for name, detail in problems:
+        print(f"PLAN  {name}: {detail}")
+    if problems:
+        return 1
+    print(f"OK - {len(db.PAGE_QUERIES)} page queries use indexes")
+    return 0
+
+
+def cmd_check_balances(args):
+    db.init_db()
+    diffs = db.check_party_balances(fix=args.fix)
+    for party_id, stored, actual in diffs:
+        print(f"party {party_id}: stored {stored:.2f}  actual {actual:.2f}")
+    if not diffs:
+        print("OK - party_balance matches tokens and payments")
+        return 0
+    if args.fix:
+        print(f"rebuilt party_balance ({len(diffs)} parties corrected)")
+        return 0
+    return 1
+
+
+def cmd_rebuild_rollups(args):
+    db.init_db()
+    with db.get_conn() as conn:
+        cur = conn.cursor()
+        db.rebuild_party_balance(cur)
+        rows = db.rebuild_daily_booking_summary(cur)
+        indexed = db.rebuild_search_index(cur)
+    print(f"rebuilt party_balance and daily_booking_summary ({rows} day/party/route rows)")
+    print("rebuilt the search indexes (" + ", ".join(f"{n} {fts}" for fts, n in indexed.items()) + ")")
+    return 0
+
+
+def cmd_bill_run(args):
+    import billing
+
+    db.init_db()
+    report = billing.run_billing(args.from_date, args.to_date, gst_percent=args.gst,
+                                 out_dir=args.out, workers=args.workers)
+    return _print_bills(report)
+
+
+def cmd_bill_render(args):
+    import billing
+
+    db.init_db()
+    report = billing.render_saved_bills(args.bill_nos, out_dir=args.out, workers=args.workers)
+    missing = sorted(set(args.bill_nos) - {p["bill_no"] for p in report["parties"]})
+    if missing:
+        print(f"no such bills: {missing}")
+    return _print_bills(report) or (1 if missing else 0)
+
+
+def _print_bills(report):
+    for p in report["parties"]:
+        print(f"bill {p['bill_no']:>6}  {p['party_name'][:30]:<30} {p['tokens']:>6} tokens"
+              f"  {p['amount']:>12.2f}  "
+              + (f"{p['render_seconds']:.3f}s" if p["pdf"] else f"PDF FAILED: {p['error']}"))
+    summary = {k: v for k, v in report.items() if k != "parties"}
+    print(json.dumps(summary, indent=2))
+    if report["failed"]:
+        print("draw the failed PDFs again with: python manage.py bill-render "
+              + " ".join(map(str, report["failed"])))
+        return 1
+    return 0
+
+
+def cmd_import_tokens(args):
+    import importer
+
+    db.init_db()
+    report = importer.import_tokens(args.sheet, errors=args.errors, chunk_size=args.chunk)
+    print(json.dumps(report, indent=2))
+    if report["rejected"]:
+        print(f"{report['rejected']} rows rejected - see {args.errors}")
+    return 0 if report["imported"] or not report["rows"] else 1
+
+
+def cmd_print_bilties(args):
+    import time
+    import documents
+
+    db.init_db()
+    if args.challan is None and (args.from_no is None or args.to_no is None):
+        print("give --challan, or --from-no and --to-no")
+        return 2
+    t0 = time.perf_counter()
+    pages = documents.bilty_batch(args.out, documents.batch_tokens(
+        args.from_no, args.to_no, challan_no=args.challan))
+    seconds = time.perf_counter() - t0
+    if not pages:
+        print("no tokens found")
+        return 1
+    print(f"{pages} bilties -> {args.out} in {seconds:.2f}s ({pages / seconds:.0f} pages/s)")
+    return 0
+
+
+def cmd_prune_documents(args):
+    import documents
+
+    report = documents.prune(max_mb=args.max_mb, max_days=args.max_days)
+    print(f"removed {report['removed']} files ({report['freed_mb']} MB), "
+          f"{report['kept_mb']} MB left in {documents.DOC_DIR}/")
+    return 0
+
+
+def cmd_close_year(args):
+    import archive
+
+    try:
+        report = archive.close_year(args.fy, allow_unbilled=args.allow_unbilled,
+                                    dry_run=args.dry_run, vacuum=args.vacuum)
+    except archive.ArchiveError as e:
+        print(f"cannot close: {e}")
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def cmd_backup(args):
+    import backup
+
+    m = backup.backup(keep=args.keep, verify=args.verify, level=args.level)
+    sec = m["seconds"]
+    print(f"{m['file']}: {m['db_bytes'] / 2**20:.1f} MB -> {m['gz_bytes'] / 2**20:.1f} MB gz, "
+          f"copy {sec['copy']}s" + (f", verify {sec['verify']}s" if "verify" in sec else "")
+          + f", compress {sec['compress']}s, total {sec['total']}s")
+    for name in m["removed"]:
+        print(f"rotated out {name}")
+    return 0
+
+
+def cmd_backups(args):
+    import backup
+
+    for m in backup.backups():
+        tokens = m["tables"].get("tokens", {}).get("rows")
+        print(f"{m['file']:<36} {m['created']}  {m['gz_bytes'] / 2**20:>8.1f} MB  "
+              f"{tokens} tokens  schema {m['schema_version']}")
+    return 0
+
+
+def cmd_verify_backup(args):
+    import backup
+
+    try:
+        report = backup.verify(args.name)
+    except backup.BackupError as e:
+        print(f"cannot verify: {e}")
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0 if report["ok"] else 1
+
+
+def cmd_restore(args):
+    import backup
+
+    try:
+        report = backup.restore(args.name, target=args.target, force=args.force)
+    except backup.BackupError as e:
+        print(f"cannot restore: {e}")
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="manage.py")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="apply pending schema migrations")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("check-plans", help="fail if a page query scans a full table")
+    p.set_defaults(func=cmd_check_plans)
+
+    p = sub.add_parser("check-balances", help="diff party_balance against the raw tables")
+    p.add_argument("--fix", action="store_true", help="rebuild party_balance when it differs")
+    p.set_defaults(func=cmd_check_balances)
+
+    p = sub.add_parser("rebuild-rollups",
+                       help="recompute party_balance, daily_booking_summary and the search indexes")
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("bill-run", help="bill every party for a date range (month end)")
+    p.add_argument("--from", dest="from_date", type=date.fromisoformat, required=True,
+                   help="YYYY-MM-DD")
+    p.add_argument("--to", dest="to_date", type=date.fromisoformat, required=True,
+                   help="YYYY-MM-DD")
+    p.add_argument("--gst", type=float, default=0.0, help="GST percent")
+    p.add_argument("--workers", type=int, default=None, help="PDF worker processes")
+    p.add_argument("--out", default="bills", help="folder for the bill PDFs")
+    p.set_defaults(func=cmd_bill_run)
+
+    p = sub.add_parser("bill-render", help="draw the PDFs of saved bills again")
+    p.add_argument("bill_nos", type=int, nargs="+", metavar="BILL_NO")
+    p.add_argument("--workers", type=int, default=None, help="PDF worker processes")
+    p.add_argument("--out", default="bills", help="folder for the bill PDFs")
+    p.set_defaults(func=cmd_bill_render)
+
+    p = sub.add_parser("import-tokens", help="bulk import a CSV / XLSX booking sheet")
+    p.add_argument("sheet", help="path to the .csv or .xlsx file")
+    p.add_argument("--errors", default="import_errors.csv",
+                   help="CSV file for rejected rows (default: %(default)s)")
+    p.add_argument("--chunk", type=int, default=2000, help="rows per transaction")
+    p.set_defaults(func=cmd_import_tokens)
+
+    p = sub.add_parser("print-bilties", help="one merged PDF for a token range or a challan")
+    p.add_argument("--from-no", type=int, help="first token no")
+    p.add_argument("--to-no", type=int, help="last token no")
+    p.add_argument("--challan", type=int, help="challan no (instead of a token range)")
+    p.add_argument("--out", default="bilties.pdf", help="PDF file to write")
+    p.set_defaults(func=cmd_print_bilties)
+
+    p = sub.add_parser("prune-documents", help="trim the cached PDFs by age and total size")
+    p.add_argument("--max-mb", type=float, default=500, help="default: %(default)s")
+    p.add_argument("--max-days", type=float, default=30, help="default: %(default)s")
+    p.set_defaults(func=cmd_prune_documents)
+
+    p = sub.add_parser("close-year", help="move a closed financial year into its archive DB")
+    p.add_argument("fy", nargs="?", help="e.g. 2024-25 (default: the oldest open year)")
+    p.add_argument("--dry-run", action="store_true", help="only check and count the rows")
+    p.add_argument("--allow-unbilled", action="store_true",
+                   help="close even if some tokens of the year were never billed")
+    p.add_argument("--vacuum", action="store_true", help="VACUUM the live DB afterwards")
+    p.set_defaults(func=cmd_close_year)
+
+    p = sub.add_parser("backup", help="online backup of the live DB (gzip + rotation)")
+    p.add_argument("--keep", type=int, default=14, help="backups kept (default: %(default)s)")
+    p.add_argument("--verify", action="store_true", help="integrity_check the copy first")
+    p.add_argument("--level", type=int, default=1, help="gzip level (default: %(default)s)")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("backups", help="list the backups, newest first")
+    p.set_defaults(func=cmd_backups)
+
+    p = sub.add_parser("verify-backup", help="unpack a backup and check it against its manifest")
+    p.add_argument("name", help="backup file name (tms_YYYYmmdd_HHMMSS.db.gz) or path")
+    p.set_defaults(func=cmd_verify_backup)
+
+    p = sub.add_parser("restore", help="replace the DB with a verified backup (stop the app first)")
+    p.add_argument("name", help="backup file name or path")
+    p.add_argument("--target", help="restore into this file instead of --db")
+    p.add_argument("--force", action="store_true",
+                   help="replace an existing DB (kept as <db>.pre-restore-<stamp>)")
+    p.set_defaults(func=cmd_restore)
+
+    args = parser.parse_args(argv)
+    db.DB_PATH = args.db
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
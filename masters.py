@@ -0,0 +1,120 @@
+# masters.py
+# In-process cache of the master data (parties, items, rates) shared by
+# every page and every Streamlit session.  Each kind carries a version
+# stamp; the Party / Item & Rate pages call invalidate() after a write and
+# the next lookup reloads from SQLite.  Until then reruns are served from
+# memory.
+import threading
+from collections import namedtuple
+
+import db
+
+Party = namedtuple("Party", [
+    "id", "party_name", "address", "mobile", "gst_no", "marka",
+    "default_rate_per_kg", "default_rate_per_parcel",
+])
+
+Rate = namedtuple("Rate", ["id", "party_id", "party", "from_city", "to_city", "rate_type", "rate"])
+
+_lock = threading.Lock()
+_versions = {"party": 0, "item": 0, "rate": 0}
+_cache = {}                     # (name, db path) -> (version stamp, value)
+_stats = {"hits": 0, "loads": 0}
+
+
+class PartyIndex:
+    """Parties in name order plus O(1) lookups by id and by name."""
+
+    def __init__(self, parties):
+        self.parties = parties
+        self.by_id = {p.id: p for p in parties}
+        self.by_name = {p.party_name: p for p in parties}
+        self.names = [p.party_name for p in parties]
+
+    def __len__(self):
+        return len(self.parties)
+
+    def __bool__(self):
+        return bool(self.parties)
+
+    def id_of(self, name):
+        p = self.by_name.get(name)
+        return p.id if p else None
+
+
+def invalidate(*kinds):
+    """Call after writing party_master / item_master / rate_master."""
+    with _lock:
+        for kind in kinds or _versions:
+            _versions[kind] += 1
+
+
+def cached(name, kinds, loader):
+    """
+    loader() result, reused until one of the master `kinds` is invalidated.
+    Other modules use it for structures derived from master data.
+    """
+    key = (name, db.DB_PATH)
+    with _lock:
+        stamp = tuple(_versions[k] for k in kinds)
+        hit = _cache.get(key)
+        if hit and hit[0] == stamp:
+            _stats["hits"] += 1
+            return hit[1]
+    value = loader()
+    with _lock:
+        _cache[key] = (stamp, value)
+        _stats["loads"] += 1
+    return value
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats, versions=dict(_versions))
+
+
+# -------------------------
+#   LOADERS
+# -------------------------
+def _load_parties():
+    with db.get_conn() as conn:
+        rows = conn.execute(f"""
+            SELECT {", ".join(Party._fields)}
+            FROM party_master ORDER BY party_name
+        """).fetchall()
+    return PartyIndex([Party(*r) for r in rows])
+
+
+def _load_items():
+    with db.get_conn() as conn:
+        return conn.execute(
+            "SELECT item_name, description FROM item_master ORDER BY item_name"
+        ).fetchall()
+
+
+def _load_rates():
+    with db.get_conn() as conn:
+        rows = conn.execute("""
+            SELECT r.id, r.party_id, COALESCE(p.party_name, 'ALL') AS party,
+                   r.from_city, r.to_city, r.rate_type, r.rate
+            FROM rate_master r
+            LEFT JOIN party_master p ON p.id = r.party_id
+            ORDER BY party, r.from_city, r.to_city, r.id
+        """).fetchall()
+    return [Rate(*r) for r in rows]
+
+
+# -------------------------
+#   PUBLIC LOOKUPS
+# -------------------------
+def parties():
+    return cached("parties", ("party",), _load_parties)
+
+
+def items():
+    return cached("items", ("item",), _load_items)
+
+
+def rates():
+    # party names are joined in, so a party rename also refreshes this
+    return cached("rates", ("rate", "party"), _load_rates)
@@ -0,0 +1,379 @@
+# profiling.py
+# Where does a slow page spend its time: SQLite, pandas, PDF rendering or
+# Streamlit itself?
+#
+# Off by default (TMS_PROFILE=1 or the diagnostics page turns it on).  When
+# on, the pooled connections are ProfiledConnection objects whose cursors
+# record every statement (text, seconds including the fetches, rows), and
+# the timer() / timed() hooks in reporting.py, documents.py and exports.py
+# record pandas, PDF and export work.  Everything is filed under the
+# current rerun, which each page opens with begin_run(__file__).
+#
+# When off, get_conn() hands out plain sqlite3 connections and the hooks
+# return a shared null context: one flag test per call.
+#
+# The diagnostics page is app.py?diagnostics=1 (see diagnostics.py).
+import cProfile
+import io
+import os
+import pstats
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+RUN_HISTORY = 100               # reruns kept for the diagnostics page
+MAX_EVENTS_PER_RUN = 5000       # statements / timings kept per rerun
+KINDS = ("sql", "pandas", "pdf", "export")
+
+_enabled = os.environ.get("TMS_PROFILE", "") == "1"
+_lock = threading.Lock()
+_local = threading.local()
+_runs = deque(maxlen=RUN_HISTORY)
+_orphans = deque(maxlen=MAX_EVENTS_PER_RUN)    # events outside any rerun (CLI, workers)
+_capture = None                 # page whose next rerun is cProfile'd ("*" = any)
+_null = nullcontext()
+
+
+class Event:
+    __slots__ = ("kind", "label", "seconds", "rows")
+
+    def __init__(self, kind, label, seconds=0.0, rows=0):
+        self.kind, self.label, self.seconds, self.rows = kind, label, seconds, rows
+
+
+class Run:
+    """One execution of a page script and everything recorded during it."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.time()
+        self.t0 = time.perf_counter()
+        self.last = self.t0
+        self.events = []
+        self.dropped = 0
+        self.profile = None
+
+    def add(self, event, end):
+        if len(self.events) < MAX_EVENTS_PER_RUN:
+            self.events.append(event)
+        else:
+            self.dropped += 1
+        self.last = max(self.last, end)
+
+    def totals(self):
+        out = dict.fromkeys(KINDS, 0.0)
+        for e in self.events:
+            out[e.kind] = out.get(e.kind, 0.0) + e.seconds
+        return out
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(on):
+    """Switches profiling; idle pooled connections are reopened as the right class."""
+    global _enabled
+    if on == _enabled:
+        return
+    _enabled = on
+    import db
+    db.close_pool()
+
+
+def connection_class():
+    """sqlite3.connect(factory=...) for new pool connections."""
+    return ProfiledConnection if _enabled else sqlite3.Connection
+
+
+def clear():
+    with _lock:
+        _runs.clear()
+        _orphans.clear()
+
+
+# -------------------------
+#   RERUNS
+# -------------------------
+def page_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def begin_run(page):
+    """Called at the top of every page script; `page` is usually __file__."""
+    global _capture
+    previous = getattr(_local, "run", None)
+    if previous is not None and previous.profile is not None:
+        previous.profile.disable()
+    if not _enabled:
+        _local.run = None
+        return None
+    run = Run(page_name(page))
+    with _lock:
+        if _capture in (run.page, "*"):
+            _capture = None
+            run.profile = cProfile.Profile()
+        _runs.append(run)
+    _local.run = run
+    if run.profile is not None:
+        run.profile.enable()
+    return run
+
+
+def capture_next(page="*"):
+    """cProfile the next rerun of `page` (a page_name(), or "*" for any)."""
+    global _capture
+    with _lock:
+        _capture = page
+
+
+def capture_pending():
+    return _capture
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+@contextmanager
+def attached(run):
+    """Files events under `run` while this thread works on its behalf (writer.py)."""
+    previous = getattr(_local, "run", None)
+    _local.run = run
+    try:
+        yield run
+    finally:
+        _local.run = previous
+
+
+def _record(event, end):
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run.add(event, end)
+    else:
+        _orphans.append(event)
+
+
+# -------------------------
+#   TIMERS
+# -------------------------
+@contextmanager
+def _timer(kind, label):
+    event = Event(kind, label)
+    t0 = time.perf_counter()
+    try:
+        yield event
+    finally:
+        end = time.perf_counter()
+        event.seconds = end - t0
+        _record(event, end)
+
+
+def timer(kind, label=""):
+    """with timer("pdf", "bill"): ...  (a shared no-op when profiling is off)"""
+    return _timer(kind, label) if _enabled else _null
+
+
+def timed(kind, label=None):
+    """Decorator form of timer(); the label defaults to the function name."""
+    def wrap(fn):
+        name = label or fn.__name__
+
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _timer(kind, name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# -------------------------
+#   SQL
+# -------------------------
+class ProfiledCursor(sqlite3.Cursor):
+    """Times execute() and the fetches that follow it as one statement."""
+
+    _event = None
+
+    def _start(self, sql, t0):
+        end = time.perf_counter()
+        event = Event("sql", sql, end - t0)
+        if self.description is None:
+            event.rows = max(self.rowcount, 0)
+        self._event = event
+        _record(event, end)
+
+    def _fetched(self, t0, count):
+        end = time.perf_counter()
+        event = self._event
+        if event is not None:
+            event.seconds += end - t0
+            event.rows += count
+            run = getattr(_local, "run", None)
+            if run is not None:
+                run.last = max(run.last, end)
+
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._start(sql, t0)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._start(sql, t0)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(t0, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(t0, len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(t0, len(rows))
+        return rows
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        row = super().__next__()
+        self._fetched(t0, 1)
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors are ProfiledCursor while profiling is on."""
+
+    def cursor(self, factory=None):
+        if factory is None and _enabled:
+            factory = ProfiledCursor
+        return super().cursor() if factory is None else super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# -------------------------
+#   REPORTS
+# -------------------------
+def _statement(sql):
+    return " ".join(sql.split())
+
+
+def runs():
+    with _lock:
+        return list(_runs)
+
+
+def _all_events():
+    for run in runs():
+        for e in list(run.events):
+            yield run.page, e
+    for e in list(_orphans):
+        yield "", e
+
+
+def run_rows(limit=None):
+    """Most recent reruns first: page, start, elapsed and seconds per kind."""
+    out = []
+    for run in reversed(runs()):
+        totals = run.totals()
+        out.append({
+            "page": run.page,
+            "started": time.strftime("%H:%M:%S", time.localtime(run.started)),
+            "elapsed_ms": round((run.last - run.t0) * 1000, 1),
+            **{f"{k}_ms": round(totals.get(k, 0.0) * 1000, 1) for k in KINDS},
+            "queries": sum(1 for e in run.events if e.kind == "sql"),
+            "dropped": run.dropped,
+            "profiled": run.profile is not None,
+        })
+    return out[:limit]
+
+
+def page_rows():
+    """Per page: reruns seen, mean / max elapsed and mean seconds per kind."""
+    pages = {}
+    for r in run_rows():
+        pages.setdefault(r["page"], []).append(r)
+    out = []
+    for page, rows in sorted(pages.items()):
+        n = len(rows)
+        out.append({
+            "page": page,
+            "reruns": n,
+            "mean_ms": round(sum(r["elapsed_ms"] for r in rows) / n, 1),
+            "max_ms": max(r["elapsed_ms"] for r in rows),
+            **{f"mean_{k}_ms": round(sum(r[f"{k}_ms"] for r in rows) / n, 1) for k in KINDS},
+            "mean_queries": round(sum(r["queries"] for r in rows) / n, 1),
+        })
+    return out
+
+
+def slowest_queries(n=20):
+    """The n slowest single statements, slowest first."""
+    events = [(page, e) for page, e in _all_events() if e.kind == "sql"]
+    events.sort(key=lambda pe: pe[1].seconds, reverse=True)
+    return [{"ms": round(e.seconds * 1000, 2), "rows": e.rows, "page": page,
+             "statement": _statement(e.label)} for page, e in events[:n]]
+
+
+def statement_rows(n=20):
+    """Statements grouped by text, by total time: calls, total / mean / max, rows."""
+    groups = {}
+    for _, e in _all_events():
+        if e.kind != "sql":
+            continue
+        g = groups.setdefault(_statement(e.label), [0, 0.0, 0.0, 0])
+        g[0] += 1
+        g[1] += e.seconds
+        g[2] = max(g[2], e.seconds)
+        g[3] += e.rows
+    ranked = sorted(groups.items(), key=lambda kv: kv[1][1], reverse=True)[:n]
+    return [{"calls": c, "total_ms": round(t * 1000, 2), "mean_ms": round(t / c * 1000, 3),
+             "max_ms": round(m * 1000, 2), "rows": r, "statement": sql}
+            for sql, (c, t, m, r) in ranked]
+
+
+def timer_rows():
+    """pandas / PDF / export timers grouped by (kind, label)."""
+    groups = {}
+    for _, e in _all_events():
+        if e.kind == "sql":
+            continue
+        g = groups.setdefault((e.kind, e.label), [0, 0.0, 0.0])
+        g[0] += 1
+        g[1] += e.seconds
+        g[2] = max(g[2], e.seconds)
+    ranked = sorted(groups.items(), key=lambda kv: kv[1][1], reverse=True)
+    return [{"kind": k, "label": label, "calls": c, "total_ms": round(t * 1000, 2),
+             "max_ms": round(m * 1000, 2)} for (k, label), (c, t, m) in ranked]
+
+
+def profile_text(run, sort="cumulative", limit=40):
+    """pstats listing of a profiled rerun."""
+    out = io.StringIO()
+    pstats.Stats(run.profile, stream=out).sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def last_profiled():
+    return next((r for r in reversed(runs()) if r.profile is not None), None)
@@ -0,0 +1,83 @@
+# rates.py
+# Rate resolution for tokens.  The effective rate for
+# (party, from_city, to_city, rate_type) is, in order:
+#   1. the party's own rate for that route   (rate_master with party_id)
+#   2. the general rate for that route       (rate_master, party_id NULL)
+#   3. the party's default rate per KG / per parcel (party_master)
+# The lookup tables are built once from the master-data cache and rebuilt
+# only after a party or rate edit (masters.invalidate).
+import masters
+
+RATE_TYPES = ("KG", "PARCEL")
+
+# where a resolved rate came from
+PARTY_ROUTE, ROUTE, PARTY_DEFAULT = "PARTY_ROUTE", "ROUTE", "PARTY_DEFAULT"
+
+
+def _city(name):
+    return (name or "").strip().upper()
+
+
+class RateIndex:
+    def __init__(self, rates, parties):
+        self.party_route = {}       # (party_id, from, to, type) -> rate
+        self.route = {}             # (from, to, type) -> rate
+        self.party_default = {}     # (party_id, type) -> rate
+        self.cities = set()
+
+        # later rows (higher id) win when a route was saved more than once
+        for r in sorted(rates, key=lambda r: r.id):
+            key = (_city(r.from_city), _city(r.to_city), r.rate_type)
+            self.cities.update(key[:2])
+            if r.party_id is None:
+                self.route[key] = r.rate
+            else:
+                self.party_route[(r.party_id, *key)] = r.rate
+
+        for p in parties.parties:
+            if p.default_rate_per_kg:
+                self.party_default[(p.id, "KG")] = p.default_rate_per_kg
+            if p.default_rate_per_parcel:
+                self.party_default[(p.id, "PARCEL")] = p.default_rate_per_parcel
+
+    def resolve(self, party_id, from_city, to_city, rate_type="KG"):
+        """(rate, source) or (None, None) when nothing applies."""
+        key = (_city(from_city), _city(to_city), rate_type)
+        rate = self.party_route.get((party_id, *key))
+        if rate is not None:
+            return rate, PARTY_ROUTE
+        rate = self.route.get(key)
+        if rate is not None:
+            return rate, ROUTE
+        rate = self.party_default.get((party_id, rate_type))
+        if rate is not None:
+            return rate, PARTY_DEFAULT
+        return None, None
+
+    def rate_many(self, party_ids, from_cities, to_cities, rate_types):
+        """
+        Rates for whole columns at once (None where nothing applies).
+        Cities must already be upper-case and stripped.
+        """
+        party_route, route, party_default = self.party_route, self.route, self.party_default
+        out = []
+        append = out.append
+        for pid, f, t, rt in zip(party_ids, from_cities, to_cities, rate_types):
+            rate = party_route.get((pid, f, t, rt))
+            if rate is None:
+                rate = route.get((f, t, rt))
+                if rate is None:
+                    rate = party_default.get((pid, rt))
+            append(rate)
+        return out
+
+
+def rate_index():
+    return masters.cached("rate_index", ("rate", "party"),
+                          lambda: RateIndex(masters.rates(), masters.parties()))
+
+
+def amount_for(rate_type, rate, weight, packages):
+    """Freight: per KG on the weight, per PARCEL on the package count."""
+    qty = packages if rate_type == "PARCEL" else weight
+    return (qty or 0) * (rate or 0)
@@ -0,0 +1,54 @@
+# reporting.py
+# Column-wise preparation of bill / report rows for the screen, the PDF
+# builders (utils.pdf_utils) and the Excel exports.  Everything here works
+# on whole pandas columns - no iterrows().  Ledger rows and balances come
+# ready from SQL (db.ledger_page).
+import numpy as np
+import pandas as pd
+
+from profiling import timed
+
+BILL_COLUMNS = [
+    "token_no", "datetime", "from_city", "to_city",
+    "weight", "packages", "amount",
+]
+
+
+@timed("pandas")
+def format_dates(values, fmt="%d-%m-%Y"):
+    """
+    ISO 'YYYY-MM-DD[ HH:MM]' strings -> display strings (NaN stays NaN).
+    Each distinct day is formatted once and mapped back onto the column.
+    """
+    days = pd.Series(values).str[:10]
+    uniq = pd.Series(days.dropna().unique())
+    shown = pd.to_datetime(uniq, format="%Y-%m-%d", errors="coerce").dt.strftime(fmt)
+    return days.map(dict(zip(uniq, shown)))
+
+
+@timed("pandas")
+def records(df, columns=None):
+    """All rows as a list of dicts of plain Python values (for the PDF builders)."""
+    columns = list(df.columns) if columns is None else list(columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[c].tolist() for c in columns))]
+
+
+# -------------------------
+#   BILL
+# -------------------------
+@timed("pandas")
+def bill_frame(df):
+    """Bill table in BILL_COLUMNS order with blanks filled."""
+    out = df[BILL_COLUMNS].copy()
+    out[["weight", "amount"]] = out[["weight", "amount"]].fillna(0.0)
+    out["packages"] = out["packages"].fillna(0).astype(np.int64)
+    return out
+
+
+@timed("pandas")
+def bill_totals(df):
+    return {
+        "total_weight": float(df["weight"].to_numpy().sum()),
+        "total_pkgs": int(df["packages"].to_numpy().sum()),
+        "total_amount": float(df["amount"].to_numpy().sum()),
+    }
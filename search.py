@@ -0,0 +1,96 @@
+# search.py
+# Global search over parties, tokens and challans, served by the FTS5
+# indexes db.py keeps current with triggers (see SEARCH_SOURCES there).
+#
+#   search.search("rj14 ga", "token")         first page of matching tokens
+#   search.search("राम", "party", page=2)     third page of parties
+#
+# Every word typed must match the start of some word of the row (marka,
+# truck no., mobile, GST ...); words shorter than MIN_PREFIX must match
+# whole.  Of the newest RANK_WINDOW hits, the best by bm25
+# (db.SEARCH_WEIGHTS) come first, newest first among equals.  Archived
+# financial years are not searched.
+import time
+
+import db
+
+PAGE_SIZE = 20
+MIN_PREFIX = 2                  # one-letter words are not prefix-expanded
+RANK_WINDOW = 500               # newest hits ranked and paged; refine the words for older ones
+
+# kind -> (index, table, columns returned; `t` is the table row)
+KINDS = {
+    "party": ("party_fts", "party_master",
+              "t.id, t.party_name, t.marka, t.mobile, t.gst_no"),
+    "token": ("token_fts", "tokens",
+              "t.id, COALESCE(t.token_no, t.id) AS token_no, t.datetime, t.party_name, "
+              "t.marka, t.consignor, t.consignee, t.from_city, t.to_city, t.truck_no, "
+              "t.driver_mobile, t.status"),
+    "challan": ("challan_fts", "challan",
+                "t.id, t.challan_no, t.date, t.from_city, t.to_city, t.truck_no, "
+                "t.driver_name, t.driver_mobile"),
+}
+
+# Ranking every hit of a short prefix ("98" matches most tokens) costs a
+# bm25 call per hit, so only the newest RANK_WINDOW hits are ranked and
+# paged; walking the index newest first and stopping there is cheap.
+# Only the page's rows are read from the table.
+SEARCH_SQL = """
+    SELECT {columns}
+    FROM (
+        SELECT rowid, rank FROM (
+            SELECT rowid, rank FROM {fts}
+            WHERE {fts} MATCH :q
+            ORDER BY rowid DESC
+            LIMIT :window
+        )
+        ORDER BY rank, rowid DESC
+        LIMIT :limit OFFSET :offset
+    ) AS hit
+    JOIN {table} t ON t.id = hit.rowid
+    ORDER BY hit.rank, hit.rowid DESC
+"""
+
+
+def match_query(text):
+    """
+    What the user typed -> an FTS5 query: each word quoted (so no input is
+    a syntax error) and made a prefix, all words required.  '' when there
+    is nothing to search for.
+    """
+    terms = []
+    for word in (text or "").split():
+        if not any(ch.isalnum() for ch in word):
+            continue
+        quoted = '"' + word.replace('"', '""') + '"'
+        terms.append(quoted + "*" if len(word) >= MIN_PREFIX else quoted)
+    return " AND ".join(terms)
+
+
+def search(text, kind, page=0, page_size=PAGE_SIZE):
+    """
+    One page of `kind` ('party', 'token' or 'challan') matching `text`.
+    Returns a dict: rows (dicts of the KINDS columns), page, more (another
+    page exists) and ms.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"unknown search kind: {kind}")
+    t0 = time.perf_counter()
+    query = match_query(text)
+    rows = []
+    if query:
+        fts, table, columns = KINDS[kind]
+        with db.get_conn() as conn:
+            cur = conn.execute(SEARCH_SQL.format(columns=columns, fts=fts, table=table), {
+                "q": query, "window": RANK_WINDOW,
+                "limit": page_size + 1, "offset": page * page_size,
+            })
+            names = [d[0] for d in cur.description]
+            rows = [dict(zip(names, r)) for r in cur.fetchall()]
+    return {
+        "rows": rows[:page_size],
+        "page": page,
+        "more": len(rows) > page_size,
+        "ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
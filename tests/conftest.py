@@ -0,0 +1,21 @@
+# tests/conftest.py
+# The modules live at the repo root (Streamlit pages import them as plain
+# modules); each test gets its own scratch database.
+#   python -m pytest -q
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+    """An empty, migrated database at db.DB_PATH for the test."""
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tms.db"))
+    db.init_db()
+    yield db.DB_PATH
+    db.close_pool()
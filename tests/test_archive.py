@@ -0,0 +1,63 @@
+# tests/test_archive.py
+# Closing a financial year moves its rows to an archive file without
+# changing any balance (archive.close_year, db.attach_archives).
+from datetime import date
+
+import pytest
+
+import archive
+import db
+from benchmarks.generate import generate
+
+FY = "2024-25"
+# inside the closed year, across the close, and after it
+RANGES = [(date(2024, 11, 1), date(2025, 2, 28)),
+          (date(2025, 1, 1), date(2025, 6, 30)),
+          (date(2025, 5, 1), date(2025, 9, 30))]
+
+
+@pytest.fixture
+def year_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tms.db"))
+    generate(parties=8, per_day=15, years=1.0, routes=6, end=date(2025, 9, 30))
+    yield db.DB_PATH
+    db.close_pool()
+
+
+def _balances(parties):
+    return {(pid, start): db.ledger_summary(pid, start, end)
+            for pid in parties for start, end in RANGES}
+
+
+def test_close_year_keeps_balances_and_archives_the_rows(year_db):
+    with db.get_read_conn() as conn:
+        parties = [r[0] for r in conn.execute("SELECT id FROM party_master ORDER BY id")]
+        live = conn.execute("SELECT COUNT(*) FROM tokens WHERE datetime_iso < '2025-04-01'"
+                            ).fetchone()[0]
+    before = _balances(parties)
+
+    report = archive.close_year(FY)
+
+    assert report["rows"]["tokens"] == live > 0
+    after = _balances(parties)
+    for key, summary in before.items():
+        assert after[key]["opening"] == pytest.approx(summary["opening"]), key
+        assert after[key]["closing"] == pytest.approx(summary["closing"]), key
+        assert after[key]["entries"] == summary["entries"], key
+    assert db.check_party_balances() == []
+
+    with db.get_read_conn() as conn:
+        schema, = db.attach_archives(conn, [FY])
+        archived = conn.execute(f"SELECT COUNT(*) FROM {schema}.tokens").fetchone()[0]
+        left = conn.execute("SELECT COUNT(*) FROM tokens WHERE datetime_iso < '2025-04-01'"
+                            ).fetchone()[0]
+    assert (archived, left) == (live, 0)
+
+    with pytest.raises(archive.ArchiveError, match="already closed"):
+        archive.close_year(FY)
+
+
+def test_too_many_closed_years_at_once_are_refused(year_db):
+    years = [f"{y}-{(y + 1) % 100:02d}" for y in range(2010, 2011 + db.MAX_ATTACHED)]
+    with db.get_read_conn() as conn, pytest.raises(ValueError, match="narrow the dates"):
+        db.attach_archives(conn, years)
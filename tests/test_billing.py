@@ -0,0 +1,23 @@
+# tests/test_billing.py
+# A billed token must not be offered for billing again.
+import db
+from importer import INSERT_TOKEN_SQL
+
+
+def _token(conn, token_no, day):
+    return conn.execute(INSERT_TOKEN_SQL, (
+        token_no, "01/04/2025 10:00", f"{day} 10:00", 1, "PARTY 1", "M", "JAIPUR", "DELHI",
+        100.0, 5.0, "KG", 500.0, 1, "",
+    )).lastrowid
+
+
+def test_billed_pending_tokens_are_not_listed_again(scratch_db):
+    with db.get_conn() as conn:
+        conn.execute("INSERT INTO party_master (id, party_name) VALUES (1, 'PARTY 1')")
+        billed = _token(conn, 1, "2025-04-02")
+        _token(conn, 2, "2025-04-03")
+        conn.execute("UPDATE tokens SET bill_id = 7 WHERE id = ?", (billed,))
+        rows = conn.execute(db.BILL_TOKENS_SQL, (1, "2025-04-01", "2025-05-01")).fetchall()
+        status = conn.execute("SELECT status FROM tokens WHERE id = ?", (billed,)).fetchone()[0]
+    assert status == "PENDING"
+    assert [r[0] for r in rows] == [2]
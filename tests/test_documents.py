@@ -0,0 +1,37 @@
+# tests/test_documents.py
+# The on-disk PDF cache: stale versions age out in prune(), and a file
+# removed under a reader is rendered again.
+import os
+
+import pytest
+
+import documents
+
+TOKEN = {"token_no": 7, "datetime": "01/04/2025 10:00", "party_name": "PARTY 1", "marka": "M",
+         "from_city": "JAIPUR", "to_city": "DELHI", "weight": 100.0, "rate": 5.0,
+         "amount": 500.0, "packages": 1, "driver_mobile": ""}
+
+
+@pytest.fixture
+def doc_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(documents, "DOC_DIR", str(tmp_path))
+    yield str(tmp_path)
+    documents.shutdown()
+
+
+def test_a_changed_document_leaves_the_old_version_to_prune(doc_dir):
+    documents.render("token", 7, TOKEN)
+    old = documents.cache_path("token", 7, TOKEN, ())
+    changed = dict(TOKEN, weight=120.0)
+    assert documents.render("token", 7, changed).startswith(b"%PDF")
+
+    assert os.path.exists(old)          # a session may still be reading it
+    assert documents.prune()["removed"] == 1
+    assert not os.path.exists(old)
+    assert os.path.exists(documents.cache_path("token", 7, changed, ()))
+
+
+def test_a_pruned_file_is_rendered_again(doc_dir):
+    documents.render("token", 7, TOKEN)
+    os.remove(documents.cache_path("token", 7, TOKEN, ()))
+    assert documents.render("token", 7, TOKEN).startswith(b"%PDF")
@@ -0,0 +1,23 @@
+# tests/test_exports.py
+# exports.export_query() streams: its memory does not grow with the row
+# count (benchmarks/bench_exports.py).  Each export runs in a fresh child
+# process, so its peak RSS is its own.
+import pytest
+
+import db
+import exports
+from benchmarks.bench_exports import in_child, stream_case
+
+SMALL, LARGE = 100_000, 1_000_000
+FLAT_MB = 8.0                   # allowed RSS difference between the two sizes
+CEILING_MB = 64.0
+
+
+@pytest.mark.parametrize("fmt", exports.FORMATS)
+def test_export_memory_stays_flat_as_rows_grow(scratch_db, fmt):
+    db.close_pool()     # the children open their own connections
+    _, small, _ = in_child(stream_case, scratch_db, fmt, SMALL)
+    _, large, size = in_child(stream_case, scratch_db, fmt, LARGE)
+    assert size > 0
+    assert large - small <= FLAT_MB
+    assert large <= CEILING_MB
@@ -0,0 +1,19 @@
+# tests/test_query_plans.py
+# Every page query must stay on an index (db.PAGE_QUERIES).
+import db
+
+
+def test_page_queries_use_indexes(scratch_db):
+    assert db.check_query_plans() == []
+    db.assert_query_plans()
+
+
+def test_a_table_scan_is_reported(scratch_db):
+    # the check itself must notice a scan, or the test above proves nothing
+    problems = db.check_query_plans({"scan": ("SELECT id FROM tokens WHERE marka = ?", ("M",))})
+    assert [name for name, _ in problems] == ["scan"]
+
+
+def test_a_broken_query_is_reported(scratch_db):
+    problems = db.check_query_plans({"broken": ("SELECT nope FROM tokens", ())})
+    assert problems and problems[0][1].startswith("error:")
@@ -0,0 +1,41 @@
+# tests/test_reports.py
+# Reports on the read-only pool next to a booking clerk
+# (benchmarks/stress_reports.py).
+from datetime import date
+
+import pytest
+
+import db
+import writer
+from benchmarks import stress_reports
+from benchmarks.generate import generate
+
+
+@pytest.fixture
+def report_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tms.db"))
+    generate(parties=20, per_day=40, years=0.25, routes=10, end=date.today())
+    db.init_db()
+    yield db.DB_PATH
+    writer.shutdown()
+    db.close_pool()
+
+
+def test_report_connections_are_read_only(report_db):
+    assert stress_reports.read_only()
+
+
+def test_runaway_report_is_stopped(report_db):
+    stopped, seconds = stress_reports.runaway(0.05)
+    assert stopped
+    assert seconds < 2
+
+
+def test_reports_leave_the_clerk_alone(report_db):
+    with db.get_read_conn() as conn:
+        parties = [r[0] for r in conn.execute(
+            "SELECT party_id FROM party_balance ORDER BY token_total DESC LIMIT 10")]
+    r = stress_reports.measure(readers=2, parties=parties, timeout=0.05, idle_seconds=1)
+    assert r["rows"] > 0
+    # a wide margin: the test machine may be small and busy
+    assert stress_reports.check(r, slack_ms=100.0) == []
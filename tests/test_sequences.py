@@ -0,0 +1,23 @@
+# tests/test_sequences.py
+# db.allocate_numbers() under concurrent writers (benchmarks/stress_sequences.py).
+import pytest
+
+import db
+from benchmarks import stress_sequences
+
+
+@pytest.mark.parametrize("series", sorted(db.SEQUENCE_SOURCES))
+def test_numbers_have_no_duplicates_or_gaps(series):
+    r = stress_sequences.run(series, threads=8, per_thread=40)
+    assert stress_sequences.check(r) == []
+    assert len(r["numbers"]) == 8 * 40
+
+
+def test_check_reports_gaps_and_duplicates():
+    r = {"errors": [], "numbers": [1, 2, 2, 4], "expected": 4}
+    assert stress_sequences.check(r) == ["duplicate numbers handed out", "gaps in the sequence"]
+
+
+def test_run_leaves_the_database_path_alone(scratch_db):
+    stress_sequences.run("token", threads=2, per_thread=5)
+    assert db.DB_PATH == scratch_db
@@ -0,0 +1,17 @@
+# tests/test_writer.py
+# Clerks booking, loading and entering payments through writer.py at once
+# (benchmarks/stress_writer.py).
+import db
+from benchmarks import stress_writer
+
+
+def test_every_write_through_the_writer_is_stored():
+    r = stress_writer.run("writer", clerks=6, per_clerk=30, parties=5)
+    assert stress_writer.check(r) == []
+    assert r["stored"]["tokens"] == 6 * 30
+    assert r["stored"]["challans"] >= 6         # each clerk loads a truck after 25 tokens
+
+
+def test_run_leaves_the_database_path_alone(scratch_db):
+    stress_writer.run("writer", clerks=2, per_clerk=5, parties=2)
+    assert db.DB_PATH == scratch_db
@@ -0,0 +1,233 @@
+# writer.py
+# One writer thread for every insert / update the pages make.
+#
+# At peak several clerks book tokens, load challans and enter payments
+# against the same SQLite file.  Instead of each Streamlit session taking
+# the write lock itself, pages hand their write to this thread:
+#
+#   token_no = writer.call(save_token, values)          # waits for the result
+#   fut = writer.submit(db.create_challan, ids, header) # concurrent.futures.Future
+#
+# The thread collects what arrives within BATCH_WINDOW_MS (at most
+# MAX_BATCH writes) and runs it in one BEGIN IMMEDIATE transaction, each
+# write inside its own SAVEPOINT: a write that raises is rolled back alone
+# and its exception goes to its own caller.  Results are handed back only
+# after the COMMIT, so a caller never sees an id that is not on disk.
+#
+# Write functions are ordinary db helpers: they call get_conn() /
+# transaction() as usual and, on the writer thread, get the batch's
+# connection and a savepoint (get_conn is reentrant).  A write submitted
+# from inside another write runs inline.
+#
+# The queue is bounded.  When it is full, submit() waits SUBMIT_TIMEOUT
+# seconds and then raises WriterBusy rather than piling up work.
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import db
+import profiling
+
+QUEUE_LIMIT = 1000              # writes waiting before submit() blocks
+SUBMIT_TIMEOUT = 5.0            # seconds submit() waits for room
+BATCH_WINDOW_MS = 3             # how long the first write of a batch waits for company
+MAX_BATCH = 200
+LATENCY_HISTORY = 2000          # recent batches / writes kept for the percentiles
+
+_lock = threading.Lock()
+_queue = queue.Queue(maxsize=QUEUE_LIMIT)
+_thread = None
+_stop = object()                # queue sentinel for shutdown()
+_stats = {"submitted": 0, "written": 0, "failed": 0, "rejected": 0, "batches": 0,
+          "batch_failures": 0, "max_batch": 0, "max_depth": 0}
+_commit_ms = deque(maxlen=LATENCY_HISTORY)      # BEGIN .. COMMIT per batch
+_wait_ms = deque(maxlen=LATENCY_HISTORY)        # queued -> picked up per write
+
+
+class WriterBusy(RuntimeError):
+    """The write queue stayed full for SUBMIT_TIMEOUT seconds."""
+
+
+class _Write:
+    __slots__ = ("fn", "args", "kwargs", "future", "queued", "run")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+        self.future = Future()
+        self.queued = time.perf_counter()
+        self.run = profiling.current_run()
+
+
+def _on_writer_thread():
+    return threading.current_thread() is _thread
+
+
+def _ensure_started():
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_loop, name="tms-writer", daemon=True)
+            _thread.start()
+
+
+# -------------------------
+#   CALLER SIDE
+# -------------------------
+def submit(fn, *args, **kwargs):
+    """
+    Queues fn(*args, **kwargs) for the writer thread and returns a Future
+    that resolves to its return value once the batch has committed.
+    Raises WriterBusy if the queue stays full for SUBMIT_TIMEOUT seconds.
+    """
+    if _on_writer_thread():
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    _ensure_started()
+    write = _Write(fn, args, kwargs)
+    try:
+        _queue.put(write, timeout=SUBMIT_TIMEOUT)
+    except queue.Full:
+        with _lock:
+            _stats["rejected"] += 1
+        raise WriterBusy(f"{_queue.maxsize} writes already waiting - try again") from None
+    with _lock:
+        _stats["submitted"] += 1
+        _stats["max_depth"] = max(_stats["max_depth"], _queue.qsize())
+    return write.future
+
+
+def call(fn, *args, timeout=None, **kwargs):
+    """submit() and wait: returns fn's result or raises its exception."""
+    return submit(fn, *args, **kwargs).result(timeout)
+
+
+# -------------------------
+#   WRITER THREAD
+# -------------------------
+def _next_batch():
+    """Blocks for one write, then takes whatever else arrives within the window."""
+    first = _queue.get()
+    if first is _stop:
+        return None
+    batch = [first]
+    deadline = first.queued + BATCH_WINDOW_MS / 1000
+    while len(batch) < MAX_BATCH:
+        try:
+            remaining = deadline - time.perf_counter()
+            item = _queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _stop:
+            _queue.put(_stop)   # finish this batch first, stop on the next round
+            break
+        batch.append(item)
+    return batch
+
+
+def _run_batch(batch):
+    batch = [w for w in batch if w.future.set_running_or_notify_cancel()]
+    if not batch:
+        return
+    started = time.perf_counter()
+    results = []
+    try:
+        with db.get_conn() as conn, db.transaction(conn):
+            for write in batch:
+                _wait_ms.append((started - write.queued) * 1000)
+                try:
+                    with profiling.attached(write.run), db.transaction(conn):
+                        results.append((True, write.fn(*write.args, **write.kwargs)))
+                except Exception as e:
+                    results.append((False, e))
+    except Exception as e:
+        # BEGIN or COMMIT itself failed: nothing in the batch was written
+        with _lock:
+            _stats["batches"] += 1
+            _stats["batch_failures"] += 1
+            _stats["failed"] += len(batch)
+        for write in batch:
+            write.future.set_exception(e)
+        return
+    _commit_ms.append((time.perf_counter() - started) * 1000)
+
+    failed = sum(1 for ok, _ in results if not ok)
+    with _lock:
+        _stats["batches"] += 1
+        _stats["written"] += len(batch) - failed
+        _stats["failed"] += failed
+        _stats["max_batch"] = max(_stats["max_batch"], len(batch))
+    for write, (ok, value) in zip(batch, results):
+        if ok:
+            write.future.set_result(value)
+        else:
+            write.future.set_exception(value)
+
+
+def _loop():
+    while True:
+        batch = _next_batch()
+        if batch is None:
+            return
+        _run_batch(batch)
+
+
+def shutdown(timeout=30):
+    """Writes everything already queued, then stops the thread (it restarts on demand)."""
+    global _thread
+    with _lock:
+        thread = _thread
+    if thread is None or not thread.is_alive():
+        return
+    try:
+        _queue.put(_stop, timeout=timeout)
+    except queue.Full:
+        return
+    thread.join(timeout)
+    with _lock:
+        if _thread is thread and not thread.is_alive():
+            _thread = None
+
+
+atexit.register(shutdown)
+
+
+# -------------------------
+#   METRICS
+# -------------------------
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2)
+
+
+def stats():
+    """Counters for the diagnostics page: queue depth, batch sizes, commit / wait ms."""
+    with _lock:
+        out = dict(_stats)
+    commits, waits = list(_commit_ms), list(_wait_ms)
+    out["depth"] = _queue.qsize()
+    done = out["written"] + out["failed"]
+    out["mean_batch"] = round(done / out["batches"], 1) if out["batches"] else 0.0
+    out["commit_ms_p50"] = _percentile(commits, 0.50)
+    out["commit_ms_p95"] = _percentile(commits, 0.95)
+    out["commit_ms_max"] = round(max(commits), 2) if commits else 0.0
+    out["wait_ms_p50"] = _percentile(waits, 0.50)
+    out["wait_ms_p95"] = _percentile(waits, 0.95)
+    return out
+
+
+def reset_stats():
+    with _lock:
+        for k in _stats:
+            _stats[k] = 0
+    _commit_ms.clear()
+    _wait_ms.clear()